@@ -0,0 +1,12 @@
+-- Add the denormalized participant counter maintained by join/leave
+ALTER TABLE campaigns
+ADD COLUMN IF NOT EXISTS participant_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill the counter from existing memberships
+UPDATE campaigns
+SET participant_count = (
+    SELECT COUNT(*) FROM user_campaigns WHERE user_campaigns.campaign_id = campaigns.id
+);
+
+-- Query to check the new column
+SELECT id, title, participant_count, max_participants FROM campaigns LIMIT 10;
@@ -1,12 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
 from app.core.auth import get_current_user
 from app.core.config import settings
 from app.services.ai_service import AIService
 from app.repositories.campaign_repository import CampaignRepository
-from app.models.user import User as UserModel
+from app.schemas.user import UserPrincipal
 from app.schemas.ai import (
     CaptionGenerateRequest, CaptionGenerateResponse,
     RecommendationPushRequest, RecommendationPushResponse
@@ -17,8 +17,8 @@ router = APIRouter()
 @router.post("/generate-caption", response_model=CaptionGenerateResponse)
 async def generate_caption(
     request: CaptionGenerateRequest,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Generate caption for an image using AI
@@ -44,15 +44,15 @@ async def generate_caption(
 @router.post("/push-recommendation", response_model=RecommendationPushResponse)
 async def push_recommendation(
     request: RecommendationPushRequest,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Push campaign recommendations to users using AI
     """
     # Check if campaign exists and user is the creator
     campaign_repo = CampaignRepository(db)
-    campaign = campaign_repo.get_campaign_by_id(request.campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(request.campaign_id)
     
     if not campaign:
         raise HTTPException(
@@ -79,7 +79,7 @@ async def push_recommendation(
 
 @router.get("/token-info", response_model=dict)
 async def get_token_info(
-    current_user: UserModel = Depends(get_current_user)
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get info about AI service connection (dev only)
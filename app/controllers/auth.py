@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import RedirectResponse
 from urllib.parse import urlencode, quote_plus
 
@@ -8,7 +8,8 @@ from app.core.database import get_db
 from app.core.auth import get_current_user, get_dev_user
 from app.services.auth_service import AuthService
 from app.schemas.auth import GoogleAuthRequest, Token
-from app.schemas.user import User
+from app.repositories.user_repository import UserRepository
+from app.schemas.user import User, UserPrincipal
 from app.core.config import settings
 
 import base64
@@ -46,7 +47,7 @@ async def login_google(request: Request):
     return {"auth_url": auth_url}
 
 @router.get("/callback/google")
-async def google_callback(request: Request, code: str, db: Session = Depends(get_db)):
+async def google_callback(request: Request, code: str, db: AsyncSession = Depends(get_db)):
     """
     Handle Google OAuth callback and redirect to the app with token
     """
@@ -63,7 +64,7 @@ async def google_callback(request: Request, code: str, db: Session = Depends(get
             detail="無法驗證Google憑證",
         )
         
-    user, access_token, is_new_user = AuthService.authenticate_user(db, google_user)
+    user, access_token, is_new_user = await AuthService.authenticate_user(db, google_user)
     
     # Redirect to the mobile app using custom URL scheme
     app_redirect_url = f"{settings.APP_SCHEME}auth-callback?access_token={quote_plus(access_token)}&user_id={user.id}&is_new_user={str(is_new_user).lower()}"
@@ -71,7 +72,7 @@ async def google_callback(request: Request, code: str, db: Session = Depends(get
     return RedirectResponse(url=app_redirect_url)
 
 @router.post("/google-login", response_model=Token)
-async def google_login(auth_request: GoogleAuthRequest, db: Session = Depends(get_db)):
+async def google_login(auth_request: GoogleAuthRequest, db: AsyncSession = Depends(get_db)):
     """
     Exchange Google OAuth code for a JWT token (for web clients)
     """
@@ -83,18 +84,18 @@ async def google_login(auth_request: GoogleAuthRequest, db: Session = Depends(ge
             detail="無法驗證Google憑證",
         )
         
-    user, access_token, is_new_user = AuthService.authenticate_user(db, google_user)
+    user, access_token, is_new_user = await AuthService.authenticate_user(db, google_user)
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/dev-login", response_model=Token)
-async def dev_login(db: Session = Depends(get_db)):
+async def dev_login(db: AsyncSession = Depends(get_db)):
     """
     Development mode login - only works in development environment
     """
     from app.core.auth import create_access_token
     
-    dev_user = get_dev_user(db)
+    dev_user = await get_dev_user(db)
     
     # Create access token
     token_data = {"sub": str(dev_user.id)}
@@ -103,8 +104,17 @@ async def dev_login(db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=User)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
     """
     Get current authenticated user
     """
-    return current_user 
\ No newline at end of file
+    user = await UserRepository(db).get_user_by_id(current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="使用者不存在"
+        )
+    return user 
\ No newline at end of file
@@ -1,40 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_read_db
 from app.repositories.business_repository import BusinessRepository
-from app.models.user import User as UserModel
+from app.schemas.user import UserPrincipal
 from app.schemas.business import Business, BusinessCreate, BusinessUpdate
+from app.schemas.pagination import Page
 
 router = APIRouter()
 
-@router.get("/", response_model=List[Business])
+@router.get("/", response_model=Page[Business])
 async def get_businesses(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    limit: int = Query(100, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
-    Get all businesses
+    Get all businesses, newest first (pass next_cursor back as cursor for the next page)
     """
     business_repo = BusinessRepository(db)
-    businesses = business_repo.get_businesses(skip, limit)
-    return businesses
+    try:
+        businesses, next_cursor = await business_repo.get_businesses(limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無效的分頁游標"
+        )
+    return {"items": businesses, "next_cursor": next_cursor}
 
 @router.get("/{business_id}", response_model=Business)
 async def get_business(
     business_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get a business by ID
     """
     business_repo = BusinessRepository(db)
-    business = business_repo.get_business_by_id(business_id)
+    business = await business_repo.get_business_by_id(business_id)
     
     if not business:
         raise HTTPException(
@@ -47,8 +55,8 @@ async def get_business(
 @router.post("/", response_model=Business)
 async def create_business(
     business_data: BusinessCreate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Create a new business (admin only in production)
@@ -63,15 +71,15 @@ async def create_business(
         )
         
     business_repo = BusinessRepository(db)
-    business = business_repo.create_business(business_data)
+    business = await business_repo.create_business(business_data)
     return business
 
 @router.put("/{business_id}", response_model=Business)
 async def update_business(
     business_id: int,
     business_data: BusinessUpdate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Update a business (admin only in production)
@@ -88,7 +96,7 @@ async def update_business(
     business_repo = BusinessRepository(db)
     
     # Check if business exists
-    business = business_repo.get_business_by_id(business_id)
+    business = await business_repo.get_business_by_id(business_id)
     if not business:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -96,14 +104,14 @@ async def update_business(
         )
         
     # Update business
-    updated_business = business_repo.update_business(business_id, business_data)
+    updated_business = await business_repo.update_business(business_id, business_data)
     return updated_business
 
 @router.delete("/{business_id}", response_model=dict)
 async def delete_business(
     business_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Delete a business (admin only in production)
@@ -120,7 +128,7 @@ async def delete_business(
     business_repo = BusinessRepository(db)
     
     # Check if business exists
-    business = business_repo.get_business_by_id(business_id)
+    business = await business_repo.get_business_by_id(business_id)
     if not business:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -128,7 +136,7 @@ async def delete_business(
         )
         
     # Delete business
-    success = business_repo.delete_business(business_id)
+    success = await business_repo.delete_business(business_id)
     
     if not success:
         raise HTTPException(
@@ -144,14 +152,14 @@ async def get_nearby_businesses(
     longitude: float,
     radius: float = 5.0,
     limit: int = 10,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get businesses near a location
     """
     business_repo = BusinessRepository(db)
-    businesses = business_repo.get_nearby_businesses(
+    businesses = await business_repo.get_nearby_businesses(
         latitude,
         longitude,
         radius,
@@ -1,22 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status, File, UploadFile, Form
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict
 from datetime import datetime
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_read_db
 from app.repositories.campaign_repository import CampaignRepository
 from app.repositories.user_repository import UserRepository
 from app.repositories.chat_repository import ChatRepository
 from app.repositories.review_repository import ReviewRepository
 from app.services.notification_service import NotificationService
 from app.models.user import User as UserModel
+from app.schemas.user import UserPrincipal
 from app.models.campaign import Campaign as CampaignModel, CampaignCategory as CampaignCategoryModel
 from app.schemas.campaign import (
     Campaign, CampaignCreate, CampaignUpdate, 
     CampaignNearbySearch, CampaignJoin, CampaignCategory
 )
 from app.schemas.review import Review, ReviewCreate
+from app.schemas.pagination import Page
 from app.schemas.chat import ChatGroupCreate
 
 router = APIRouter()
@@ -24,8 +27,8 @@ router = APIRouter()
 @router.post("/", response_model=Campaign)
 async def create_campaign(
     campaign_data: CampaignCreate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Create a new campaign
@@ -34,10 +37,10 @@ async def create_campaign(
     chat_repo = ChatRepository(db)
     
     # Create campaign
-    campaign = campaign_repo.create_campaign(current_user.id, campaign_data)
+    campaign = await campaign_repo.create_campaign(current_user.id, campaign_data)
     
     # Create chat group for the campaign
-    chat_group = chat_repo.create_chat_group(
+    chat_group = await chat_repo.create_chat_group(
         ChatGroupCreate(
             name=campaign.title,
             is_direct=False,
@@ -47,7 +50,7 @@ async def create_campaign(
     )
     
     # Update campaign with chat group
-    campaign_repo.update_campaign(
+    await campaign_repo.update_campaign(
         campaign.id, 
         CampaignUpdate(chat_group_id=chat_group.id)
     )
@@ -56,78 +59,66 @@ async def create_campaign(
     notification_service = NotificationService(db)
     await notification_service.notify_campaign_created(campaign.id)
     
-    # Include participant count in response
-    setattr(campaign, "participant_count", 1)  # Creator is first participant
-    
     return campaign
 
-@router.get("/", response_model=List[Campaign])
+@router.get("/", response_model=Page[Campaign])
 async def get_campaigns(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    limit: int = Query(100, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
-    Get all campaigns
+    Get all campaigns, newest first (pass next_cursor back as cursor for the next page)
     """
     campaign_repo = CampaignRepository(db)
-    campaigns = db.query(CampaignModel).offset(skip).limit(limit).all()
-    
-    # Add participant count to each campaign
-    for campaign in campaigns:
-        participants = campaign_repo.get_campaign_participants(campaign.id)
-        setattr(campaign, "participant_count", len(participants))
+    try:
+        campaigns, next_cursor = await campaign_repo.get_campaigns(limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無效的分頁游標"
+        )
     
-    return campaigns
+    return {"items": campaigns, "next_cursor": next_cursor}
 
 @router.get("/mine", response_model=List[Campaign])
 async def get_my_campaigns(
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get campaigns created by the current user
     """
     campaign_repo = CampaignRepository(db)
-    campaigns = campaign_repo.get_campaigns_by_creator(current_user.id)
-    
-    # Add participant count to each campaign
-    for campaign in campaigns:
-        participants = campaign_repo.get_campaign_participants(campaign.id)
-        setattr(campaign, "participant_count", len(participants))
+    campaigns = await campaign_repo.get_campaigns_by_creator(current_user.id)
     
     return campaigns
 
 @router.get("/joined", response_model=List[Campaign])
 async def get_joined_campaigns(
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get campaigns joined by the current user
     """
     campaign_repo = CampaignRepository(db)
-    campaigns = campaign_repo.get_user_joined_campaigns(current_user.id)
-    
-    # Add participant count to each campaign
-    for campaign in campaigns:
-        participants = campaign_repo.get_campaign_participants(campaign.id)
-        setattr(campaign, "participant_count", len(participants))
+    campaigns = await campaign_repo.get_user_joined_campaigns(current_user.id)
     
     return campaigns
 
 @router.post("/nearby", response_model=List[Campaign])
 async def get_nearby_campaigns(
     search: CampaignNearbySearch,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get campaigns near a location
     """
     campaign_repo = CampaignRepository(db)
-    campaigns = campaign_repo.get_nearby_campaigns(
+    campaigns = await campaign_repo.get_nearby_campaigns(
         search.latitude,
         search.longitude,
         search.radius,
@@ -135,24 +126,19 @@ async def get_nearby_campaigns(
         search.category
     )
     
-    # Add participant count to each campaign
-    for campaign in campaigns:
-        participants = campaign_repo.get_campaign_participants(campaign.id)
-        setattr(campaign, "participant_count", len(participants))
-    
     return campaigns
 
 @router.get("/{campaign_id}", response_model=Campaign)
 async def get_campaign(
     campaign_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get a campaign by ID
     """
     campaign_repo = CampaignRepository(db)
-    campaign = campaign_repo.get_campaign_by_id(campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(campaign_id)
     
     if not campaign:
         raise HTTPException(
@@ -160,24 +146,20 @@ async def get_campaign(
             detail="找不到此揪團"
         )
     
-    # Add participant count
-    participants = campaign_repo.get_campaign_participants(campaign.id)
-    setattr(campaign, "participant_count", len(participants))
-    
     return campaign
 
 @router.put("/{campaign_id}", response_model=Campaign)
 async def update_campaign(
     campaign_id: int,
     campaign_data: CampaignUpdate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Update a campaign
     """
     campaign_repo = CampaignRepository(db)
-    campaign = campaign_repo.get_campaign_by_id(campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(campaign_id)
     
     if not campaign:
         raise HTTPException(
@@ -193,7 +175,7 @@ async def update_campaign(
         )
     
     # Update campaign
-    updated_campaign = campaign_repo.update_campaign(campaign_id, campaign_data)
+    updated_campaign = await campaign_repo.update_campaign(campaign_id, campaign_data)
     
     # Notify participants of update
     notification_service = NotificationService(db)
@@ -203,23 +185,19 @@ async def update_campaign(
         f"揪團「{campaign.title}」已更新"
     )
     
-    # Add participant count
-    participants = campaign_repo.get_campaign_participants(updated_campaign.id)
-    setattr(updated_campaign, "participant_count", len(participants))
-    
     return updated_campaign
 
 @router.delete("/{campaign_id}", response_model=dict)
 async def delete_campaign(
     campaign_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Delete a campaign
     """
     campaign_repo = CampaignRepository(db)
-    campaign = campaign_repo.get_campaign_by_id(campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(campaign_id)
     
     if not campaign:
         raise HTTPException(
@@ -243,7 +221,7 @@ async def delete_campaign(
     )
     
     # Delete campaign
-    success = campaign_repo.delete_campaign(campaign_id)
+    success = await campaign_repo.delete_campaign(campaign_id)
     
     if not success:
         raise HTTPException(
@@ -256,8 +234,8 @@ async def delete_campaign(
 @router.post("/join", response_model=dict)
 async def join_campaign(
     join_data: CampaignJoin,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Join a campaign
@@ -266,7 +244,7 @@ async def join_campaign(
     chat_repo = ChatRepository(db)
     
     # Join campaign
-    user_campaign = campaign_repo.join_campaign(current_user.id, join_data.campaign_id)
+    user_campaign = await campaign_repo.join_campaign(current_user.id, join_data.campaign_id)
     
     if not user_campaign:
         raise HTTPException(
@@ -275,11 +253,11 @@ async def join_campaign(
         )
     
     # Get campaign
-    campaign = campaign_repo.get_campaign_by_id(join_data.campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(join_data.campaign_id)
     
     # Add user to chat group
     if campaign.chat_group_id:
-        chat_repo.add_chat_member(campaign.chat_group_id, current_user.id)
+        await chat_repo.add_chat_member(campaign.chat_group_id, current_user.id)
     
     # Notify other participants
     notification_service = NotificationService(db)
@@ -290,8 +268,8 @@ async def join_campaign(
 @router.post("/{campaign_id}/leave", response_model=dict)
 async def leave_campaign(
     campaign_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Leave a campaign
@@ -300,7 +278,7 @@ async def leave_campaign(
     chat_repo = ChatRepository(db)
     
     # Get campaign to check if user is creator
-    campaign = campaign_repo.get_campaign_by_id(campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(campaign_id)
     
     if not campaign:
         raise HTTPException(
@@ -316,7 +294,7 @@ async def leave_campaign(
         )
     
     # Leave campaign
-    success = campaign_repo.leave_campaign(current_user.id, campaign_id)
+    success = await campaign_repo.leave_campaign(current_user.id, campaign_id)
     
     if not success:
         raise HTTPException(
@@ -326,15 +304,15 @@ async def leave_campaign(
     
     # Remove user from chat group
     if campaign.chat_group_id:
-        chat_repo.remove_chat_member(campaign.chat_group_id, current_user.id)
+        await chat_repo.remove_chat_member(campaign.chat_group_id, current_user.id)
     
     return {"status": "success", "message": "成功離開揪團"}
 
 @router.get("/{campaign_id}/participants", response_model=List[dict])
 async def get_campaign_participants(
     campaign_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get participants of a campaign
@@ -342,7 +320,7 @@ async def get_campaign_participants(
     campaign_repo = CampaignRepository(db)
     
     # Check if campaign exists
-    campaign = campaign_repo.get_campaign_by_id(campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(campaign_id)
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -350,7 +328,7 @@ async def get_campaign_participants(
         )
     
     # Get participants
-    participants_with_join_info = campaign_repo.get_campaign_participants(campaign_id)
+    participants_with_join_info = await campaign_repo.get_campaign_participants(campaign_id)
     
     # Format response
     result = []
@@ -370,8 +348,8 @@ async def get_campaign_participants(
 async def create_review(
     campaign_id: int,
     review_data: ReviewCreate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Create a review for another participant
@@ -381,7 +359,7 @@ async def create_review(
     user_repo = UserRepository(db)
     
     # Check if campaign exists
-    campaign = campaign_repo.get_campaign_by_id(campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(campaign_id)
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -389,7 +367,7 @@ async def create_review(
         )
     
     # Check if reviewer participated in the campaign
-    participants = [p[0].id for p in campaign_repo.get_campaign_participants(campaign_id)]
+    participants = [p[0].id for p in await campaign_repo.get_campaign_participants(campaign_id)]
     if current_user.id not in participants:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -411,11 +389,11 @@ async def create_review(
         )
     
     # Create review
-    review = review_repo.create_review(current_user.id, review_data)
+    review = await review_repo.create_review(current_user.id, review_data)
     
     # Add names for response
-    reviewer = user_repo.get_user_by_id(current_user.id)
-    reviewed = user_repo.get_user_by_id(review_data.reviewed_id)
+    reviewer = await user_repo.get_user_by_id(current_user.id)
+    reviewed = await user_repo.get_user_by_id(review_data.reviewed_id)
     
     review.reviewer_name = reviewer.name
     review.reviewed_name = reviewed.name
@@ -425,8 +403,8 @@ async def create_review(
 @router.get("/{campaign_id}/reviews", response_model=List[Review])
 async def get_campaign_reviews(
     campaign_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get all reviews for a campaign
@@ -435,7 +413,7 @@ async def get_campaign_reviews(
     review_repo = ReviewRepository(db)
     
     # Check if campaign exists
-    campaign = campaign_repo.get_campaign_by_id(campaign_id)
+    campaign = await campaign_repo.get_campaign_by_id(campaign_id)
     if not campaign:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -443,12 +421,12 @@ async def get_campaign_reviews(
         )
     
     # Get reviews
-    reviews = review_repo.get_reviews_by_campaign(campaign_id)
+    reviews = await review_repo.get_reviews_by_campaign(campaign_id)
     
     # Add names
     for review in reviews:
-        reviewer = db.query(UserModel).filter(UserModel.id == review.reviewer_id).first()
-        reviewed = db.query(UserModel).filter(UserModel.id == review.reviewed_id).first()
+        reviewer = await db.get(UserModel, review.reviewer_id)
+        reviewed = await db.get(UserModel, review.reviewed_id)
         
         if reviewer:
             review.reviewer_name = reviewer.name
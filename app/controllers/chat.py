@@ -1,33 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List, Optional
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_read_db
+from app.services.chat_connection import decode_frame
 from app.services.chat_service import connection_manager, ChatService
+from app.services.read_cursor_writer import read_cursor_writer
 from app.repositories.chat_repository import ChatRepository
-from app.models.user import User as UserModel
-from app.schemas.chat import ChatGroup, ChatGroupCreate, Message, ChatGroupWithMembers
+from app.schemas.user import UserPrincipal
+from app.schemas.chat import ChatGroup, ChatGroupCreate, Message, ChatGroupWithMembers, InboxEntry, MarkRead, UnreadCount, UserPresence
+from app.schemas.pagination import Page
 
 router = APIRouter()
 
 @router.get("/groups", response_model=List[ChatGroup])
 async def get_chat_groups(
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get all chat groups for the current user
     """
     chat_repo = ChatRepository(db)
-    chat_groups = chat_repo.get_chat_groups_for_user(current_user.id)
+    chat_groups = await chat_repo.get_chat_groups_for_user(current_user.id)
     return chat_groups
 
+@router.get("/inbox", response_model=Page[InboxEntry])
+async def get_chat_inbox(
+    limit: int = Query(20, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """
+    Get the current user's chat groups, most recently active first, with last message and unread count
+    """
+    # Unread counts depend on read cursors still waiting to be written
+    await read_cursor_writer.flush()
+    
+    chat_repo = ChatRepository(db)
+    try:
+        entries, next_cursor = await chat_repo.get_inbox(current_user.id, limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無效的分頁游標"
+        )
+    
+    return {"items": entries, "next_cursor": next_cursor}
+
 @router.get("/groups/{chat_group_id}", response_model=ChatGroupWithMembers)
 async def get_chat_group(
     chat_group_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get a chat group by ID
@@ -35,7 +63,7 @@ async def get_chat_group(
     chat_repo = ChatRepository(db)
     
     # Check if chat group exists
-    chat_group = chat_repo.get_chat_group_by_id(chat_group_id)
+    chat_group = await chat_repo.get_chat_group_by_id(chat_group_id)
     if not chat_group:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -43,14 +71,14 @@ async def get_chat_group(
         )
     
     # Check if user is a member
-    if not chat_repo.is_chat_member(chat_group_id, current_user.id):
+    if not await chat_repo.is_chat_member(chat_group_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="您不是此聊天室的成員"
         )
     
     # Get members
-    members = chat_repo.get_chat_group_members(chat_group_id)
+    members = await chat_repo.get_chat_group_members(chat_group_id)
     member_ids = [member.user_id for member in members]
     
     # Create response
@@ -69,8 +97,8 @@ async def get_chat_group(
 @router.post("/groups", response_model=ChatGroup)
 async def create_chat_group(
     group_data: ChatGroupCreate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Create a new chat group
@@ -82,14 +110,14 @@ async def create_chat_group(
         group_data.member_ids.insert(0, current_user.id)
     
     # Create group
-    chat_group = chat_repo.create_chat_group(group_data)
+    chat_group = await chat_repo.create_chat_group(group_data)
     return chat_group
 
 @router.post("/direct/{user_id}", response_model=ChatGroup)
 async def create_direct_chat(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Create or get direct chat with another user
@@ -103,44 +131,33 @@ async def create_direct_chat(
     chat_repo = ChatRepository(db)
     
     # Check if other user exists
-    other_user = chat_repo.get_user(user_id)
+    other_user = await chat_repo.get_user(user_id)
     if not other_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="使用者不存在"
         )
     
-    # Check if direct chat already exists
-    existing_chat = chat_repo.get_direct_chat_between_users(current_user.id, user_id)
-    if existing_chat:
-        return existing_chat
-    
-    # Create new direct chat
+    # Get the existing direct chat, or create it (once, even for concurrent requests)
     group_name = f"{current_user.name} & {other_user.name}"
-    group_data = ChatGroupCreate(
-        name=group_name,
-        is_direct=True,
-        member_ids=[current_user.id, user_id]
-    )
-    
-    chat_group = chat_repo.create_chat_group(group_data)
+    chat_group = await chat_repo.get_or_create_direct_chat(current_user.id, user_id, group_name)
     return chat_group
 
-@router.get("/groups/{chat_group_id}/messages", response_model=List[Message])
+@router.get("/groups/{chat_group_id}/messages", response_model=Page[Message])
 async def get_chat_messages(
     chat_group_id: int,
-    limit: int = 50,
-    before_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    limit: int = Query(50, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
-    Get messages from a chat group
+    Get messages from a chat group, newest first (pass next_cursor back as cursor for older messages)
     """
     chat_repo = ChatRepository(db)
     
     # Check if chat group exists
-    chat_group = chat_repo.get_chat_group_by_id(chat_group_id)
+    chat_group = await chat_repo.get_chat_group_by_id(chat_group_id)
     if not chat_group:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -148,37 +165,218 @@ async def get_chat_messages(
         )
     
     # Check if user is a member
-    if not chat_repo.is_chat_member(chat_group_id, current_user.id):
+    if not await chat_repo.is_chat_member(chat_group_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="您不是此聊天室的成員"
         )
     
-    # Get messages
-    messages = chat_repo.get_chat_messages(chat_group_id, limit, before_id)
+    # Get messages with sender info, newest first; next_cursor pages back through older history
+    try:
+        messages, next_cursor = await chat_repo.get_chat_messages(chat_group_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無效的分頁游標"
+        )
+    
+    return {"items": messages, "next_cursor": next_cursor}
+
+@router.post("/groups/{chat_group_id}/read", response_model=dict)
+async def mark_chat_read(
+    chat_group_id: int,
+    read_data: MarkRead,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """
+    Mark a chat group as read up to a message (also available as a "read" frame on /chat/ws)
+    """
+    chat_repo = ChatRepository(db)
+    
+    # Check if user is a member
+    if not await chat_repo.is_chat_member(chat_group_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="您不是此聊天室的成員"
+        )
+    
+    # Check if the message belongs to the chat group
+    if not await chat_repo.message_in_group(chat_group_id, read_data.message_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="找不到此訊息"
+        )
+    
+    # Coalesced with the user's other marks and written in the background
+    read_cursor_writer.mark(chat_group_id, current_user.id, read_data.message_id)
+    
+    return {"status": "success", "message": "已更新已讀位置"}
+
+@router.get("/unread", response_model=List[UnreadCount])
+async def get_unread_counts(
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """
+    Get the unread message count of every chat group of the current user
+    """
+    # Read cursors are written in the background; write pending ones first,
+    # and count on the primary so they are visible
+    await read_cursor_writer.flush()
+    
+    chat_repo = ChatRepository(db)
+    return await chat_repo.get_unread_counts(current_user.id)
+
+@router.get("/presence", response_model=List[UserPresence])
+async def get_presence(
+    user_ids: List[int] = Query(...),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """
+    Get whether users are online, or when they were last seen
     
-    # Add sender info
-    for message in messages:
-        sender = chat_repo.get_user(message.user_id)
-        if sender:
-            message.sender_name = sender.name
-            message.sender_profile_picture = sender.profile_picture
+    Presence is tracked per server process: with several workers, only
+    websockets connected to the worker answering this request are seen, so a
+    user connected to another worker shows as offline (with no last_seen).
+    Only users sharing a chat group with the current user are answered; others
+    are left out.
+    """
+    contacts = await ChatRepository(db).get_contacts_among(current_user.id, user_ids)
+    presence = connection_manager.presence
+    return [
+        {
+            "user_id": user_id,
+            "online": presence.is_online(user_id),
+            "last_seen": presence.get_last_seen(user_id)
+        }
+        for user_id in dict.fromkeys(user_ids) if user_id in contacts
+    ]
+
+async def authenticate_websocket_user(token: str) -> Optional[int]:
+    """Return the ID of the existing user a websocket token belongs to, or None"""
+    from jose import jwt, JWTError
+    from app.core.config import settings
+    from app.core.database import AsyncSessionLocal
     
-    return messages
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        user_id = int(payload.get("sub"))
+    except (JWTError, TypeError, ValueError):
+        return None
+        
+    async with AsyncSessionLocal() as db:
+        user = await ChatRepository(db).get_user(user_id)
+        
+    return user.id if user else None
+
+async def receive_frame(websocket: WebSocket) -> Any:
+    """Next frame from a client (JSON text, or binary with the MessagePack subprotocol), None if malformed"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+        
+    data = message.get("bytes")
+    if data is None:
+        data = message.get("text", "")
+    try:
+        return decode_frame(data)
+    except ValueError:
+        return None
+
+@router.websocket("/ws")
+async def multiplexed_websocket_endpoint(
+    websocket: WebSocket,
+    token: str
+):
+    """
+    WebSocket endpoint for real-time chat across all of the user's chat groups
+    
+    After connecting, send {"type": "subscribe", "chat_group_id": ...} for each
+    chat group to follow ({"type": "unsubscribe", ...} to stop), and
+    {"type": "message", "chat_group_id": ..., "content": ...} to post and
+    {"type": "read", "chat_group_id": ..., "message_id": ...} to mark messages
+    as read. Every frame from the server carries the chat_group_id it belongs to.
+    
+    Messages carry a seq that counts up by one within each chat group. They
+    are broadcast in seq order by the worker that saved them, but messages
+    saved by different workers can arrive out of order, so clients should
+    order a group's messages by seq. When reconnecting, add "resume_from": <last seq received> to the subscribe
+    frame: the missed messages are sent first, followed by {"type": "resumed"}
+    ("truncated": true if too many were missed to replay).
+    
+    Send {"type": "ping"} (answered with {"type": "pong"}) whenever the socket
+    has been quiet for a while: sockets that send nothing for
+    PRESENCE_TIMEOUT_SECONDS are closed. Users coming online or going offline
+    in a chat group are announced in batched {"type": "presence", "users": [...]}
+    frames.
+    
+    Frames are JSON text unless the client offers the "juka.msgpack.v1" subprotocol: then
+    they are MessagePack binary frames, and chat messages leave out
+    sender_name / sender_profile_picture. Those come in a {"type": "sender",
+    "user_id", "name", "profile_picture"} frame before the first message of
+    each sender (and again if the profile changes).
+    """
+    from app.core.database import AsyncSessionLocal
+    
+    user_id = await authenticate_websocket_user(token)
+    if user_id is None:
+        await websocket.close(code=1008, reason="Invalid token")
+        return
+        
+    await connection_manager.connect(websocket, user_id)
+    
+    try:
+        while True:
+            frame = await receive_frame(websocket)
+            connection_manager.touch(websocket)
+            if not isinstance(frame, dict):
+                await connection_manager.send_personal_message(
+                    {"type": "error", "message": "訊息格式錯誤"},
+                    websocket
+                )
+                continue
+                
+            # A short-lived session per frame, so idle sockets hold no DB connection
+            try:
+                async with AsyncSessionLocal() as db:
+                    await ChatService(db).handle_frame(websocket, user_id, frame)
+            except Exception as e:
+                # One bad frame must not drop the socket's other subscriptions
+                print(f"Chat frame error (user {user_id}, {frame.get('type')!r}): {e}")
+                await connection_manager.send_personal_message(
+                    {"type": "error", "chat_group_id": frame.get("chat_group_id"), "message": "處理訊息時發生錯誤"},
+                    websocket
+                )
+                
+    except WebSocketDisconnect:
+        pass
+        
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+        
+    finally:
+        await connection_manager.disconnect(websocket)
 
 @router.websocket("/ws/{chat_group_id}")
 async def websocket_endpoint(
     websocket: WebSocket, 
     chat_group_id: int, 
-    token: str
+    token: str,
+    resume_from: Optional[int] = None
 ):
     """
-    WebSocket endpoint for real-time chat
+    WebSocket endpoint for real-time chat in a single chat group (prefer /ws for several groups)
+    
+    Pass the seq of the last message received as resume_from when reconnecting
+    to get the missed messages first. Unlike /ws, heartbeats are optional here:
+    quiet sockets are not closed.
     """
     # Validate token
     from jose import jwt, JWTError
     from app.core.config import settings
-    from app.core.database import SessionLocal
+    from app.core.database import AsyncSessionLocal
     
     try:
         # Verify token
@@ -186,46 +384,54 @@ async def websocket_endpoint(
         user_id = int(payload.get("sub"))
         
         # Get DB session
-        db = SessionLocal()
-        
-        try:
+        async with AsyncSessionLocal() as db:
             # Check if user exists
             chat_repo = ChatRepository(db)
-            user = chat_repo.get_user(user_id)
+            user = await chat_repo.get_user(user_id)
             if not user:
                 await websocket.close(code=1008, reason="Invalid user")
                 return
                 
             # Check if user is member of chat group
-            if not chat_repo.is_chat_member(chat_group_id, user_id):
+            if not await chat_repo.is_chat_member(chat_group_id, user_id):
                 await websocket.close(code=1008, reason="Not a member of this chat group")
                 return
                 
-            # Accept connection
-            await connection_manager.connect(websocket, chat_group_id, user_id)
+            # Accept connection; existing clients of this endpoint send no
+            # heartbeats, so it is not reaped when quiet (dead connections are
+            # still detected by the server's websocket-level pings)
+            await connection_manager.connect(websocket, user_id, reap_idle=False)
+            await connection_manager.subscribe(websocket, chat_group_id, hold=resume_from is not None)
             
             chat_service = ChatService(db)
+            if resume_from is not None:
+                await chat_service.replay(websocket, chat_group_id, resume_from)
             
             try:
                 while True:
                     # Receive and process messages
-                    data = await websocket.receive_text()
-                    import json
-                    message_data = json.loads(data)
+                    message_data = await receive_frame(websocket)
+                    connection_manager.touch(websocket)
+                    if not isinstance(message_data, dict):
+                        await connection_manager.send_personal_message(
+                            {"type": "error", "message": "訊息格式錯誤"},
+                            websocket
+                        )
+                        continue
                     
-                    # Handle message
+                    # Answer heartbeats, handle everything else as a message
+                    if message_data.get("type") == "ping":
+                        await connection_manager.send_personal_message({"type": "pong"}, websocket)
+                        continue
                     await chat_service.handle_message(websocket, user_id, message_data)
                     
             except WebSocketDisconnect:
-                connection_manager.disconnect(websocket)
+                await connection_manager.disconnect(websocket)
                 
             except Exception as e:
                 print(f"WebSocket error: {e}")
-                connection_manager.disconnect(websocket)
-                
-        finally:
-            db.close()
+                await connection_manager.disconnect(websocket)
             
     except JWTError:
         await websocket.close(code=1008, reason="Invalid token")
-        return 
\ No newline at end of file
+        return
\ No newline at end of file
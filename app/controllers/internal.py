@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Header
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import async_engine, read_engine
+from app.core.pool import get_pool_status
+from app.core.query_stats import get_route_query_stats, reset_route_query_stats
+from app.services.chat_service import connection_manager
+from app.services.message_writer import message_writer
+from app.services.read_cursor_writer import read_cursor_writer
+
+router = APIRouter()
+
+def verify_internal_access(x_internal_token: Optional[str] = Header(default=None)):
+    """
+    Allow internal endpoints in development, or with a matching X-Internal-Token header
+    """
+    if settings.APP_ENV == "development":
+        return
+        
+    if not settings.INTERNAL_API_TOKEN or x_internal_token != settings.INTERNAL_API_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="無權存取內部端點"
+        )
+
+@router.get("/db/pool", response_model=dict, dependencies=[Depends(verify_internal_access)])
+async def get_db_pool_status():
+    """
+    Get database connection pool statistics
+    """
+    pool_status = get_pool_status(async_engine.pool)
+    
+    if read_engine is not None:
+        pool_status["replica"] = get_pool_status(read_engine.pool)
+        
+    return pool_status
+
+@router.get("/db/queries", response_model=dict, dependencies=[Depends(verify_internal_access)])
+async def get_db_query_stats():
+    """
+    Get per-route SQL statistics (query count, DB time, slowest statement, N+1 warnings)
+    """
+    return get_route_query_stats()
+
+@router.delete("/db/queries", response_model=dict, dependencies=[Depends(verify_internal_access)])
+async def reset_db_query_stats():
+    """
+    Reset per-route SQL statistics
+    """
+    reset_route_query_stats()
+    return {"status": "success", "message": "已重設查詢統計"}
+
+@router.get("/chat/connections", response_model=dict, dependencies=[Depends(verify_internal_access)])
+async def get_chat_connection_stats():
+    """
+    Get websocket connection, send queue, slow consumer and message batching statistics of this worker
+    """
+    metrics = connection_manager.get_metrics()
+    metrics["message_writer"] = message_writer.get_metrics()
+    metrics["read_cursor_writer"] = read_cursor_writer.get_metrics()
+    return metrics
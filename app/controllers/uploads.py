@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 
 from app.core.database import get_db
 from app.core.auth import get_current_user
 from app.services.file_storage import FileStorageService
-from app.models.user import User
+from app.schemas.user import UserPrincipal
 
 router = APIRouter()
 
@@ -13,7 +13,7 @@ router = APIRouter()
 async def upload_image(
     file: UploadFile = File(...),
     folder: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Upload an image file and get its public URL
@@ -63,8 +63,8 @@ async def upload_image(
 @router.delete("/image")
 async def delete_image(
     url: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete an image by its URL
@@ -1,23 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_read_db
 from app.repositories.user_repository import UserRepository
 from app.repositories.review_repository import ReviewRepository
 from app.models.user import User as UserModel
-from app.schemas.user import User, UserUpdate, UserLocationUpdate, FriendOperation, FCMTokenUpdate
+from app.schemas.user import User, UserUpdate, UserLocationUpdate, FriendOperation, FCMTokenUpdate, UserPrincipal
 from app.schemas.review import Review
+from app.schemas.pagination import Page
+from app.utils.pagination import paginate
 
 router = APIRouter()
 
-@router.get("/", response_model=List[User])
+@router.get("/", response_model=Page[User])
 async def get_users(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    limit: int = Query(100, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: Optional[str] = None, 
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get list of users (admin only in production)
@@ -31,21 +35,26 @@ async def get_users(
             detail="僅開發環境可用"
         )
         
-    user_repo = UserRepository(db)
-    users = db.query(UserModel).offset(skip).limit(limit).all()
-    return users
+    try:
+        users, next_cursor = await paginate(db, select(UserModel), [UserModel.created_at, UserModel.id], limit, cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無效的分頁游標"
+        )
+    return {"items": users, "next_cursor": next_cursor}
 
 @router.get("/{user_id}", response_model=User)
 async def get_user(
     user_id: int, 
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get user by ID
     """
     user_repo = UserRepository(db)
-    user = user_repo.get_user_by_id(user_id)
+    user = await user_repo.get_user_by_id(user_id)
     
     if not user:
         raise HTTPException(
@@ -58,14 +67,14 @@ async def get_user(
 @router.put("/me", response_model=User)
 async def update_user(
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Update current user profile
     """
     user_repo = UserRepository(db)
-    updated_user = user_repo.update_user(current_user.id, user_data)
+    updated_user = await user_repo.update_user(current_user.id, user_data)
     
     if not updated_user:
         raise HTTPException(
@@ -78,14 +87,14 @@ async def update_user(
 @router.put("/me/location", response_model=User)
 async def update_user_location(
     location: UserLocationUpdate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Update current user location
     """
     user_repo = UserRepository(db)
-    updated_user = user_repo.update_user_location(current_user.id, location)
+    updated_user = await user_repo.update_user_location(current_user.id, location)
     
     if not updated_user:
         raise HTTPException(
@@ -98,14 +107,14 @@ async def update_user_location(
 @router.put("/me/fcm-token", response_model=User)
 async def update_fcm_token(
     token_data: FCMTokenUpdate,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Update FCM token for push notifications
     """
     user_repo = UserRepository(db)
-    updated_user = user_repo.update_fcm_token(current_user.id, token_data.fcm_token)
+    updated_user = await user_repo.update_fcm_token(current_user.id, token_data.fcm_token)
     
     if not updated_user:
         raise HTTPException(
@@ -117,21 +126,21 @@ async def update_fcm_token(
 
 @router.get("/me/friends", response_model=List[User])
 async def get_friends(
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get current user's friends
     """
     user_repo = UserRepository(db)
-    friends = user_repo.get_user_friends(current_user.id)
+    friends = await user_repo.get_user_friends(current_user.id)
     return friends
 
 @router.post("/me/friends", response_model=User)
 async def add_friend(
     friend_data: FriendOperation,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Add a friend
@@ -145,7 +154,7 @@ async def add_friend(
     user_repo = UserRepository(db)
     
     # Check if friend exists
-    friend = user_repo.get_user_by_id(friend_data.friend_id)
+    friend = await user_repo.get_user_by_id(friend_data.friend_id)
     if not friend:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -153,7 +162,7 @@ async def add_friend(
         )
         
     # Add friend
-    success = user_repo.add_friend(current_user.id, friend_data.friend_id)
+    success = await user_repo.add_friend(current_user.id, friend_data.friend_id)
     
     if not success:
         raise HTTPException(
@@ -166,8 +175,8 @@ async def add_friend(
 @router.delete("/me/friends/{friend_id}", response_model=dict)
 async def remove_friend(
     friend_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Remove a friend
@@ -175,7 +184,7 @@ async def remove_friend(
     user_repo = UserRepository(db)
     
     # Check if friend exists
-    friend = user_repo.get_user_by_id(friend_id)
+    friend = await user_repo.get_user_by_id(friend_id)
     if not friend:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -183,7 +192,7 @@ async def remove_friend(
         )
         
     # Remove friend
-    success = user_repo.remove_friend(current_user.id, friend_id)
+    success = await user_repo.remove_friend(current_user.id, friend_id)
     
     if not success:
         raise HTTPException(
@@ -196,18 +205,18 @@ async def remove_friend(
 @router.get("/{user_id}/reviews", response_model=List[Review])
 async def get_user_reviews(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: UserModel = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserPrincipal = Depends(get_current_user)
 ):
     """
     Get reviews received by a user
     """
     review_repo = ReviewRepository(db)
-    reviews = review_repo.get_reviews_by_reviewed(user_id)
+    reviews = await review_repo.get_reviews_by_reviewed(user_id)
     
     for review in reviews:
-        reviewer = db.query(UserModel).filter(UserModel.id == review.reviewer_id).first()
-        reviewed = db.query(UserModel).filter(UserModel.id == review.reviewed_id).first()
+        reviewer = await db.get(UserModel, review.reviewer_id)
+        reviewed = await db.get(UserModel, review.reviewed_id)
         
         if reviewer:
             review.reviewer_name = reviewer.name
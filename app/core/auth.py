@@ -4,14 +4,20 @@ from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.models.user import User
-from app.core.database import get_db
+from app.schemas.user import UserPrincipal
+from app.core.database import get_db, get_read_session
+from app.utils.cache import TTLCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# Cache of user_id -> UserPrincipal, invalidated by UserRepository on profile updates
+principal_cache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL)
+
 # Function to create access token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -26,8 +32,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     
     return encoded_jwt
 
-# Function to verify access token and get current user
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Function to verify access token and get current user (as a cached UserPrincipal)
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserPrincipal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="無效的認證憑證",
@@ -36,23 +42,41 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
+        user_id = payload.get("sub")
         
         if user_id is None:
             raise credentials_exception
             
-    except JWTError:
+        # asyncpg binds parameters strictly by type, so the id must be an int
+        user_id = int(user_id)
+            
+    except (JWTError, ValueError):
         raise credentials_exception
         
-    user = db.query(User).filter(User.id == user_id).first()
+    principal = principal_cache.get(user_id)
     
-    if user is None:
-        raise credentials_exception
+    if principal is None:
+        result = await db.execute(select(User).filter(User.id == user_id))
+        user = result.scalars().first()
+        
+        if user is None:
+            raise credentials_exception
+            
+        principal = UserPrincipal.model_validate(user, from_attributes=True)
+        principal_cache.set(user_id, principal)
         
-    return user
+    # Lets writes on this session pin the user's reads to the primary
+    db.info["user_id"] = principal.id
+        
+    return principal
+
+# Dependency to get a read-only DB session (replica when configured)
+async def get_read_db(current_user: UserPrincipal = Depends(get_current_user)):
+    async with get_read_session(current_user.id) as db:
+        yield db
 
 # Development mode authentication helper
-def get_dev_user(db: Session = Depends(get_db)):
+async def get_dev_user(db: AsyncSession = Depends(get_db)):
     if settings.APP_ENV != "development":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -60,12 +84,13 @@ def get_dev_user(db: Session = Depends(get_db)):
         )
 
     # Get or create a development user
-    dev_user = db.query(User).filter(User.email == "dev@juka.app").first()
+    result = await db.execute(select(User).filter(User.email == "dev@juka.app"))
+    dev_user = result.scalars().first()
     
     if not dev_user:
         from app.repositories.user_repository import UserRepository
         user_repo = UserRepository(db)
-        dev_user = user_repo.create_user(
+        dev_user = await user_repo.create_user(
             email="dev@juka.app",
             name="開發者使用者",
             profile_picture="https://via.placeholder.com/150",
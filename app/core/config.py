@@ -5,6 +5,44 @@ from typing import List, Optional
 class Settings(BaseSettings):
     APP_ENV: str = "development"
     DATABASE_URL: str
+    DATABASE_READ_URL: Optional[str] = None  # Optional read replica
+    READ_YOUR_WRITES_SECONDS: int = 5  # Keep a user's reads on the primary after they write
+    PAGE_SIZE_MAX: int = 100  # Largest limit accepted by paginated list endpoints
+    
+    # Database connection pool settings
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = True
+    
+    # In-memory index of active campaigns for nearby searches; per worker, and
+    # other workers' changes only show up after a rebuild, so single-worker only
+    CAMPAIGN_GEO_INDEX: bool = False
+    CAMPAIGN_INDEX_CELL_KM: float = 1.0  # Grid cell size
+    CAMPAIGN_INDEX_REFRESH_SECONDS: int = 300  # Full rebuild interval, 0 to only load at startup
+    
+    # Per-request SQL statistics (see app/core/query_stats.py)
+    QUERY_STATS_ENABLED: bool = True
+    N_PLUS_ONE_THRESHOLD: int = 5  # Flag a statement shape run more than this many times in one request
+    
+    # Chat fan-out between workers
+    CHAT_BROKER: str = "memory"  # Options: memory (single worker), postgres (LISTEN/NOTIFY)
+    WS_SEND_QUEUE_SIZE: int = 256  # Frames buffered per websocket before the client is dropped
+    WS_SLOW_CONSUMER_LAG_SECONDS: float = 10.0  # Max age of a client's oldest unsent frame
+    CHAT_CACHE_TTL: int = 60  # Seconds chat group members/profiles are cached per worker
+    CHAT_WRITE_DELAY_MS: float = 5  # Max time a chat message waits to be batched with others
+    CHAT_WRITE_BATCH_SIZE: int = 100  # Max chat messages per INSERT
+    CHAT_RECENT_MESSAGES: int = 100  # Recent messages kept in memory per chat group with live sockets
+    CHAT_RESUME_MAX: int = 100  # Messages replayed to a reconnecting websocket (keep well below WS_SEND_QUEUE_SIZE)
+    CHAT_READ_FLUSH_SECONDS: float = 1.0  # Read cursor marks are coalesced and written this often
+    CHAT_UNREAD_COUNT_MAX: int = 999  # Unread counts stop at this many (bounds the index scan per group)
+    PRESENCE_TIMEOUT_SECONDS: float = 90.0  # Websockets sending no frame (e.g. {"type": "ping"}) for this long are closed
+    PRESENCE_TICK_SECONDS: float = 1.0  # Idle socket reaping and presence event batching interval
+    PRESENCE_LAST_SEEN_TTL_SECONDS: float = 86400.0  # How long a worker remembers when an offline user was last seen
+    
+    # Token for /internal endpoints outside development
+    INTERNAL_API_TOKEN: Optional[str] = None
     
     # Firebase settings
     FCM_SERVER_KEY: Optional[str] = None  # Legacy method
@@ -22,6 +60,8 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-here"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    PRINCIPAL_CACHE_SIZE: int = 10000  # Authenticated users cached per worker
+    PRINCIPAL_CACHE_TTL: int = 60  # Seconds
     
     # Image storage settings
     UPLOAD_FOLDER: str = "uploads"
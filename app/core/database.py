@@ -1,37 +1,125 @@
-from sqlalchemy import create_engine
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
 from urllib.parse import urlparse
 
 from app.core.config import settings
+from app.core.pool import InstrumentedAsyncQueuePool
+
+def to_async_url(url: str) -> str:
+    """Convert a postgresql:// / postgresql+psycopg2:// URL to an asyncpg URL"""
+    if urlparse(url).scheme == 'postgresql+asyncpg':
+        return url
+    return 'postgresql+asyncpg://' + url.split('://', 1)[1]
 
 # Parse the DB URL to check if it's an async URL
 parsed_url = urlparse(settings.DATABASE_URL)
 is_async_url = parsed_url.scheme == 'postgresql+asyncpg'
 
-# If using an async URL, convert to sync for SQLAlchemy ORM
+# The application talks to PostgreSQL through asyncpg; the sync URL is only
+# kept for tooling such as init_db.py and Alembic migrations
 sync_url = settings.DATABASE_URL
 if is_async_url:
-    # Convert asyncpg URL to psycopg2 URL for SQLAlchemy ORM
+    # Convert asyncpg URL to psycopg2 URL for sync tooling
     sync_url = settings.DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://')
+async_url = to_async_url(settings.DATABASE_URL)
 
-# Create SQLAlchemy engine
+# Connection pool options shared by the primary and the read replica
+pool_options = dict(
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING
+)
+
+# Create SQLAlchemy engines
 engine = create_engine(sync_url)
+async_engine = create_async_engine(async_url, **pool_options)
+
+# Create async sessionmaker
+# expire_on_commit is disabled so that ORM objects (e.g. current_user) stay
+# readable after a commit without triggering an implicit lazy load
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Optional read replica for read-only routes
+read_engine = None
+AsyncReadSessionLocal = None
+if settings.DATABASE_READ_URL:
+    read_engine = create_async_engine(to_async_url(settings.DATABASE_READ_URL), **pool_options)
+    AsyncReadSessionLocal = async_sessionmaker(
+        bind=read_engine,
+        class_=AsyncSession,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+# Map of user_id -> monotonic time until which the user's reads stay on the primary.
+# This is per process, so read-your-writes only holds within one worker.
+primary_pins: Dict[int, float] = {}
+MAX_PRIMARY_PINS = 10000
+
+def pin_user_to_primary(user_id: int):
+    """Route the user's reads to the primary for READ_YOUR_WRITES_SECONDS"""
+    if settings.READ_YOUR_WRITES_SECONDS <= 0:
+        return
+
+    now = time.monotonic()
 
-# Create sessionmaker
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Drop expired pins before the map grows unbounded
+    if len(primary_pins) >= MAX_PRIMARY_PINS:
+        for expired_user_id in [uid for uid, until in primary_pins.items() if until <= now]:
+            del primary_pins[expired_user_id]
+
+    primary_pins[user_id] = now + settings.READ_YOUR_WRITES_SECONDS
+
+def is_user_pinned_to_primary(user_id: int) -> bool:
+    until = primary_pins.get(user_id)
+    return until is not None and until > time.monotonic()
+
+def get_read_session(user_id: Optional[int] = None) -> AsyncSession:
+    """
+    Open a session for read-only queries: the replica when configured,
+    otherwise (or right after the same user wrote) the primary
+    """
+    if AsyncReadSessionLocal is None or (user_id is not None and is_user_pinned_to_primary(user_id)):
+        return AsyncSessionLocal()
+    return AsyncReadSessionLocal()
+
+# Track writes on sessions that know their user (set by get_current_user),
+# so that a committed write pins that user's reads to the primary
+@event.listens_for(Session, "after_flush")
+def _mark_flush_write(session, flush_context):
+    session.info["has_writes"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["has_writes"] = True
+
+@event.listens_for(Session, "after_commit")
+def _pin_writer_to_primary(session):
+    if session.info.pop("has_writes", False) and session.info.get("user_id") is not None:
+        pin_user_to_primary(session.info["user_id"])
+
+@event.listens_for(Session, "after_rollback")
+def _clear_write_flag(session):
+    session.info.pop("has_writes", None)
 
 # Create Base class for models
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-# Function to create tables
-def create_tables():
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
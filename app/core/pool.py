@@ -0,0 +1,81 @@
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+# Callbacks invoked with a pool status snapshot after every checkout
+pool_metrics_hooks: List[Callable[[Dict[str, Any]], None]] = []
+
+def register_pool_metrics_hook(hook: Callable[[Dict[str, Any]], None]):
+    """Register a callback that receives the pool status after every checkout"""
+    pool_metrics_hooks.append(hook)
+
+class PoolWaitStats:
+    """Running totals of how long callers waited to obtain a connection"""
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+            
+    def snapshot(self) -> Dict[str, Any]:
+        avg_wait = self.total_wait / self.checkouts if self.checkouts else 0.0
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(avg_wait * 1000, 3),
+            "max_wait_ms": round(self.max_wait * 1000, 3)
+        }
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that measures the time spent obtaining a connection,
+    including waiting for a free slot and opening new connections
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+        
+    def _do_get(self):
+        started = time.perf_counter()
+        
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.wait_stats.timeouts += 1
+            raise
+            
+        self.wait_stats.record(time.perf_counter() - started)
+        
+        if pool_metrics_hooks:
+            status = get_pool_status(self)
+            for hook in pool_metrics_hooks:
+                try:
+                    hook(status)
+                except Exception as e:
+                    print(f"Pool metrics hook error: {e}")
+                    
+        return connection
+
+def get_pool_status(pool: Pool) -> Dict[str, Any]:
+    """Get checked-out, idle and overflow connection counts for a pool"""
+    status = {
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # QueuePool.overflow() is negative until the pool is fully populated
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow
+    }
+    
+    if isinstance(pool, InstrumentedAsyncQueuePool):
+        status.update(pool.wait_stats.snapshot())
+        
+    return status
@@ -0,0 +1,164 @@
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+# Bind parameters and expanded IN lists, so that "id = $1" and "id = $2",
+# or "IN ($1, $2)" and "IN ($1, $2, $3)", count as the same statement shape
+PARAMETER_PATTERN = re.compile(r"\$\d+|%\(\w+\)s|\?")
+PARAMETER_LIST_PATTERN = re.compile(r"\?(\s*,\s*\?)+")
+
+def statement_shape(statement: str) -> str:
+    shape = PARAMETER_PATTERN.sub("?", statement)
+    shape = PARAMETER_LIST_PATTERN.sub("?", shape)
+    return " ".join(shape.split())
+
+class RequestQueryStats:
+    """SQL statements executed while serving one request"""
+    def __init__(self):
+        self.query_count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.shape_counts: Dict[str, int] = {}
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.query_count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_statement = statement
+
+        shape = statement_shape(statement)
+        self.shape_counts[shape] = self.shape_counts.get(shape, 0) + 1
+
+    def repeated_statements(self, threshold: int) -> Dict[str, int]:
+        """Statement shapes executed more than threshold times (likely N+1 queries)"""
+        return {shape: count for shape, count in self.shape_counts.items() if count > threshold}
+
+class RouteQueryStats:
+    """Query statistics aggregated over all requests to one route"""
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.total_ms = 0.0
+        self.max_queries = 0
+        self.slowest_ms = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.n_plus_one_requests = 0
+        self.n_plus_one_statements: Dict[str, int] = {}
+
+    def add(self, stats: RequestQueryStats, repeated: Dict[str, int]):
+        self.requests += 1
+        self.queries += stats.query_count
+        self.total_ms += stats.total_ms
+        self.max_queries = max(self.max_queries, stats.query_count)
+        if stats.slowest_ms > self.slowest_ms:
+            self.slowest_ms = stats.slowest_ms
+            self.slowest_statement = stats.slowest_statement
+
+        if repeated:
+            self.n_plus_one_requests += 1
+            for shape, count in repeated.items():
+                self.n_plus_one_statements[shape] = max(self.n_plus_one_statements.get(shape, 0), count)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "avg_queries": round(self.queries / self.requests, 2) if self.requests else 0,
+            "max_queries": self.max_queries,
+            "avg_db_ms": round(self.total_ms / self.requests, 3) if self.requests else 0,
+            "slowest_ms": round(self.slowest_ms, 3),
+            "slowest_statement": self.slowest_statement,
+            "n_plus_one_requests": self.n_plus_one_requests,
+            "n_plus_one_statements": self.n_plus_one_statements
+        }
+
+# Stats of the request being served by the current task, None outside requests
+current_query_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("current_query_stats", default=None)
+
+# "METHOD /route/{param}" -> aggregated stats, for the /internal metrics endpoint
+route_query_stats: Dict[str, RouteQueryStats] = {}
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_query_stats.get() is not None:
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    start_times = conn.info.get("query_start_times")
+    if stats is None or not start_times:
+        return
+
+    stats.record(statement, (time.perf_counter() - start_times.pop()) * 1000)
+
+@event.listens_for(Engine, "handle_error")
+def _discard_query_timer(exception_context):
+    connection = exception_context.connection
+    start_times = connection.info.get("query_start_times") if connection is not None else None
+    if start_times:
+        start_times.pop()
+
+def get_route_query_stats() -> Dict[str, dict]:
+    return {route: stats.to_dict() for route, stats in sorted(route_query_stats.items())}
+
+def reset_route_query_stats():
+    route_query_stats.clear()
+
+class QueryStatsMiddleware:
+    """
+    Count the SQL statements, and the time spent in them, of every HTTP request
+
+    Per-route totals are kept for the /internal metrics endpoint. In development
+    each response also carries X-DB-Query-Count / X-DB-Time-Ms / X-DB-Slowest-Ms
+    headers, and repeated statement shapes (N+1 queries) are printed and reported
+    in X-DB-N-Plus-One.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = current_query_stats.set(stats)
+        development = settings.APP_ENV == "development"
+        threshold = settings.N_PLUS_ONE_THRESHOLD
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start" and development:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(stats.query_count).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.total_ms:.3f}".encode()))
+                headers.append((b"x-db-slowest-ms", f"{stats.slowest_ms:.3f}".encode()))
+
+                repeated = stats.repeated_statements(threshold)
+                if repeated:
+                    headers.append((b"x-db-n-plus-one", str(max(repeated.values())).encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_query_stats.reset(token)
+
+            # FastAPI stores the matched route in the scope; keying on its path
+            # template keeps the number of entries bounded
+            route = scope.get("route")
+            route_key = f"{scope['method']} {route.path if route is not None else '<unmatched>'}"
+            repeated = stats.repeated_statements(threshold)
+            route_query_stats.setdefault(route_key, RouteQueryStats()).add(stats, repeated)
+
+            if repeated and development:
+                for shape, count in repeated.items():
+                    print(f"N+1 query detected on {route_key}: {count}x {shape}")
@@ -1,11 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import os
 
 from app.core.config import settings
-from app.core.database import create_tables
-from app.controllers import auth, users, campaigns, businesses, chat, ai, uploads
+from app.core.query_stats import QueryStatsMiddleware
+from app.controllers import auth, users, campaigns, businesses, chat, ai, uploads, internal
+from app.repositories.campaign_repository import refresh_campaign_index
+from app.services.chat_service import connection_manager
+from app.services.message_writer import message_writer
+from app.services.read_cursor_writer import read_cursor_writer
 
 app = FastAPI(
     title="Juka 揪咖 API",
@@ -22,6 +27,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request SQL statistics and N+1 detection
+if settings.QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware)
+
 # Setup static file serving for uploaded files
 uploads_dir = os.path.join(os.getcwd(), settings.UPLOAD_FOLDER)
 os.makedirs(uploads_dir, exist_ok=True)
@@ -35,10 +44,49 @@ app.include_router(businesses.router, prefix="/businesses", tags=["商家"])
 app.include_router(chat.router, prefix="/chat", tags=["聊天"])
 app.include_router(ai.router, prefix="/ai", tags=["AI功能"])
 app.include_router(uploads.router, prefix="/api/uploads", tags=["檔案上傳"])
+app.include_router(internal.router, prefix="/internal", tags=["內部監控"])
+
+@app.on_event("startup")
+async def start_campaign_index():
+    """Build the in-memory campaign index used by nearby searches"""
+    if settings.CAMPAIGN_GEO_INDEX:
+        app.state.campaign_index_task = asyncio.create_task(refresh_campaign_index())
+
+@app.on_event("shutdown")
+async def stop_campaign_index():
+    task = getattr(app.state, "campaign_index_task", None)
+    if task:
+        task.cancel()
+
+@app.on_event("startup")
+async def start_chat_broker():
+    """Connect the chat broker that fans messages out across workers"""
+    await connection_manager.broker.start()
+
+@app.on_event("shutdown")
+async def stop_chat_broker():
+    await connection_manager.broker.stop()
 
 @app.on_event("startup")
-async def startup_event():
-    create_tables()
+async def start_presence():
+    """Reap websockets that stopped sending heartbeats and publish presence changes"""
+    app.state.presence_task = asyncio.create_task(connection_manager.presence.run())
+
+@app.on_event("shutdown")
+async def stop_presence():
+    task = getattr(app.state, "presence_task", None)
+    if task:
+        task.cancel()
+
+@app.on_event("shutdown")
+async def flush_chat_messages():
+    """Persist chat messages still waiting for their batch"""
+    await message_writer.close()
+
+@app.on_event("shutdown")
+async def flush_read_cursors():
+    """Persist chat read cursors still waiting to be coalesced"""
+    await read_cursor_writer.close()
 
 @app.get("/", tags=["健康檢查"])
 async def root():
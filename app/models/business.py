@@ -1,12 +1,16 @@
-from sqlalchemy import Column, String, Float, Boolean
+from sqlalchemy import Column, String, Float, Boolean, Index
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geography
-from sqlalchemy.sql.expression import text
 
 from app.models.base import BaseModel
+from app.utils.spatial import geography_point
 
 class Business(BaseModel):
     __tablename__ = "businesses"
+    __table_args__ = (
+        # Keyset pagination of the business list
+        Index("ix_businesses_created_at_id", "created_at", "id"),
+    )
 
     name = Column(String, nullable=False)
     description = Column(String, nullable=True)
@@ -34,4 +38,4 @@ class Business(BaseModel):
         
         # Create geography point from lat/long if provided
         if 'latitude' in kwargs and 'longitude' in kwargs and kwargs['latitude'] and kwargs['longitude']:
-            self.location = text(f"ST_SetSRID(ST_MakePoint({kwargs['longitude']}, {kwargs['latitude']}), 4326)") 
\ No newline at end of file
+            self.location = geography_point(kwargs['latitude'], kwargs['longitude']) 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Boolean, Text, Enum
+from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Boolean, Text, Enum, Index
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geography
 from sqlalchemy.sql.expression import text
@@ -6,6 +6,7 @@ from datetime import datetime
 import enum
 
 from app.models.base import BaseModel
+from app.utils.spatial import geography_point
 
 class CampaignCategory(str, enum.Enum):
     COFFEE = "咖啡優惠"
@@ -17,6 +18,12 @@ class CampaignCategory(str, enum.Enum):
 
 class Campaign(BaseModel):
     __tablename__ = "campaigns"
+    __table_args__ = (
+        # Nearby search only looks at active campaigns
+        Index("ix_campaigns_location_active", "location", postgresql_using="gist", postgresql_where=text("is_active")),
+        # Keyset pagination of the campaign list
+        Index("ix_campaigns_created_at_id", "created_at", "id"),
+    )
 
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
@@ -35,6 +42,7 @@ class Campaign(BaseModel):
     start_time = Column(DateTime, nullable=True)
     end_time = Column(DateTime, nullable=True)
     max_participants = Column(Integer, nullable=True)
+    participant_count = Column(Integer, nullable=False, default=0, server_default="0")  # Maintained by join/leave
     is_active = Column(Boolean, default=True)
     
     # Creator relationship
@@ -57,12 +65,16 @@ class Campaign(BaseModel):
         
         # Create geography point from lat/long
         if 'latitude' in kwargs and 'longitude' in kwargs:
-            self.location = text(f"ST_SetSRID(ST_MakePoint({kwargs['longitude']}, {kwargs['latitude']}), 4326)")
+            self.location = geography_point(kwargs['latitude'], kwargs['longitude'])
 
 class UserCampaign(BaseModel):
     __tablename__ = "user_campaigns"
+    __table_args__ = (
+        # One participation per user and campaign, even for concurrent joins
+        Index("uq_user_campaigns_campaign_id_user_id", "campaign_id", "user_id", unique=True),
+    )
 
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     campaign_id = Column(Integer, ForeignKey("campaigns.id"))
     joined_at = Column(DateTime, default=datetime.utcnow)
     
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -6,10 +6,19 @@ from app.models.base import BaseModel
 
 class ChatGroup(BaseModel):
     __tablename__ = "chat_groups"
+    __table_args__ = (
+        # One direct chat per pair of users, found with a single index lookup
+        Index("uq_chat_groups_direct_users", "min_user_id", "max_user_id", unique=True),
+    )
 
     name = Column(String)
     is_direct = Column(Boolean, default=False)  # Direct message or group chat
     
+    # Direct chats only: the two members, lower user id first
+    min_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    max_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    last_message_seq = Column(Integer, default=0, nullable=False)  # seq of the group's latest message
+    
     # Related to campaign (optional)
     campaign = relationship("Campaign", back_populates="chat_group", uselist=False)
     
@@ -19,12 +28,15 @@ class ChatGroup(BaseModel):
 
 class ChatMember(BaseModel):
     __tablename__ = "chat_members"
+    __table_args__ = (
+        Index("ix_chat_members_chat_group_id_user_id", "chat_group_id", "user_id"),
+    )
 
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     chat_group_id = Column(Integer, ForeignKey("chat_groups.id"))
     
     # User status
-    last_read_at = Column(String, nullable=True)
+    last_read_message_id = Column(Integer, nullable=True)  # Read cursor: newest message the member has read
     is_admin = Column(Boolean, default=False)
     
     # Relationships
@@ -33,9 +45,18 @@ class ChatMember(BaseModel):
 
 class ChatMessage(BaseModel):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # History pages: chat_group_id = ? AND id < ? ORDER BY id DESC
+        Index("ix_chat_messages_chat_group_id_id", "chat_group_id", "id"),
+        # Replay on reconnect: chat_group_id = ? AND seq > ? ORDER BY seq
+        Index("ix_chat_messages_chat_group_id_seq", "chat_group_id", "seq", unique=True),
+    )
+    # Fetch server-generated created_at in the INSERT itself instead of a refresh
+    __mapper_args__ = {"eager_defaults": True}
 
     chat_group_id = Column(Integer, ForeignKey("chat_groups.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
+    seq = Column(Integer)  # 1, 2, 3... within the chat group (gaps only where messages were deleted)
     
     # Message content
     content = Column(Text)
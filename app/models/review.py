@@ -11,11 +11,11 @@ class Review(BaseModel):
     reviewer = relationship("User", foreign_keys=[reviewer_id], back_populates="given_reviews")
     
     # Who got reviewed
-    reviewed_id = Column(Integer, ForeignKey("users.id"))
+    reviewed_id = Column(Integer, ForeignKey("users.id"), index=True)
     reviewed = relationship("User", foreign_keys=[reviewed_id], back_populates="received_reviews")
     
     # Related campaign
-    campaign_id = Column(Integer, ForeignKey("campaigns.id"))
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), index=True)
     
     # Review content
     rating = Column(Float, nullable=False)  # 1-5 star rating
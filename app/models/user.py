@@ -1,9 +1,9 @@
-from sqlalchemy import Column, String, Float, Boolean, Table, ForeignKey
+from sqlalchemy import Column, String, Float, Boolean, Table, ForeignKey, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql.expression import text
 from geoalchemy2 import Geography
 
 from app.models.base import BaseModel
+from app.utils.spatial import geography_point
 
 # Association table for user friendships
 friendship = Table(
@@ -15,6 +15,10 @@ friendship = Table(
 
 class User(BaseModel):
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset pagination of the user list
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
 
     email = Column(String, unique=True, index=True)
     name = Column(String)
@@ -55,4 +59,4 @@ class User(BaseModel):
         
         # Create geography point from lat/long if provided
         if 'latitude' in kwargs and 'longitude' in kwargs and kwargs['latitude'] and kwargs['longitude']:
-            self.location = text(f"ST_SetSRID(ST_MakePoint({kwargs['longitude']}, {kwargs['latitude']}), 4326)") 
\ No newline at end of file
+            self.location = geography_point(kwargs['latitude'], kwargs['longitude']) 
\ No newline at end of file
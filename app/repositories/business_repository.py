@@ -1,32 +1,36 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
-from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
 
 from app.models.business import Business
 from app.schemas.business import BusinessCreate, BusinessUpdate
+from app.utils.pagination import paginate
+from app.utils.spatial import geography_point, nearby_query, with_distance
 
 class BusinessRepository:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         
-    def get_business_by_id(self, business_id: int) -> Optional[Business]:
-        return self.db.query(Business).filter(Business.id == business_id).first()
+    async def get_business_by_id(self, business_id: int) -> Optional[Business]:
+        result = await self.db.execute(select(Business).filter(Business.id == business_id))
+        return result.scalars().first()
         
-    def get_businesses(self, skip: int = 0, limit: int = 100) -> List[Business]:
-        return self.db.query(Business).offset(skip).limit(limit).all()
+    async def get_businesses(self, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[Business], Optional[str]]:
+        """Get one page of businesses, newest first, with the cursor of the next page"""
+        return await paginate(self.db, select(Business), [Business.created_at, Business.id], limit, cursor)
         
-    def create_business(self, business_data: BusinessCreate) -> Business:
+    async def create_business(self, business_data: BusinessCreate) -> Business:
         business_dict = business_data.dict()
         business = Business(**business_dict)
         
         self.db.add(business)
-        self.db.commit()
-        self.db.refresh(business)
+        await self.db.commit()
+        await self.db.refresh(business)
         
         return business
         
-    def update_business(self, business_id: int, business_data: BusinessUpdate) -> Optional[Business]:
-        business = self.get_business_by_id(business_id)
+    async def update_business(self, business_id: int, business_data: BusinessUpdate) -> Optional[Business]:
+        business = await self.get_business_by_id(business_id)
         if not business:
             return None
             
@@ -38,29 +42,25 @@ class BusinessRepository:
         if business_data.latitude and business_data.longitude:
             business.latitude = business_data.latitude
             business.longitude = business_data.longitude
-            business.location = text(f"ST_SetSRID(ST_MakePoint({business_data.longitude}, {business_data.latitude}), 4326)")
+            business.location = geography_point(business_data.latitude, business_data.longitude)
             
-        self.db.commit()
-        self.db.refresh(business)
+        await self.db.commit()
+        await self.db.refresh(business)
         return business
         
-    def delete_business(self, business_id: int) -> bool:
-        business = self.get_business_by_id(business_id)
+    async def delete_business(self, business_id: int) -> bool:
+        business = await self.get_business_by_id(business_id)
         if not business:
             return False
             
-        self.db.delete(business)
-        self.db.commit()
+        await self.db.delete(business)
+        await self.db.commit()
         return True
         
-    def get_nearby_businesses(self, latitude: float, longitude: float, radius_km: float, limit: int = 10) -> List[Business]:
-        """Get businesses within a certain radius (in kilometers)"""
-        point = f"ST_SetSRID(ST_MakePoint({longitude}, {latitude}), 4326)"
+    async def get_nearby_businesses(self, latitude: float, longitude: float, radius_km: float, limit: int = 10) -> List[Business]:
+        """Get businesses within a certain radius (in kilometers), with distance_m set on each"""
+        query, distance = nearby_query(Business, latitude, longitude, radius_km)
         
-        nearby_businesses = self.db.query(Business).filter(
-            text(f"ST_DWithin(location, {point}::geography, {radius_km * 1000})")
-        ).order_by(
-            text(f"ST_Distance(location, {point}::geography)")
-        ).limit(limit).all()
+        result = await self.db.execute(query.order_by(distance).limit(limit))
         
-        return nearby_businesses 
\ No newline at end of file
+        return with_distance(result.all())
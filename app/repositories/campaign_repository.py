@@ -1,39 +1,66 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import text, func
+import asyncio
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
 from typing import List, Optional, Tuple
 
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
 from app.models.campaign import Campaign, UserCampaign
 from app.models.user import User
 from app.schemas.campaign import CampaignCreate, CampaignUpdate, CampaignCategory
+from app.utils.geo_index import GeoGridIndex
+from app.utils.pagination import paginate
+from app.utils.spatial import nearby_query, with_distance
+
+# Per-process index of active campaigns used by nearby searches (CAMPAIGN_GEO_INDEX).
+# It is loaded at startup and kept in sync by this repository's writes; writes
+# made by other workers only show up after the next periodic rebuild, so it is
+# off by default and only suited to single-worker deployments.
+campaign_index = GeoGridIndex(cell_km=settings.CAMPAIGN_INDEX_CELL_KM)
+
+def _category_key(category) -> Optional[str]:
+    return getattr(category, "value", category)
 
 class CampaignRepository:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         
-    def get_campaign_by_id(self, campaign_id: int) -> Optional[Campaign]:
-        return self.db.query(Campaign).filter(Campaign.id == campaign_id).first()
+    async def get_campaign_by_id(self, campaign_id: int) -> Optional[Campaign]:
+        result = await self.db.execute(select(Campaign).filter(Campaign.id == campaign_id))
+        return result.scalars().first()
+        
+    async def get_campaigns(self, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[Campaign], Optional[str]]:
+        """Get one page of campaigns, newest first, with the cursor of the next page"""
+        return await paginate(self.db, select(Campaign), [Campaign.created_at, Campaign.id], limit, cursor)
         
-    def get_campaigns_by_creator(self, creator_id: int) -> List[Campaign]:
-        return self.db.query(Campaign).filter(Campaign.creator_id == creator_id).all()
+    async def get_campaigns_by_creator(self, creator_id: int) -> List[Campaign]:
+        result = await self.db.execute(select(Campaign).filter(Campaign.creator_id == creator_id))
+        return result.scalars().all()
         
-    def get_campaigns_by_business(self, business_id: int) -> List[Campaign]:
-        return self.db.query(Campaign).filter(Campaign.business_id == business_id).all()
+    async def get_campaigns_by_business(self, business_id: int) -> List[Campaign]:
+        result = await self.db.execute(select(Campaign).filter(Campaign.business_id == business_id))
+        return result.scalars().all()
         
-    def create_campaign(self, creator_id: int, campaign_data: CampaignCreate) -> Campaign:
+    async def create_campaign(self, creator_id: int, campaign_data: CampaignCreate) -> Campaign:
         campaign_dict = campaign_data.dict()
         campaign = Campaign(**campaign_dict, creator_id=creator_id)
         
         self.db.add(campaign)
-        self.db.commit()
-        self.db.refresh(campaign)
+        await self.db.commit()
+        await self.db.refresh(campaign)
+        
+        self._index_campaign(campaign)
         
         # Creator automatically joins their own campaign
-        self.join_campaign(creator_id, campaign.id)
+        await self.join_campaign(creator_id, campaign.id)
         
         return campaign
         
-    def update_campaign(self, campaign_id: int, campaign_data: CampaignUpdate) -> Optional[Campaign]:
-        campaign = self.get_campaign_by_id(campaign_id)
+    async def update_campaign(self, campaign_id: int, campaign_data: CampaignUpdate) -> Optional[Campaign]:
+        campaign = await self.get_campaign_by_id(campaign_id)
         if not campaign:
             return None
             
@@ -41,103 +68,266 @@ class CampaignRepository:
         for field, value in campaign_data.dict(exclude_unset=True).items():
             setattr(campaign, field, value)
             
-        self.db.commit()
-        self.db.refresh(campaign)
+        await self.db.commit()
+        await self.db.refresh(campaign)
+        
+        self._index_campaign(campaign)
         return campaign
         
-    def delete_campaign(self, campaign_id: int) -> bool:
-        campaign = self.get_campaign_by_id(campaign_id)
+    async def delete_campaign(self, campaign_id: int) -> bool:
+        campaign = await self.get_campaign_by_id(campaign_id)
         if not campaign:
             return False
             
         # Delete all user-campaign associations first
-        self.db.query(UserCampaign).filter(UserCampaign.campaign_id == campaign_id).delete()
+        await self.db.execute(delete(UserCampaign).where(UserCampaign.campaign_id == campaign_id))
         
         # Then delete the campaign
-        self.db.delete(campaign)
-        self.db.commit()
+        await self.db.delete(campaign)
+        await self.db.commit()
+        
+        campaign_index.remove(campaign_id)
         return True
         
-    def join_campaign(self, user_id: int, campaign_id: int) -> Optional[UserCampaign]:
-        # Check if campaign exists and is active
-        campaign = self.get_campaign_by_id(campaign_id)
-        if not campaign or not campaign.is_active:
-            return None
-            
-        # Check if user already joined
-        existing = self.db.query(UserCampaign).filter(
-            UserCampaign.user_id == user_id,
-            UserCampaign.campaign_id == campaign_id
-        ).first()
+    async def join_campaign(self, user_id: int, campaign_id: int) -> Optional[UserCampaign]:
+        """
+        Join a campaign, returning the participation (also if already joined), or None if full / inactive / missing
+        
+        The campaign row stays locked until commit, so joins of one campaign
+        take turns: the capacity check sees every earlier join, and a repeated
+        join (e.g. a double-tap) hits the unique (campaign_id, user_id) index
+        instead of taking a second seat.
+        """
+        campaigns = Campaign.__table__
+        result = await self.db.execute(
+            select(campaigns.c.is_active, campaigns.c.max_participants, campaigns.c.participant_count)
+            .where(campaigns.c.id == campaign_id)
+            .with_for_update()
+        )
+        campaign = result.first()
+        # As before, no (or a zero) max_participants means unlimited
+        has_seat = campaign is not None and campaign.is_active and (
+            not campaign.max_participants or campaign.participant_count < campaign.max_participants
+        )
         
-        if existing:
-            return existing
+        user_campaign_id = None
+        if has_seat:
+            user_campaigns = UserCampaign.__table__
+            result = await self.db.execute(
+                pg_insert(user_campaigns)
+                .values(user_id=user_id, campaign_id=campaign_id)
+                .on_conflict_do_nothing(index_elements=[user_campaigns.c.campaign_id, user_campaigns.c.user_id])
+                .returning(user_campaigns.c.id)
+            )
+            user_campaign_id = result.scalar()
             
-        # Check if campaign is full
-        if campaign.max_participants:
-            participant_count = self.db.query(func.count(UserCampaign.id)).filter(
-                UserCampaign.campaign_id == campaign_id
-            ).scalar()
+        if user_campaign_id is None:
+            # No seat, or already joined: nothing was written
+            await self.db.commit()
+            result = await self.db.execute(
+                select(UserCampaign).filter(
+                    UserCampaign.user_id == user_id,
+                    UserCampaign.campaign_id == campaign_id
+                )
+            )
+            return result.scalars().first()
             
-            if participant_count >= campaign.max_participants:
-                return None
-                
-        # Join campaign
-        user_campaign = UserCampaign(user_id=user_id, campaign_id=campaign_id)
-        self.db.add(user_campaign)
-        self.db.commit()
-        self.db.refresh(user_campaign)
+        # Count the new participant in the same transaction as the row
+        result = await self.db.execute(
+            update(campaigns).where(campaigns.c.id == campaign_id).values(
+                participant_count=campaigns.c.participant_count + 1,
+                updated_at=campaigns.c.updated_at  # Counter changes are not content edits
+            ).returning(campaigns.c.participant_count)
+        )
+        participant_count = result.scalar()
+        await self.db.commit()
         
-        return user_campaign
+        self._sync_participant_count(campaign_id, participant_count)
         
-    def leave_campaign(self, user_id: int, campaign_id: int) -> bool:
+        return await self.db.get(UserCampaign, user_campaign_id)
+        
+    async def leave_campaign(self, user_id: int, campaign_id: int) -> bool:
         # Can't leave if you're the creator
-        campaign = self.get_campaign_by_id(campaign_id)
+        campaign = await self.get_campaign_by_id(campaign_id)
         if not campaign or campaign.creator_id == user_id:
             return False
             
         # Delete user-campaign association
-        deleted = self.db.query(UserCampaign).filter(
-            UserCampaign.user_id == user_id,
-            UserCampaign.campaign_id == campaign_id
-        ).delete()
+        result = await self.db.execute(
+            delete(UserCampaign).where(
+                UserCampaign.user_id == user_id,
+                UserCampaign.campaign_id == campaign_id
+            )
+        )
+        deleted = result.rowcount
+        
+        # Release the seat in the same transaction
+        if deleted > 0:
+            campaigns = Campaign.__table__
+            result = await self.db.execute(
+                update(campaigns).where(
+                    campaigns.c.id == campaign_id
+                ).values(
+                    participant_count=func.greatest(campaigns.c.participant_count - deleted, 0),
+                    updated_at=campaigns.c.updated_at
+                ).returning(campaigns.c.participant_count)
+            )
+            participant_count = result.scalar()
+            
+        await self.db.commit()
         
-        self.db.commit()
+        if deleted > 0:
+            self._sync_participant_count(campaign_id, participant_count)
+            
         return deleted > 0
         
-    def get_campaign_participants(self, campaign_id: int) -> List[Tuple[User, UserCampaign]]:
-        return self.db.query(User, UserCampaign).join(
-            UserCampaign, User.id == UserCampaign.user_id
-        ).filter(UserCampaign.campaign_id == campaign_id).all()
+    def _sync_participant_count(self, campaign_id: int, participant_count: int):
+        """Update an already-loaded Campaign with the counter value written by SQL"""
+        campaign = self.db.identity_map.get(identity_key(Campaign, campaign_id))
+        if campaign is not None:
+            set_committed_value(campaign, "participant_count", participant_count)
+            
+    async def repair_participant_counts(self) -> int:
+        """Recompute participant_count from user_campaigns, returning the number of campaigns fixed"""
+        campaigns = Campaign.__table__
+        actual_count = select(func.count(UserCampaign.id)).where(
+            UserCampaign.campaign_id == campaigns.c.id
+        ).scalar_subquery()
+        
+        result = await self.db.execute(
+            update(campaigns).where(
+                campaigns.c.participant_count != actual_count
+            ).values(participant_count=actual_count, updated_at=campaigns.c.updated_at)
+        )
+        
+        await self.db.commit()
+        return result.rowcount
+        
+    def _index_campaign(self, campaign: Campaign):
+        """Add an active campaign to the nearby index, or drop an inactive one"""
+        if campaign.is_active:
+            campaign_index.upsert(
+                campaign.id, campaign.latitude, campaign.longitude, _category_key(campaign.category)
+            )
+        else:
+            campaign_index.remove(campaign.id)
+            
+    async def rebuild_campaign_index(self) -> int:
+        """Reload the nearby index from all active campaigns, returning the number indexed"""
+        # Writes of this worker during the query are kept rather than lost
+        campaign_index.begin_reload()
+        try:
+            result = await self.db.execute(
+                select(Campaign.id, Campaign.latitude, Campaign.longitude, Campaign.category).filter(
+                    Campaign.is_active == True
+                )
+            )
+            rows = result.all()
+            campaign_index.finish_reload(
+                (campaign_id, latitude, longitude, _category_key(category))
+                for campaign_id, latitude, longitude, category in rows
+            )
+        finally:
+            # Stop recording if the query failed (a no-op once finished)
+            campaign_index.cancel_reload()
+            
+        return len(rows)
         
-    def get_nearby_campaigns(
+    async def get_campaign_participants(self, campaign_id: int) -> List[Tuple[User, UserCampaign]]:
+        result = await self.db.execute(
+            select(User, UserCampaign).join(
+                UserCampaign, User.id == UserCampaign.user_id
+            ).filter(UserCampaign.campaign_id == campaign_id)
+        )
+        return result.all()
+        
+    async def get_nearby_campaigns(
         self, 
         latitude: float, 
         longitude: float, 
         radius_km: float, 
         limit: int = 10, 
-        category: Optional[CampaignCategory] = None
+        category: Optional[CampaignCategory] = None,
+        use_index: Optional[bool] = None
     ) -> List[Campaign]:
-        """Get campaigns within a certain radius (in kilometers)"""
-        point = f"ST_SetSRID(ST_MakePoint({longitude}, {latitude}), 4326)"
+        """
+        Get campaigns within a certain radius (in kilometers), with distance_m set on each
         
-        query = self.db.query(Campaign).filter(
-            Campaign.is_active == True,
-            text(f"ST_DWithin(location, {point}::geography, {radius_km * 1000})")
-        )
+        With CAMPAIGN_GEO_INDEX, the in-memory campaign index answers the
+        search once it is loaded, and only the resulting page is read from the
+        database; otherwise (or with use_index=False) PostGIS answers it.
+        """
+        if use_index is None:
+            use_index = settings.CAMPAIGN_GEO_INDEX and campaign_index.ready
+            
+        if use_index:
+            return await self._get_nearby_campaigns_from_index(latitude, longitude, radius_km, limit, category)
+            
+        query, distance = nearby_query(Campaign, latitude, longitude, radius_km)
+        query = query.filter(Campaign.is_active == True)
         
         # Add category filter if specified
         if category:
             query = query.filter(Campaign.category == category)
         
         # Order by distance and limit results
-        nearby_campaigns = query.order_by(
-            text(f"ST_Distance(location, {point}::geography)")
-        ).limit(limit).all()
+        result = await self.db.execute(query.order_by(distance).limit(limit))
         
-        return nearby_campaigns
+        return with_distance(result.all())
         
-    def get_user_joined_campaigns(self, user_id: int) -> List[Campaign]:
-        return self.db.query(Campaign).join(
-            UserCampaign, Campaign.id == UserCampaign.campaign_id
-        ).filter(UserCampaign.user_id == user_id).all() 
\ No newline at end of file
+    async def _get_nearby_campaigns_from_index(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int,
+        category: Optional[CampaignCategory]
+    ) -> List[Campaign]:
+        matches = campaign_index.nearby(latitude, longitude, radius_km, limit, _category_key(category))
+        if not matches:
+            return []
+            
+        # Hydrate only the final page, keeping the index's distance order
+        result = await self.db.execute(
+            select(Campaign).filter(
+                Campaign.id.in_([campaign_id for campaign_id, _ in matches]),
+                Campaign.is_active == True
+            )
+        )
+        campaigns = {campaign.id: campaign for campaign in result.scalars().all()}
+        
+        nearby = []
+        for campaign_id, distance_m in matches:
+            campaign = campaigns.get(campaign_id)
+            if campaign is None:
+                # Deleted or deactivated by another worker since the last rebuild
+                campaign_index.remove(campaign_id)
+                continue
+                
+            campaign.distance_m = distance_m
+            nearby.append(campaign)
+            
+        return nearby
+        
+    async def get_user_joined_campaigns(self, user_id: int) -> List[Campaign]:
+        result = await self.db.execute(
+            select(Campaign).join(
+                UserCampaign, Campaign.id == UserCampaign.campaign_id
+            ).filter(UserCampaign.user_id == user_id)
+        )
+        return result.scalars().all()
+
+async def refresh_campaign_index():
+    """Load the campaign index, then rebuild it every CAMPAIGN_INDEX_REFRESH_SECONDS"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                count = await CampaignRepository(db).rebuild_campaign_index()
+            print(f"Campaign index loaded: {count} active campaigns")
+        except Exception as e:
+            # Nearby searches fall back to PostGIS until a rebuild succeeds
+            print(f"Campaign index rebuild failed: {e}")
+            
+        if settings.CAMPAIGN_INDEX_REFRESH_SECONDS <= 0:
+            return
+        await asyncio.sleep(settings.CAMPAIGN_INDEX_REFRESH_SECONDS)
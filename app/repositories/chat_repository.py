@@ -1,46 +1,171 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from sqlalchemy import Integer, column, select, delete, func, true, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from sqlalchemy.sql.selectable import Lateral
+from typing import List, Optional, Dict, Any, Set, Tuple
 from datetime import datetime
 
+from app.core.config import settings
+from app.core.database import read_engine
 from app.models.chat import ChatGroup, ChatMember, ChatMessage
 from app.models.user import User
 from app.schemas.chat import ChatGroupCreate, MessageCreate
+from app.utils.chat_cache import CachedChatGroup, ChatGroupCache, SenderProfile
+from app.utils.message_buffer import RecentMessageBuffer
+from app.utils.pagination import encode_cursor, keyset_page, page_rows, paginate
+
+# Members and sender profiles of chat groups with live sockets on this worker.
+# Kept in sync by this repository and by user profile updates.
+chat_group_cache = ChatGroupCache(ttl=settings.CHAT_CACHE_TTL)
+
+# Latest messages of the same groups, fed by the messages they broadcast
+recent_messages = RecentMessageBuffer(size=settings.CHAT_RECENT_MESSAGES)
+
+def sender_profile(user: User) -> SenderProfile:
+    return SenderProfile(user.name, user.profile_picture, user.fcm_token)
+
+def message_payload(message: ChatMessage, sender: Optional[SenderProfile]) -> dict:
+    """A message with its sender's name and picture, as broadcast and returned by the history API"""
+    return {
+        "id": message.id,
+        "content": message.content,
+        "message_type": message.message_type,
+        "created_at": message.created_at.isoformat(),
+        "chat_group_id": message.chat_group_id,
+        "user_id": message.user_id,
+        "seq": message.seq,
+        "sender_name": sender.name if sender else "",
+        "sender_profile_picture": sender.profile_picture if sender else None
+    }
+
+def unread_count_lateral(membership) -> Lateral:
+    """
+    LATERAL subquery counting a membership's unread messages (unread_count)
+    
+    Counts the messages after the member's read cursor that others sent, by
+    a range scan of ix_chat_messages_chat_group_id_id stopping at
+    CHAT_UNREAD_COUNT_MAX. membership is ChatMember or a subquery with its
+    chat_group_id, user_id and last_read_message_id columns.
+    """
+    columns = membership if membership is ChatMember else membership.c
+    unread = (
+        select(ChatMessage.id)
+        .filter(
+            ChatMessage.chat_group_id == columns.chat_group_id,
+            ChatMessage.id > func.coalesce(columns.last_read_message_id, 0),
+            ChatMessage.user_id != columns.user_id
+        )
+        .limit(settings.CHAT_UNREAD_COUNT_MAX)
+        .correlate(membership)
+        .subquery()
+    )
+    return select(func.count().label("unread_count")).select_from(unread).lateral("unread")
+
+async def reserve_message_seqs(db: AsyncSession, counts: Dict[int, int]) -> Dict[int, int]:
+    """
+    Reserve consecutive message sequence numbers in chat groups
+    
+    Takes {chat_group_id: number of messages} and returns the first reserved
+    seq of each group that exists. The groups stay locked until the caller's
+    transaction ends, so each group's messages commit in seq order.
+    """
+    table = ChatGroup.__table__
+    group_ids = sorted(counts)
+    
+    # Lock in id order, so concurrent writers of overlapping groups cannot deadlock
+    await db.execute(
+        select(table.c.id).where(table.c.id.in_(group_ids)).order_by(table.c.id).with_for_update()
+    )
+    
+    reserved = values(column("id", Integer), column("count", Integer), name="reserved").data(
+        [(group_id, counts[group_id]) for group_id in group_ids]
+    )
+    result = await db.execute(
+        update(table)
+        .where(table.c.id == reserved.c.id)
+        # updated_at is left alone: it tracks changes to the group itself, not its messages
+        .values(last_message_seq=table.c.last_message_seq + reserved.c.count, updated_at=table.c.updated_at)
+        .returning(table.c.id, table.c.last_message_seq)
+    )
+    return {group_id: last_seq - counts[group_id] + 1 for group_id, last_seq in result.all()}
 
 class ChatRepository:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         
-    def get_chat_group_by_id(self, chat_group_id: int) -> Optional[ChatGroup]:
-        return self.db.query(ChatGroup).filter(ChatGroup.id == chat_group_id).first()
+    async def get_chat_group_by_id(self, chat_group_id: int) -> Optional[ChatGroup]:
+        result = await self.db.execute(select(ChatGroup).filter(ChatGroup.id == chat_group_id))
+        return result.scalars().first()
         
-    def get_user(self, user_id: int) -> Optional[User]:
-        return self.db.query(User).filter(User.id == user_id).first()
+    async def get_user(self, user_id: int) -> Optional[User]:
+        result = await self.db.execute(select(User).filter(User.id == user_id))
+        return result.scalars().first()
         
-    def get_chat_groups_for_user(self, user_id: int) -> List[ChatGroup]:
+    async def get_chat_groups_for_user(self, user_id: int) -> List[ChatGroup]:
         """Get all chat groups where the user is a member"""
-        return self.db.query(ChatGroup).join(
-            ChatMember, ChatGroup.id == ChatMember.chat_group_id
-        ).filter(ChatMember.user_id == user_id).all()
+        result = await self.db.execute(
+            select(ChatGroup).join(
+                ChatMember, ChatGroup.id == ChatMember.chat_group_id
+            ).filter(ChatMember.user_id == user_id)
+        )
+        return result.scalars().all()
         
-    def get_direct_chat_between_users(self, user_id1: int, user_id2: int) -> Optional[ChatGroup]:
+    async def get_direct_chat_between_users(self, user_id1: int, user_id2: int) -> Optional[ChatGroup]:
         """Get direct chat between two users if it exists"""
-        # Find chat groups that are direct messages and both users are members
-        user1_groups = set(chat_group.id for chat_group in self.get_chat_groups_for_user(user_id1) if chat_group.is_direct)
-        user2_groups = set(chat_group.id for chat_group in self.get_chat_groups_for_user(user_id2) if chat_group.is_direct)
-        
-        # Find common chat groups
-        common_group_ids = user1_groups.intersection(user2_groups)
-        
-        for group_id in common_group_ids:
-            # Check if this group has exactly 2 members
-            member_count = self.db.query(ChatMember).filter(ChatMember.chat_group_id == group_id).count()
-            if member_count == 2:
-                return self.get_chat_group_by_id(group_id)
-                
-        return None
+        result = await self.db.execute(
+            select(ChatGroup).filter(
+                ChatGroup.min_user_id == min(user_id1, user_id2),
+                ChatGroup.max_user_id == max(user_id1, user_id2)
+            )
+        )
+        return result.scalars().first()
+        
+    async def get_or_create_direct_chat(self, user_id1: int, user_id2: int, name: str) -> ChatGroup:
+        """
+        Get the direct chat between two users, creating it if there is none
+        
+        Safe against concurrent calls for the same pair: the unique user pair
+        key lets exactly one INSERT through, and the others wait for it to
+        commit and then load its chat group. The group and both members are
+        created in one transaction.
+        
+        Raises:
+            ValueError: If both users are the same
+        """
+        if user_id1 == user_id2:
+            raise ValueError("A direct chat needs two different users")
+            
+        table = ChatGroup.__table__
+        min_user_id, max_user_id = min(user_id1, user_id2), max(user_id1, user_id2)
+        
+        result = await self.db.execute(
+            pg_insert(table)
+            .values(name=name, is_direct=True, min_user_id=min_user_id, max_user_id=max_user_id)
+            .on_conflict_do_nothing(index_elements=[table.c.min_user_id, table.c.max_user_id])
+            .returning(table.c.id)
+        )
+        chat_group_id = result.scalar()
         
-    def create_chat_group(self, group_data: ChatGroupCreate) -> ChatGroup:
+        if chat_group_id is not None:
+            # First user is admin, as for other chat groups
+            self.db.add_all([
+                ChatMember(chat_group_id=chat_group_id, user_id=user_id1, is_admin=True),
+                ChatMember(chat_group_id=chat_group_id, user_id=user_id2, is_admin=False)
+            ])
+            await self.db.commit()
+            return await self.get_chat_group_by_id(chat_group_id)
+            
+        await self.db.commit()
+        return await self.get_direct_chat_between_users(min_user_id, max_user_id)
+        
+    async def create_chat_group(self, group_data: ChatGroupCreate) -> ChatGroup:
         """Create a new chat group"""
+        # A direct chat between two users is unique to the pair
+        member_ids = list(dict.fromkeys(group_data.member_ids))
+        if group_data.is_direct and len(member_ids) == 2:
+            return await self.get_or_create_direct_chat(member_ids[0], member_ids[1], group_data.name)
+            
         chat_group = ChatGroup(
             name=group_data.name,
             is_direct=group_data.is_direct
@@ -50,24 +175,27 @@ class ChatRepository:
             chat_group.campaign_id = group_data.campaign_id
             
         self.db.add(chat_group)
-        self.db.commit()
-        self.db.refresh(chat_group)
+        await self.db.commit()
+        await self.db.refresh(chat_group)
         
         # Add members
         for user_id in group_data.member_ids:
             # First member is admin
             is_admin = user_id == group_data.member_ids[0]
-            self.add_chat_member(chat_group.id, user_id, is_admin)
+            await self.add_chat_member(chat_group.id, user_id, is_admin)
             
         return chat_group
         
-    def add_chat_member(self, chat_group_id: int, user_id: int, is_admin: bool = False) -> Optional[ChatMember]:
+    async def add_chat_member(self, chat_group_id: int, user_id: int, is_admin: bool = False) -> Optional[ChatMember]:
         """Add a user to a chat group"""
         # Check if user is already a member
-        existing = self.db.query(ChatMember).filter(
-            ChatMember.chat_group_id == chat_group_id,
-            ChatMember.user_id == user_id
-        ).first()
+        result = await self.db.execute(
+            select(ChatMember).filter(
+                ChatMember.chat_group_id == chat_group_id,
+                ChatMember.user_id == user_id
+            )
+        )
+        existing = result.scalars().first()
         
         if existing:
             return existing
@@ -79,66 +207,291 @@ class ChatRepository:
         )
         
         self.db.add(member)
-        self.db.commit()
-        self.db.refresh(member)
+        await self.db.commit()
+        await self.db.refresh(member)
         
+        if chat_group_cache.get(chat_group_id) is not None:
+            user = await self.get_user(user_id)
+            if user:
+                chat_group_cache.add_member(chat_group_id, user_id, sender_profile(user))
+                
         return member
         
-    def remove_chat_member(self, chat_group_id: int, user_id: int) -> bool:
+    async def remove_chat_member(self, chat_group_id: int, user_id: int) -> bool:
         """Remove a user from a chat group"""
-        deleted = self.db.query(ChatMember).filter(
-            ChatMember.chat_group_id == chat_group_id,
-            ChatMember.user_id == user_id
-        ).delete()
+        result = await self.db.execute(
+            delete(ChatMember).where(
+                ChatMember.chat_group_id == chat_group_id,
+                ChatMember.user_id == user_id
+            )
+        )
+        
+        await self.db.commit()
         
-        self.db.commit()
-        return deleted > 0
+        chat_group_cache.remove_member(chat_group_id, user_id)
+        return result.rowcount > 0
         
-    def is_chat_member(self, chat_group_id: int, user_id: int) -> bool:
+    async def is_chat_member(self, chat_group_id: int, user_id: int) -> bool:
         """Check if a user is a member of a chat group"""
-        return self.db.query(ChatMember).filter(
-            ChatMember.chat_group_id == chat_group_id,
-            ChatMember.user_id == user_id
-        ).first() is not None
+        result = await self.db.execute(
+            select(ChatMember.id).filter(
+                ChatMember.chat_group_id == chat_group_id,
+                ChatMember.user_id == user_id
+            )
+        )
+        return result.first() is not None
+        
+    async def get_contacts_among(self, user_id: int, user_ids: List[int]) -> Set[int]:
+        """The user_ids that share at least one chat group with the user (the user included)"""
+        mine = aliased(ChatMember)
+        theirs = aliased(ChatMember)
+        result = await self.db.execute(
+            select(theirs.user_id).distinct()
+            .join(mine, mine.chat_group_id == theirs.chat_group_id)
+            .filter(mine.user_id == user_id, theirs.user_id.in_(user_ids))
+        )
+        contacts = set(result.scalars().all())
+        if user_id in user_ids:
+            contacts.add(user_id)
+        return contacts
         
-    def get_chat_group_members(self, chat_group_id: int) -> List[ChatMember]:
+    async def get_chat_group_members(self, chat_group_id: int) -> List[ChatMember]:
         """Get all members of a chat group"""
-        return self.db.query(ChatMember).filter(
-            ChatMember.chat_group_id == chat_group_id
-        ).all()
+        # Eager-load the member's user, since lazy loading is unavailable on an AsyncSession
+        result = await self.db.execute(
+            select(ChatMember).options(
+                selectinload(ChatMember.user)
+            ).filter(ChatMember.chat_group_id == chat_group_id)
+        )
+        return result.scalars().all()
+        
+    async def get_cached_chat_group(self, chat_group_id: int) -> Optional[CachedChatGroup]:
+        """Get a chat group's members and their profiles from the cache, loading them on a miss"""
+        cached = chat_group_cache.get(chat_group_id)
+        if cached is not None:
+            return cached
+            
+        chat_group = await self.get_chat_group_by_id(chat_group_id)
+        if not chat_group:
+            return None
+            
+        result = await self.db.execute(
+            select(ChatMember.user_id, User).join(
+                User, User.id == ChatMember.user_id
+            ).filter(ChatMember.chat_group_id == chat_group_id)
+        )
+        members = [(user_id, sender_profile(user)) for user_id, user in result.all()]
+        
+        return chat_group_cache.put(chat_group_id, chat_group.name, members)
+        
+    async def get_chat_messages(
+        self, chat_group_id: int, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Get one page of messages from a chat group, newest first, with the cursor of the next (older) page
         
-    def get_chat_messages(self, chat_group_id: int, limit: int = 50, before_id: Optional[int] = None) -> List[ChatMessage]:
-        """Get messages from a chat group, with pagination"""
-        query = self.db.query(ChatMessage).filter(ChatMessage.chat_group_id == chat_group_id)
+        Messages come with their sender's name and picture, loaded by the same
+        query. The first page of a group with live sockets on this worker is
+        served from recent_messages when it holds enough messages.
+        """
+        if not cursor:
+            buffered = recent_messages.latest(chat_group_id, limit)
+            if buffered is not None:
+                messages, has_more = buffered
+                return messages, encode_cursor([messages[-1]["id"]]) if has_more and messages else None
+                
+        query = (
+            select(ChatMessage)
+            .options(joinedload(ChatMessage.sender).load_only(User.name, User.profile_picture))
+            .filter(ChatMessage.chat_group_id == chat_group_id)
+        )
+        rows, next_cursor = await paginate(self.db, query, [ChatMessage.id], limit, cursor)
+        messages = [
+            message_payload(
+                message,
+                SenderProfile(message.sender.name, message.sender.profile_picture, None) if message.sender else None
+            )
+            for message in rows
+        ]
+        
+        # A lagging replica could miss messages broadcast before the buffer was
+        # tracked, so only primary reads may prime it
+        if not cursor and (read_engine is None or self.db.bind is not read_engine):
+            recent_messages.prime(chat_group_id, messages, complete=next_cursor is None)
+            
+        return messages, next_cursor
+        
+    async def get_messages_after(self, chat_group_id: int, seq: int, limit: int) -> List[dict]:
+        """Get up to limit messages of a chat group after a seq, oldest first, with sender info"""
+        result = await self.db.execute(
+            select(ChatMessage)
+            .options(joinedload(ChatMessage.sender).load_only(User.name, User.profile_picture))
+            .filter(ChatMessage.chat_group_id == chat_group_id, ChatMessage.seq > seq)
+            .order_by(ChatMessage.seq)
+            .limit(limit)
+        )
+        return [
+            message_payload(
+                message,
+                SenderProfile(message.sender.name, message.sender.profile_picture, None) if message.sender else None
+            )
+            for message in result.scalars().all()
+        ]
         
-        if before_id:
-            query = query.filter(ChatMessage.id < before_id)
+    async def message_in_group(self, chat_group_id: int, message_id: int) -> bool:
+        """Check that a message belongs to a chat group"""
+        if recent_messages.contains(chat_group_id, message_id):
+            return True
             
-        return query.order_by(ChatMessage.id.desc()).limit(limit).all()
+        result = await self.db.execute(
+            select(ChatMessage.id).filter(
+                ChatMessage.chat_group_id == chat_group_id,
+                ChatMessage.id == message_id
+            )
+        )
+        return result.first() is not None
+        
+    async def get_unread_counts(self, user_id: int) -> List[Dict[str, Any]]:
+        """
+        Get the read cursor and unread message count of every chat group of a user
+        
+        One query: each membership counts the messages after its cursor with a
+        range scan of ix_chat_messages_chat_group_id_id, stopping at
+        CHAT_UNREAD_COUNT_MAX. The user's own messages are not unread.
+        """
+        unread = unread_count_lateral(ChatMember)
+        result = await self.db.execute(
+            select(
+                ChatMember.chat_group_id,
+                ChatMember.last_read_message_id,
+                unread.c.unread_count
+            )
+            .join(unread, true())
+            .filter(ChatMember.user_id == user_id)
+            .order_by(ChatMember.chat_group_id)
+        )
+        return [dict(row._mapping) for row in result]
+        
+    async def get_inbox(
+        self, user_id: int, limit: int = 20, cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get one page of a user's chat groups, most recently active first, with
+        each group's last message, unread count and member count
+        
+        One query: the groups are ordered by their last message (one index
+        probe per membership) and paged first, then only the page's groups
+        are joined with the message, its sender and the counts.
+        
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        last_message = (
+            select(ChatMessage.id, ChatMessage.created_at)
+            .filter(ChatMessage.chat_group_id == ChatMember.chat_group_id)
+            .order_by(ChatMessage.id.desc())
+            .limit(1)
+            .lateral("last_message")
+        )
+        memberships = (
+            select(
+                ChatMember.chat_group_id,
+                ChatMember.user_id,
+                ChatMember.last_read_message_id,
+                last_message.c.id.label("last_message_id"),
+                # Groups without messages rank by when they were created
+                func.coalesce(last_message.c.created_at, ChatGroup.created_at).label("activity_at")
+            )
+            .join(ChatGroup, ChatGroup.id == ChatMember.chat_group_id)
+            .outerjoin(last_message, true())
+            .filter(ChatMember.user_id == user_id)
+            .subquery("memberships")
+        )
+        keys = [memberships.c.activity_at, memberships.c.chat_group_id]
+        page = keyset_page(select(memberships), keys, limit, cursor).subquery("page")
+        
+        unread = unread_count_lateral(page)
+        other_member = aliased(ChatMember)
+        member_count = (
+            select(func.count().label("member_count"))
+            .filter(other_member.chat_group_id == page.c.chat_group_id)
+            .lateral("member_count")
+        )
+        result = await self.db.execute(
+            select(
+                page.c.chat_group_id,
+                page.c.activity_at,
+                page.c.last_read_message_id,
+                ChatGroup.name,
+                ChatGroup.is_direct,
+                unread.c.unread_count,
+                member_count.c.member_count,
+                ChatMessage.id.label("message_id"),
+                ChatMessage.content,
+                ChatMessage.message_type,
+                ChatMessage.user_id,
+                ChatMessage.created_at,
+                User.name.label("sender_name")
+            )
+            .select_from(page)
+            .join(ChatGroup, ChatGroup.id == page.c.chat_group_id)
+            .join(unread, true())
+            .join(member_count, true())
+            .outerjoin(ChatMessage, ChatMessage.id == page.c.last_message_id)
+            .outerjoin(User, User.id == ChatMessage.user_id)
+            .order_by(*[page.c[key.key].desc() for key in keys])
+        )
+        rows, next_cursor = page_rows(result.all(), keys, limit)
+        
+        entries = [
+            {
+                "chat_group_id": row.chat_group_id,
+                "name": row.name,
+                "is_direct": row.is_direct,
+                "member_count": row.member_count,
+                "unread_count": row.unread_count,
+                "last_read_message_id": row.last_read_message_id,
+                "activity_at": row.activity_at,
+                "last_message": {
+                    "id": row.message_id,
+                    "content": row.content,
+                    "message_type": row.message_type,
+                    "user_id": row.user_id,
+                    "sender_name": row.sender_name or "",
+                    "created_at": row.created_at
+                } if row.message_id is not None else None
+            }
+            for row in rows
+        ]
+        return entries, next_cursor
         
-    def create_message(self, chat_group_id: int, user_id: int, content: str, message_type: str = "text") -> ChatMessage:
+    async def create_message(self, chat_group_id: int, user_id: int, content: str, message_type: str = "text") -> ChatMessage:
         """Create a new chat message"""
+        seqs = await reserve_message_seqs(self.db, {chat_group_id: 1})
         message = ChatMessage(
             chat_group_id=chat_group_id,
             user_id=user_id,
+            seq=seqs.get(chat_group_id),
             content=content,
             message_type=message_type
         )
         
+        # id and created_at come back from the INSERT's RETURNING clause (eager_defaults)
         self.db.add(message)
-        self.db.commit()
-        self.db.refresh(message)
+        await self.db.commit()
         
         return message
         
-    def delete_message(self, message_id: int) -> bool:
+    async def delete_message(self, message_id: int) -> bool:
         """Delete a chat message"""
-        message = self.db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+        result = await self.db.execute(select(ChatMessage).filter(ChatMessage.id == message_id))
+        message = result.scalars().first()
         
         if not message:
             return False
             
-        self.db.delete(message)
-        self.db.commit()
+        await self.db.delete(message)
+        await self.db.commit()
+        recent_messages.remove(message.chat_group_id, message.id)
         
-        return True 
\ No newline at end of file
+        return True
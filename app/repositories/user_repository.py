@@ -1,32 +1,38 @@
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import text
+from sqlalchemy import select, insert, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
+from app.core.auth import principal_cache
+from app.repositories.chat_repository import chat_group_cache, sender_profile
 from app.models.user import User, friendship
 from app.schemas.user import UserCreate, UserUpdate, UserLocationUpdate
+from app.utils.spatial import geography_point, nearby_query, with_distance
 
 class UserRepository:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
-        return self.db.query(User).filter(User.id == user_id).first()
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
+        result = await self.db.execute(select(User).filter(User.id == user_id))
+        return result.scalars().first()
         
-    def get_user_by_email(self, email: str) -> Optional[User]:
-        return self.db.query(User).filter(User.email == email).first()
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        result = await self.db.execute(select(User).filter(User.email == email))
+        return result.scalars().first()
         
-    def get_user_by_google_id(self, google_id: str) -> Optional[User]:
-        return self.db.query(User).filter(User.google_id == google_id).first()
+    async def get_user_by_google_id(self, google_id: str) -> Optional[User]:
+        result = await self.db.execute(select(User).filter(User.google_id == google_id))
+        return result.scalars().first()
         
-    def create_user(self, **user_data) -> User:
+    async def create_user(self, **user_data) -> User:
         user = User(**user_data)
         self.db.add(user)
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await self.db.refresh(user)
         return user
         
-    def update_user(self, user_id: int, user_data: UserUpdate) -> Optional[User]:
-        user = self.get_user_by_id(user_id)
+    async def update_user(self, user_id: int, user_data: UserUpdate) -> Optional[User]:
+        user = await self.get_user_by_id(user_id)
         if not user:
             return None
             
@@ -38,74 +44,94 @@ class UserRepository:
         if user_data.latitude and user_data.longitude:
             user.latitude = user_data.latitude
             user.longitude = user_data.longitude
-            user.location = text(f"ST_SetSRID(ST_MakePoint({user_data.longitude}, {user_data.latitude}), 4326)")
+            user.location = geography_point(user_data.latitude, user_data.longitude)
             
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+        principal_cache.invalidate(user_id)
+        chat_group_cache.update_profile(user_id, sender_profile(user))
         return user
         
-    def update_user_location(self, user_id: int, location_data: UserLocationUpdate) -> Optional[User]:
-        user = self.get_user_by_id(user_id)
+    async def update_user_location(self, user_id: int, location_data: UserLocationUpdate) -> Optional[User]:
+        user = await self.get_user_by_id(user_id)
         if not user:
             return None
             
         user.latitude = location_data.latitude
         user.longitude = location_data.longitude
-        user.location = text(f"ST_SetSRID(ST_MakePoint({location_data.longitude}, {location_data.latitude}), 4326)")
+        user.location = geography_point(location_data.latitude, location_data.longitude)
         
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+        principal_cache.invalidate(user_id)
         return user
         
-    def update_fcm_token(self, user_id: int, fcm_token: str) -> Optional[User]:
-        user = self.get_user_by_id(user_id)
+    async def update_fcm_token(self, user_id: int, fcm_token: str) -> Optional[User]:
+        user = await self.get_user_by_id(user_id)
         if not user:
             return None
             
         user.fcm_token = fcm_token
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+        principal_cache.invalidate(user_id)
+        chat_group_cache.update_profile(user_id, sender_profile(user))
         return user
         
-    def get_nearby_users(self, latitude: float, longitude: float, radius_km: float, limit: int = 50) -> List[User]:
-        """Get users within a certain radius (in kilometers)"""
-        point = f"ST_SetSRID(ST_MakePoint({longitude}, {latitude}), 4326)"
-        
-        nearby_users = self.db.query(User).filter(
-            text(f"ST_DWithin(location, {point}::geography, {radius_km * 1000})")
-        ).limit(limit).all()
-        
-        return nearby_users
-        
-    def get_user_friends(self, user_id: int) -> List[User]:
-        user = self.get_user_by_id(user_id)
-        if not user:
-            return []
-            
-        return user.friends
-        
-    def add_friend(self, user_id: int, friend_id: int) -> bool:
-        user = self.get_user_by_id(user_id)
-        friend = self.get_user_by_id(friend_id)
+    async def get_nearby_users(self, latitude: float, longitude: float, radius_km: float, limit: int = 50) -> List[User]:
+        """Get users within a certain radius (in kilometers), with distance_m set on each"""
+        query, distance = nearby_query(User, latitude, longitude, radius_km)
+        
+        result = await self.db.execute(query.limit(limit))
+        
+        return with_distance(result.all())
+        
+    async def get_user_friends(self, user_id: int) -> List[User]:
+        # Query the association table directly; lazy-loading User.friends is
+        # not available on an AsyncSession
+        result = await self.db.execute(
+            select(User).join(
+                friendship, User.id == friendship.c.friend_id
+            ).filter(friendship.c.user_id == user_id)
+        )
+        return result.scalars().all()
+        
+    async def is_friend(self, user_id: int, friend_id: int) -> bool:
+        result = await self.db.execute(
+            select(friendship.c.friend_id).filter(
+                friendship.c.user_id == user_id,
+                friendship.c.friend_id == friend_id
+            )
+        )
+        return result.first() is not None
+        
+    async def add_friend(self, user_id: int, friend_id: int) -> bool:
+        user = await self.get_user_by_id(user_id)
+        friend = await self.get_user_by_id(friend_id)
         
         if not user or not friend:
             return False
             
-        if friend not in user.friends:
-            user.friends.append(friend)
-            self.db.commit()
+        if not await self.is_friend(user_id, friend_id):
+            await self.db.execute(insert(friendship).values(user_id=user_id, friend_id=friend_id))
+            await self.db.commit()
             
         return True
         
-    def remove_friend(self, user_id: int, friend_id: int) -> bool:
-        user = self.get_user_by_id(user_id)
-        friend = self.get_user_by_id(friend_id)
+    async def remove_friend(self, user_id: int, friend_id: int) -> bool:
+        user = await self.get_user_by_id(user_id)
+        friend = await self.get_user_by_id(friend_id)
         
         if not user or not friend:
             return False
             
-        if friend in user.friends:
-            user.friends.remove(friend)
-            self.db.commit()
+        if await self.is_friend(user_id, friend_id):
+            await self.db.execute(
+                delete(friendship).where(
+                    friendship.c.user_id == user_id,
+                    friendship.c.friend_id == friend_id
+                )
+            )
+            await self.db.commit()
             
-        return True 
\ No newline at end of file
+        return True
@@ -5,4 +5,5 @@ from app.schemas.campaign import *
 from app.schemas.business import *
 from app.schemas.chat import *
 from app.schemas.review import *
-from app.schemas.ai import * 
\ No newline at end of file
+from app.schemas.ai import *
+from app.schemas.pagination import *
\ No newline at end of file
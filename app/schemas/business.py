@@ -36,6 +36,8 @@ class Business(BusinessBase):
     created_at: datetime
     updated_at: datetime
     is_verified: bool
+    # Only set by nearby searches (meters from the search point)
+    distance_m: Optional[float] = None
     
     class Config:
         orm_mode = True 
\ No newline at end of file
@@ -51,6 +51,8 @@ class Campaign(CampaignBase):
     creator_id: int
     chat_group_id: Optional[int] = None
     participant_count: Optional[int] = None
+    # Only set by nearby searches (meters from the search point)
+    distance_m: Optional[float] = None
     
     class Config:
         orm_mode = True
@@ -15,6 +15,7 @@ class Message(MessageBase):
     created_at: datetime
     chat_group_id: int
     user_id: int
+    seq: Optional[int] = None  # Counts up by one within the chat group
     sender_name: str
     sender_profile_picture: Optional[str] = None
     
@@ -42,9 +43,43 @@ class ChatGroup(ChatGroupBase):
 class ChatGroupWithMembers(ChatGroup):
     members: List[int]  # User IDs
     
+# Read cursor schemas
+class MarkRead(BaseModel):
+    message_id: int  # Newest message the user has read
+    
+class UnreadCount(BaseModel):
+    chat_group_id: int
+    last_read_message_id: Optional[int] = None
+    unread_count: int  # Stops at CHAT_UNREAD_COUNT_MAX
+    
+# Inbox schemas
+class InboxLastMessage(BaseModel):
+    id: int
+    content: str
+    message_type: str = "text"
+    user_id: int
+    sender_name: str
+    created_at: datetime
+    
+class InboxEntry(BaseModel):
+    chat_group_id: int
+    name: str
+    is_direct: bool = False
+    member_count: int
+    unread_count: int  # Stops at CHAT_UNREAD_COUNT_MAX
+    last_read_message_id: Optional[int] = None
+    activity_at: datetime  # Last message time, or creation time of a group without messages
+    last_message: Optional[InboxLastMessage] = None
+    
+# Presence schemas
+class UserPresence(BaseModel):
+    user_id: int
+    online: bool  # Connected to the worker that answered (presence is not shared between workers)
+    last_seen: Optional[datetime] = None  # When the user's last socket on that worker closed
+    
 # WebSocket message schemas
 class WSMessageBase(BaseModel):
-    type: str  # "message", "join", "leave"
+    type: str  # "message", "presence", "read", "ping", "pong"
     
 class WSMessageSend(WSMessageBase):
     type: str = "message"
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Generic, List, Optional, TypeVar
+
+ItemT = TypeVar("ItemT")
+
+# Schema for one page of a cursor-paginated list
+class Page(BaseModel, Generic[ItemT]):
+    items: List[ItemT]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to get the next page
@@ -36,6 +36,13 @@ class User(UserBase):
     class Config:
         orm_mode = True
         
+# Lightweight snapshot of the authenticated user, cached by get_current_user
+# (only what request handlers need; load the User for profile data)
+class UserPrincipal(BaseModel):
+    id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+    
 # Schema for user location update
 class UserLocationUpdate(BaseModel):
     latitude: float
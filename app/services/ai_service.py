@@ -1,6 +1,6 @@
 import httpx
 from typing import Dict, List, Optional, Any
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.repositories.campaign_repository import CampaignRepository
@@ -9,7 +9,7 @@ from app.services.notification_service import NotificationService
 from app.schemas.ai import CaptionGenerateRequest, CaptionGenerateResponse, RecommendationPushRequest, RecommendationPushResponse
 
 class AIService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.campaign_repo = CampaignRepository(db)
         self.user_repo = UserRepository(db)
@@ -52,7 +52,7 @@ class AIService:
         1. Call AI service to get recommended users
         2. Send notifications to those users
         """
-        campaign = self.campaign_repo.get_campaign_by_id(request.campaign_id)
+        campaign = await self.campaign_repo.get_campaign_by_id(request.campaign_id)
         if not campaign:
             return RecommendationPushResponse(
                 notified_users_count=0,
@@ -62,7 +62,7 @@ class AIService:
         if settings.APP_ENV == "development":
             # In development mode, use simple proximity-based recommendation
             # Get nearby users within radius
-            nearby_users = self.user_repo.get_nearby_users(
+            nearby_users = await self.user_repo.get_nearby_users(
                 campaign.latitude, 
                 campaign.longitude,
                 request.radius_km,
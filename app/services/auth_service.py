@@ -1,7 +1,7 @@
 import httpx
 import json
 from typing import Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
 from app.core.auth import create_access_token
@@ -64,7 +64,7 @@ class AuthService:
             )
     
     @staticmethod
-    def authenticate_user(db: Session, google_user: GoogleUser, fcm_token: Optional[str] = None) -> tuple:
+    async def authenticate_user(db: AsyncSession, google_user: GoogleUser, fcm_token: Optional[str] = None) -> tuple:
         """
         Authenticate a user with Google credentials
         Returns (user, token, is_new_user)
@@ -72,12 +72,12 @@ class AuthService:
         user_repo = UserRepository(db)
         
         # Check if user exists
-        user = user_repo.get_user_by_google_id(google_user.id)
+        user = await user_repo.get_user_by_google_id(google_user.id)
         is_new_user = False
         
         # Create new user if doesn't exist
         if not user:
-            user = user_repo.create_user(
+            user = await user_repo.create_user(
                 email=google_user.email,
                 name=google_user.name,
                 profile_picture=google_user.picture,
@@ -87,7 +87,7 @@ class AuthService:
             is_new_user = True
         elif fcm_token:
             # Update FCM token if provided
-            user = user_repo.update_fcm_token(user.id, fcm_token)
+            user = await user_repo.update_fcm_token(user.id, fcm_token)
             
         # Create access token
         token_data = {"sub": str(user.id)}
@@ -0,0 +1,213 @@
+import asyncio
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import asyncpg
+import orjson
+
+from app.core.config import settings
+from app.core.database import async_url
+
+# Called with (chat_group_id, event) for every event published to a subscribed group
+EventHandler = Callable[[int, dict], Awaitable[None]]
+
+# Called after the broker reconnects, since events published meanwhile were lost
+ReconnectHandler = Callable[[], None]
+
+class ChatBroker(ABC):
+    """
+    Fan-out of chat events between workers
+
+    publish() sends an event to every worker subscribed to the chat group,
+    including this one; subscribed workers receive it through the handler set
+    by ConnectionManager. Workers only subscribe to groups they have local
+    sockets for.
+    """
+    def __init__(self):
+        self.handler: Optional[EventHandler] = None
+        self.on_reconnect: Optional[ReconnectHandler] = None
+        self.subscriptions: Set[int] = set()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, chat_group_id: int):
+        self.subscriptions.add(chat_group_id)
+
+    async def unsubscribe(self, chat_group_id: int):
+        self.subscriptions.discard(chat_group_id)
+
+    @abstractmethod
+    async def publish(self, chat_group_id: int, event: dict):
+        """Send an event to every worker subscribed to the chat group"""
+
+    async def deliver(self, chat_group_id: int, event: dict):
+        if self.handler is not None and chat_group_id in self.subscriptions:
+            await self.handler(chat_group_id, event)
+
+class InMemoryChatBroker(ChatBroker):
+    """Single-process broker: events go straight to this worker's sockets"""
+    async def publish(self, chat_group_id: int, event: dict):
+        await self.deliver(chat_group_id, event)
+
+# NOTIFY payloads must be shorter than 8000 bytes; larger events are split into
+# chunks of at most this many characters (4 bytes each at worst in UTF-8)
+NOTIFY_PAYLOAD_LIMIT = 7999
+NOTIFY_CHUNK_CHARS = 1900
+CHUNK_PREFIX = "#"
+
+class PostgresChatBroker(ChatBroker):
+    """
+    Broker on PostgreSQL LISTEN/NOTIFY, one channel per chat group
+
+    A dedicated connection (outside the SQLAlchemy pool) listens on the
+    channels of subscribed groups; events are published with pg_notify on a
+    second dedicated connection. Notifications are dispatched one at a time,
+    so each worker sees a group's events in publish order. asyncpg runs one
+    operation at a time per connection, so every LISTEN, UNLISTEN and
+    reconnect on the listening connection holds listen_lock.
+    """
+    def __init__(self, dsn: str, reconnect_delay: float = 1.0):
+        super().__init__()
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.listen_connection: Optional[asyncpg.Connection] = None
+        self.publish_connection: Optional[asyncpg.Connection] = None
+        self.publish_lock = asyncio.Lock()
+        self.listen_lock = asyncio.Lock()
+        self.queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+        self.dispatch_task: Optional[asyncio.Task] = None
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self.partial_events: Dict[str, List[Optional[str]]] = {}
+        self.stopping = False
+
+    @staticmethod
+    def channel(chat_group_id: int) -> str:
+        return f"chat_group_{chat_group_id}"
+
+    async def start(self):
+        self.stopping = False
+        self.dispatch_task = asyncio.create_task(self._dispatch())
+        try:
+            await self._connect_listener()
+        except (OSError, asyncpg.PostgresError) as e:
+            # Keep serving; local delivery resumes once the listener connects
+            print(f"Chat broker connect failed: {e}")
+            self.reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def stop(self):
+        self.stopping = True
+        for task in (self.reconnect_task, self.dispatch_task):
+            if task is not None:
+                task.cancel()
+        for connection in (self.listen_connection, self.publish_connection):
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        self.listen_connection = None
+        self.publish_connection = None
+
+    async def _connect_listener(self):
+        async with self.listen_lock:
+            self.partial_events.clear()
+            self.listen_connection = await asyncpg.connect(self.dsn)
+            self.listen_connection.add_termination_listener(self._on_listener_lost)
+            for chat_group_id in list(self.subscriptions):
+                await self.listen_connection.add_listener(self.channel(chat_group_id), self._on_notification)
+
+    def _on_listener_lost(self, connection):
+        if not self.stopping and (self.reconnect_task is None or self.reconnect_task.done()):
+            self.reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        # Events published while disconnected are lost; clients recover them
+        # from the message history, and on_reconnect lets state built from
+        # events be rebuilt
+        while not self.stopping:
+            try:
+                await self._connect_listener()
+                if self.on_reconnect is not None:
+                    self.on_reconnect()
+                return
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f"Chat broker reconnect failed: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def subscribe(self, chat_group_id: int):
+        async with self.listen_lock:
+            if chat_group_id in self.subscriptions:
+                return
+            # Recorded only once LISTEN succeeded, so a failed subscribe is
+            # retried by the next one; while disconnected, the reconnect LISTENs
+            if self.listen_connection is not None and not self.listen_connection.is_closed():
+                await self.listen_connection.add_listener(self.channel(chat_group_id), self._on_notification)
+            self.subscriptions.add(chat_group_id)
+
+    async def unsubscribe(self, chat_group_id: int):
+        async with self.listen_lock:
+            if chat_group_id not in self.subscriptions:
+                return
+            # Dropped first: deliver() ignores the group even if UNLISTEN fails
+            self.subscriptions.discard(chat_group_id)
+            if self.listen_connection is not None and not self.listen_connection.is_closed():
+                await self.listen_connection.remove_listener(self.channel(chat_group_id), self._on_notification)
+
+    async def publish(self, chat_group_id: int, event: dict):
+        payload = orjson.dumps(event).decode()
+        if len(payload.encode()) <= NOTIFY_PAYLOAD_LIMIT:
+            payloads = [payload]
+        else:
+            event_id = uuid.uuid4().hex
+            chunks = [payload[i:i + NOTIFY_CHUNK_CHARS] for i in range(0, len(payload), NOTIFY_CHUNK_CHARS)]
+            payloads = [
+                f"{CHUNK_PREFIX}{event_id}:{index}:{len(chunks)}:{chunk}"
+                for index, chunk in enumerate(chunks)
+            ]
+
+        channel = self.channel(chat_group_id)
+        async with self.publish_lock:
+            if self.publish_connection is None or self.publish_connection.is_closed():
+                self.publish_connection = await asyncpg.connect(self.dsn)
+
+            # One transaction, so the chunks of an event arrive together and in order
+            async with self.publish_connection.transaction():
+                for payload in payloads:
+                    await self.publish_connection.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        self.queue.put_nowait((channel, payload))
+
+    def _reassemble(self, payload: str) -> Optional[str]:
+        """Collect the chunks of a split event, returning the full payload once complete"""
+        event_id, index, total, chunk = payload[len(CHUNK_PREFIX):].split(":", 3)
+        chunks = self.partial_events.setdefault(event_id, [None] * int(total))
+        chunks[int(index)] = chunk
+        if any(part is None for part in chunks):
+            return None
+
+        del self.partial_events[event_id]
+        return "".join(chunks)
+
+    async def _dispatch(self):
+        while True:
+            channel, payload = await self.queue.get()
+            try:
+                if payload.startswith(CHUNK_PREFIX):
+                    payload = self._reassemble(payload)
+                    if payload is None:
+                        continue
+
+                chat_group_id = int(channel.rsplit("_", 1)[1])
+                await self.deliver(chat_group_id, orjson.loads(payload))
+            except Exception as e:
+                print(f"Chat broker dispatch error: {e}")
+
+def create_chat_broker() -> ChatBroker:
+    """Create the broker selected by CHAT_BROKER"""
+    if settings.CHAT_BROKER == "postgres":
+        # asyncpg takes a plain postgresql:// DSN
+        return PostgresChatBroker(async_url.replace("postgresql+asyncpg://", "postgresql://", 1))
+    return InMemoryChatBroker()
@@ -0,0 +1,205 @@
+import asyncio
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import orjson
+from fastapi import WebSocket
+
+# MessagePack is optional: without it every client gets JSON
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+# Close code sent to clients dropped for not keeping up ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# Close code sent to clients reaped for missing heartbeats ("Going Away")
+HEARTBEAT_TIMEOUT_CLOSE_CODE = 1001
+
+# Websocket subprotocol for MessagePack binary frames; clients offering none get JSON text frames
+MSGPACK_SUBPROTOCOL = "juka.msgpack.v1"
+
+# Fields of a chat message sent once per sender, not with every message, on MessagePack connections
+SENDER_FIELDS = ("sender_name", "sender_profile_picture")
+
+def choose_subprotocol(offered: List[str]) -> Optional[str]:
+    """The subprotocol to accept out of those a client offered (None: plain JSON)"""
+    if HAS_MSGPACK and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK_SUBPROTOCOL
+    return None
+
+def decode_frame(data: Union[str, bytes]) -> Any:
+    """Parse a frame from a client: JSON text, or MessagePack binary"""
+    if isinstance(data, bytes) and HAS_MSGPACK:
+        return msgpack.unpackb(data)
+    return orjson.loads(data)
+
+def _msgpack_default(value: Any) -> Any:
+    # Same representation as orjson gives these in JSON frames
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+class Frame:
+    """
+    A websocket message, serialized at most once per protocol and shared by every recipient
+
+    On MessagePack connections chat messages leave out the sender's name and
+    picture: each connection is sent a {"type": "sender", "user_id", "name",
+    "profile_picture"} frame the first time it sees a sender (or when their
+    profile changes), and the client looks it up by the message's user_id.
+    """
+    __slots__ = ("message", "sender", "_text", "_binary", "_sender_binary")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self._text: Optional[str] = None
+        self._binary: Optional[bytes] = None
+        self._sender_binary: Optional[bytes] = None
+
+        # (user_id, name, profile_picture) of a chat message's sender
+        self.sender: Optional[Tuple[int, Optional[str], Optional[str]]] = None
+        payload = message.get("message") if message.get("type") == "message" else None
+        if isinstance(payload, dict) and "user_id" in payload:
+            self.sender = (payload["user_id"], payload.get("sender_name"), payload.get("sender_profile_picture"))
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = orjson.dumps(self.message).decode()
+        return self._text
+
+    def binary(self) -> bytes:
+        if self._binary is None:
+            message = self.message
+            if self.sender is not None:
+                payload = {key: value for key, value in message["message"].items() if key not in SENDER_FIELDS}
+                message = {**message, "message": payload}
+            self._binary = msgpack.packb(message, default=_msgpack_default)
+        return self._binary
+
+    def sender_binary(self) -> bytes:
+        if self._sender_binary is None:
+            user_id, name, profile_picture = self.sender
+            self._sender_binary = msgpack.packb(
+                {"type": "sender", "user_id": user_id, "name": name, "profile_picture": profile_picture},
+                default=_msgpack_default
+            )
+        return self._sender_binary
+
+class ClientConnection:
+    """
+    One websocket with a bounded outbound queue drained by its own writer task
+
+    send() never waits: a client whose queue is full, or whose oldest unsent
+    frame is older than max_lag seconds, is treated as a slow consumer and
+    disconnected so that it cannot hold back the rest of its chat group.
+
+    Args:
+        websocket: Accepted websocket
+        user_id: Connected user
+        max_queue: Maximum number of frames waiting to be sent
+        max_lag: Seconds the oldest unsent frame may wait before the client is dropped
+        protocol: Negotiated subprotocol (None: JSON)
+    """
+    def __init__(
+        self, websocket: WebSocket, user_id: int, max_queue: int, max_lag: float, protocol: Optional[str] = None
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.protocol = protocol
+        self.chat_group_ids: Set[int] = set()  # Chat groups the socket is subscribed to
+        # chat_group_id -> live (seq, frame) held back while missed messages are replayed
+        self.held: Dict[int, List[Tuple[Optional[int], Frame]]] = {}
+        # user_id -> (name, profile_picture) already sent to a MessagePack client
+        self.senders: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        self.max_lag = max_lag
+        self.queue: "asyncio.Queue[tuple]" = asyncio.Queue(maxsize=max_queue)
+        self.writer_task: Optional[asyncio.Task] = None
+
+        # Enqueue time of the frame being written, None while the writer is idle
+        self.sending_since: Optional[float] = None
+
+        self.frames_sent = 0
+        self.dropped = False
+        self.closed = False
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._writer())
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def lag(self) -> float:
+        """Seconds the oldest undelivered frame has been waiting"""
+        if self.sending_since is None:
+            return 0.0
+        return time.monotonic() - self.sending_since
+
+    def send(self, frame: Frame) -> bool:
+        """Queue a frame without waiting, returning False if the client was dropped instead"""
+        if self.closed:
+            return False
+
+        if self.lag() > self.max_lag:
+            self.drop()
+            return False
+
+        if self.protocol == MSGPACK_SUBPROTOCOL:
+            data = [frame.binary()]
+            if frame.sender is not None:
+                user_id, name, profile_picture = frame.sender
+                if self.senders.get(user_id) != (name, profile_picture):
+                    self.senders[user_id] = (name, profile_picture)
+                    data.insert(0, frame.sender_binary())
+        else:
+            data = [frame.text()]
+
+        try:
+            for item in data:
+                self.queue.put_nowait((time.monotonic(), item))
+        except asyncio.QueueFull:
+            self.drop()
+            return False
+
+        return True
+
+    def drop(self):
+        """Disconnect a slow consumer; the receive loop then sees the disconnect and cleans up"""
+        if self.closed:
+            return
+
+        self.dropped = True
+        self.close()
+        asyncio.create_task(self._close_websocket())
+
+    def close(self):
+        """Stop the writer task; frames still queued are discarded"""
+        self.closed = True
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+
+    async def _close_websocket(self):
+        try:
+            await self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Slow consumer")
+        except Exception:
+            pass
+
+    async def _writer(self):
+        while True:
+            enqueued_at, data = await self.queue.get()
+            self.sending_since = enqueued_at
+            try:
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+            except Exception:
+                # The socket is gone; the receive loop handles the disconnect
+                self.closed = True
+                return
+            self.sending_since = None
+            self.frames_sent += 1
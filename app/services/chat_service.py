@@ -1,155 +1,528 @@
-import json
-from typing import Dict, Set, List, Optional, Any
+import asyncio
+from typing import Dict, Set, List, Optional
 from fastapi import WebSocket
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.repositories.chat_repository import ChatRepository
+from app.repositories.chat_repository import (
+    ChatRepository, chat_group_cache, message_payload, recent_messages, sender_profile
+)
+from app.core.config import settings
+from app.services.chat_broker import ChatBroker, create_chat_broker
+from app.services.chat_connection import (
+    HEARTBEAT_TIMEOUT_CLOSE_CODE, MSGPACK_SUBPROTOCOL, ClientConnection, Frame, choose_subprotocol
+)
+from app.services.message_writer import message_writer
+from app.services.read_cursor_writer import read_cursor_writer
 from app.services.notification_service import NotificationService
+from app.services.presence_service import PresenceService
+from app.utils.chat_cache import CachedChatGroup, SenderProfile
 from app.models.chat import ChatMessage
 
 class ConnectionManager:
-    def __init__(self):
-        # Map of chat_group_id -> set of websocket connections
+    """
+    Websocket connections of this worker, indexed by chat group and by user
+    
+    A socket belongs to one user and can be subscribed to any number of chat
+    groups. Broadcasts go through the chat broker, so that every worker with
+    sockets in the chat group (including this one) delivers them to its own
+    sockets. Delivery only enqueues frames on each connection's send queue, so
+    a slow client never delays the others. Presence tracks which users are
+    online, reaps sockets that stop sending heartbeats and batches the
+    presence changes of each chat group.
+    
+    Clients offering the MessagePack subprotocol get binary frames that
+    reference chat message senders by id (see Frame); everyone else gets JSON.
+    """
+    def __init__(self, broker: ChatBroker, presence: Optional[PresenceService] = None):
+        # Map of chat_group_id -> set of websocket connections subscribed to it
         self.active_connections: Dict[int, Set[WebSocket]] = {}
         
-        # Map of websocket -> (user_id, chat_group_id)
-        self.connection_map: Dict[WebSocket, tuple] = {}
+        # Map of user_id -> set of websocket connections of that user
+        self.user_connections: Dict[int, Set[WebSocket]] = {}
         
-    async def connect(self, websocket: WebSocket, chat_group_id: int, user_id: int):
-        await websocket.accept()
+        # Map of websocket -> its outbound queue, writer and subscriptions
+        self.connection_map: Dict[WebSocket, ClientConnection] = {}
         
+        self.broker = broker
+        self.broker.handler = self.broadcast_local
+        # Events missed while the broker was disconnected leave gaps in the buffers
+        self.broker.on_reconnect = recent_messages.reset
+        
+        # Serializes the broker subscribe/unsubscribe of a group's first and last socket
+        self.group_lock = asyncio.Lock()
+        
+        self.presence = presence or PresenceService(
+            timeout=settings.PRESENCE_TIMEOUT_SECONDS,
+            tick=settings.PRESENCE_TICK_SECONDS,
+            last_seen_ttl=settings.PRESENCE_LAST_SEEN_TTL_SECONDS
+        )
+        self.presence.publisher = self.publish_presence
+        self.presence.on_idle = self.reap
+        
+        # Counters for /internal/chat/connections
+        self.slow_consumers_dropped = 0
+        self.frames_dropped = 0
+        
+    async def connect(self, websocket: WebSocket, user_id: int, reap_idle: bool = True):
+        """
+        Accept an authenticated socket; it receives nothing until subscribed to chat groups
+        
+        Without reap_idle the socket is not closed for missing heartbeats, for
+        clients that never send any.
+        """
+        protocol = choose_subprotocol(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=protocol)
+        
+        connection = ClientConnection(
+            websocket,
+            user_id,
+            max_queue=settings.WS_SEND_QUEUE_SIZE,
+            max_lag=settings.WS_SLOW_CONSUMER_LAG_SECONDS,
+            protocol=protocol
+        )
+        connection.start()
+        
+        self.connection_map[websocket] = connection
+        self.user_connections.setdefault(user_id, set()).add(websocket)
+        self.presence.connected(websocket, user_id, watch=reap_idle)
+        
+    def touch(self, websocket: WebSocket):
+        """Record a heartbeat: any frame received from the socket"""
+        if websocket in self.connection_map:
+            self.presence.touch(websocket)
+        
+    async def subscribe(self, websocket: WebSocket, chat_group_id: int, hold: bool = False):
+        """
+        Start delivering a chat group's events to a socket (membership is checked by the caller)
+        
+        With hold, live frames are kept back until replay() has sent the
+        messages the client missed.
+        """
+        connection = self.connection_map.get(websocket)
+        if connection is None or chat_group_id in connection.chat_group_ids:
+            return
+            
         if chat_group_id not in self.active_connections:
-            self.active_connections[chat_group_id] = set()
+            # First local socket in this group: start receiving its events. The
+            # group is only recorded once the broker subscribed, so after a
+            # failure the next socket subscribes it again
+            async with self.group_lock:
+                if chat_group_id not in self.active_connections:
+                    await self.broker.subscribe(chat_group_id)
+                    self.active_connections[chat_group_id] = set()
+                    recent_messages.track(chat_group_id)
+                    
+            # Disconnected (or subscribed by another frame) meanwhile
+            if self.connection_map.get(websocket) is not connection or chat_group_id in connection.chat_group_ids:
+                await self._release_group(chat_group_id)
+                return
+                
+        if hold:
+            connection.held[chat_group_id] = []
+            
+        # Other users in the chat group learn of it with the next presence batch
+        if not self._user_in_group(connection.user_id, chat_group_id):
+            self.presence.joined(chat_group_id, connection.user_id)
             
         self.active_connections[chat_group_id].add(websocket)
-        self.connection_map[websocket] = (user_id, chat_group_id)
+        connection.chat_group_ids.add(chat_group_id)
+        
+    async def unsubscribe(self, websocket: WebSocket, chat_group_id: int):
+        connection = self.connection_map.get(websocket)
+        if connection is None or chat_group_id not in connection.chat_group_ids:
+            return
+            
+        connection.chat_group_ids.discard(chat_group_id)
+        connection.held.pop(chat_group_id, None)
+        await self._remove_from_group(websocket, chat_group_id, connection.user_id)
         
-        # Notify other users in the chat group
-        await self.broadcast_join(chat_group_id, user_id)
+    def _user_in_group(self, user_id: int, chat_group_id: int) -> bool:
+        """Whether any socket of the user is subscribed to the chat group"""
+        return any(
+            chat_group_id in self.connection_map[websocket].chat_group_ids
+            for websocket in self.user_connections.get(user_id, ())
+        )
         
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.connection_map:
-            user_id, chat_group_id = self.connection_map[websocket]
+    async def _remove_from_group(self, websocket: WebSocket, chat_group_id: int, user_id: int):
+        if chat_group_id in self.active_connections:
+            self.active_connections[chat_group_id].discard(websocket)
+            
+            if not self._user_in_group(user_id, chat_group_id):
+                self.presence.left(chat_group_id, user_id)
             
-            if chat_group_id in self.active_connections:
-                self.active_connections[chat_group_id].discard(websocket)
+            await self._release_group(chat_group_id)
+            
+    async def _release_group(self, chat_group_id: int):
+        """Forget a chat group once no local socket is subscribed to it"""
+        if self.active_connections.get(chat_group_id):
+            return
+            
+        async with self.group_lock:
+            # Checked again: another socket may have subscribed while waiting
+            if self.active_connections.get(chat_group_id):
+                return
+            self.active_connections.pop(chat_group_id, None)
+            chat_group_cache.evict(chat_group_id)
+            recent_messages.evict(chat_group_id)
+            await self.broker.unsubscribe(chat_group_id)
+            
+    async def disconnect(self, websocket: WebSocket) -> Optional[int]:
+        """Forget a socket and all its subscriptions, returning its user_id"""
+        connection = self.connection_map.pop(websocket, None)
+        if connection is None:
+            return None
+            
+        connection.close()
+        self.presence.disconnected(websocket, connection.user_id)
+        
+        user_sockets = self.user_connections.get(connection.user_id)
+        if user_sockets is not None:
+            user_sockets.discard(websocket)
+            if not user_sockets:
+                del self.user_connections[connection.user_id]
                 
-                # Remove chat group if empty
-                if not self.active_connections[chat_group_id]:
-                    del self.active_connections[chat_group_id]
-                    
-            del self.connection_map[websocket]
-            return user_id, chat_group_id
+        for chat_group_id in connection.chat_group_ids:
+            await self._remove_from_group(websocket, chat_group_id, connection.user_id)
             
-        return None, None
+        return connection.user_id
         
-    async def broadcast_join(self, chat_group_id: int, user_id: int):
-        """Broadcast to other users in the chat group that a user has joined"""
-        if chat_group_id in self.active_connections:
-            message = {
-                "type": "join",
-                "user_id": user_id,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+    async def reap(self, websocket: WebSocket):
+        """Close a socket that stopped sending heartbeats (e.g. a half-open mobile connection)"""
+        connection = self.connection_map.get(websocket)
+        if connection is None:
+            return
             
-            await self.broadcast(chat_group_id, message, exclude_user_id=user_id)
+        await self.disconnect(websocket)
+        try:
+            await websocket.close(code=HEARTBEAT_TIMEOUT_CLOSE_CODE, reason="Heartbeat timeout")
+        except Exception:
+            pass
+            
+    async def publish_presence(self, changes: Dict[int, List[dict]]):
+        """Broadcast a batch of presence changes, one frame per chat group"""
+        for chat_group_id, users in changes.items():
+            await self.broadcast(chat_group_id, {
+                "type": "presence",
+                "users": users,
+                "timestamp": datetime.utcnow().isoformat()
+            })
             
     async def broadcast(self, chat_group_id: int, message: dict, exclude_user_id: Optional[int] = None):
-        """Broadcast a message to all connected users in a chat group"""
-        if chat_group_id in self.active_connections:
-            for connection in self.active_connections[chat_group_id]:
-                if exclude_user_id is not None:
-                    # Skip if this connection belongs to the excluded user
-                    conn_user_id, _ = self.connection_map[connection]
-                    if conn_user_id == exclude_user_id:
-                        continue
-                        
-                await connection.send_text(json.dumps(message))
+        """Broadcast a message to all connected users in a chat group, on every worker"""
+        # Tag every frame with its group, since one socket can carry many groups
+        message = {"chat_group_id": chat_group_id, **message}
+        await self.broker.publish(chat_group_id, {"message": message, "exclude_user_id": exclude_user_id})
+        
+    async def broadcast_local(self, chat_group_id: int, event: dict):
+        """Deliver a broker event to this worker's connections in the chat group"""
+        message = event["message"]
+        exclude_user_id = event.get("exclude_user_id")
+        
+        if chat_group_id not in self.active_connections:
+            return
+            
+        seq = None
+        if message.get("type") == "message" and "message" in message:
+            recent_messages.append(chat_group_id, message["message"])
+            seq = message["message"].get("seq")
+            
+        # Serialized at most once per protocol and shared by every recipient
+        frame = Frame(message)
+        for websocket in self.active_connections[chat_group_id]:
+            connection = self.connection_map[websocket]
+            
+            # Skip if this connection belongs to the excluded user
+            if exclude_user_id is not None and connection.user_id == exclude_user_id:
+                continue
+                
+            held = connection.held.get(chat_group_id)
+            if held is not None:
+                held.append((seq, frame))
+                continue
                 
+            self._send(connection, frame)
+            
+    async def replay(self, websocket: WebSocket, chat_group_id: int, messages: List[dict], truncated: bool):
+        """
+        Send the messages a resuming client missed, then switch it to live delivery
+        
+        Live frames held back meanwhile follow a {"type": "resumed"} frame,
+        minus those already replayed. With truncated, more messages were
+        missed than can be replayed and the client should reload its history.
+        """
+        connection = self.connection_map.get(websocket)
+        if connection is None:
+            return
+            
+        held = connection.held.pop(chat_group_id, [])
+        replayed = set()
+        for message in messages:
+            replayed.add(message["seq"])
+            self._send(connection, Frame({"chat_group_id": chat_group_id, "type": "message", "message": message}))
+            
+        self._send(connection, Frame({"chat_group_id": chat_group_id, "type": "resumed", "truncated": truncated}))
+        
+        for seq, frame in held:
+            if seq is None or seq not in replayed:
+                self._send(connection, frame)
+                
+
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send a message to a specific connection"""
-        await websocket.send_text(json.dumps(message))
-        
+        connection = self.connection_map.get(websocket)
+        if connection is not None:
+            self._send(connection, Frame(message))
+            
+    async def send_to_user(self, user_id: int, message: dict):
+        """Send a message to every socket of a user on this worker"""
+        sockets = self.user_connections.get(user_id)
+        if not sockets:
+            return
+            
+        frame = Frame(message)
+        for websocket in sockets:
+            self._send(self.connection_map[websocket], frame)
+            
+    def _send(self, connection: ClientConnection, frame: Frame):
+        already_dropped = connection.dropped
+        if not connection.send(frame):
+            self.frames_dropped += 1
+            if connection.dropped and not already_dropped:
+                self.slow_consumers_dropped += 1
+                # Stop delivering to it right away rather than when its socket finally closes
+                asyncio.create_task(self.disconnect(connection.websocket))
+                
     def get_connected_users(self, chat_group_id: int) -> Set[int]:
         """Get the set of user IDs connected to a chat group"""
         if chat_group_id not in self.active_connections:
             return set()
             
-        return {self.connection_map[conn][0] for conn in self.active_connections[chat_group_id]}
+        return {self.connection_map[conn].user_id for conn in self.active_connections[chat_group_id]}
         
     def is_user_connected(self, chat_group_id: int, user_id: int) -> bool:
         """Check if a user is connected to a chat group"""
         return user_id in self.get_connected_users(chat_group_id)
+        
+    def get_metrics(self) -> dict:
+        """Connection, send queue and slow consumer statistics of this worker"""
+        depths = [connection.queue_depth for connection in self.connection_map.values()]
+        return {
+            "connections": len(self.connection_map),
+            "msgpack_connections": sum(
+                1 for connection in self.connection_map.values() if connection.protocol == MSGPACK_SUBPROTOCOL
+            ),
+            "users": len(self.user_connections),
+            "chat_groups": len(self.active_connections),
+            "subscriptions": sum(len(sockets) for sockets in self.active_connections.values()),
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "max_lag_seconds": round(max((c.lag() for c in self.connection_map.values()), default=0.0), 3),
+            "slow_consumers_dropped": self.slow_consumers_dropped,
+            "frames_dropped": self.frames_dropped,
+            "presence": self.presence.get_metrics()
+        }
 
 # Singleton instance
-connection_manager = ConnectionManager()
+connection_manager = ConnectionManager(create_chat_broker())
 
 class ChatService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.chat_repo = ChatRepository(db)
         self.notification_service = NotificationService(db)
         
+    async def handle_frame(self, websocket: WebSocket, user_id: int, frame: dict):
+        """Handle a frame received on a multiplexed chat socket"""
+        frame_type = frame.get("type", "message")
+        
+        if frame_type == "subscribe":
+            await self.subscribe(websocket, user_id, frame.get("chat_group_id"), frame.get("resume_from"))
+        elif frame_type == "unsubscribe":
+            chat_group_id = frame.get("chat_group_id")
+            await connection_manager.unsubscribe(websocket, chat_group_id)
+            await connection_manager.send_personal_message(
+                {"type": "unsubscribed", "chat_group_id": chat_group_id},
+                websocket
+            )
+        elif frame_type == "ping":
+            # Heartbeat; receiving it already refreshed the socket's timeout
+            await connection_manager.send_personal_message({"type": "pong"}, websocket)
+        elif frame_type == "message":
+            await self.handle_message(websocket, user_id, frame)
+        elif frame_type == "read":
+            await self.handle_read(websocket, user_id, frame)
+        else:
+            await connection_manager.send_personal_message(
+                {"type": "error", "message": "不支援的訊息類型"},
+                websocket
+            )
+            
+    async def subscribe(
+        self, websocket: WebSocket, user_id: int, chat_group_id: Optional[int], resume_from: Optional[int] = None
+    ) -> bool:
+        """
+        Subscribe a socket to a chat group the user is a member of
+        
+        resume_from is the seq of the last message the client received; the
+        messages after it are replayed before live delivery starts.
+        """
+        if not isinstance(chat_group_id, int) or not await self.is_member(chat_group_id, user_id):
+            await connection_manager.send_personal_message(
+                {"type": "error", "chat_group_id": chat_group_id, "message": "您不是此聊天室的成員"},
+                websocket
+            )
+            return False
+            
+        resume = isinstance(resume_from, int)
+        await connection_manager.subscribe(websocket, chat_group_id, hold=resume)
+        await connection_manager.send_personal_message(
+            {"type": "subscribed", "chat_group_id": chat_group_id},
+            websocket
+        )
+        if resume:
+            await self.replay(websocket, chat_group_id, resume_from)
+        return True
+        
+    async def replay(self, websocket: WebSocket, chat_group_id: int, resume_from: int):
+        """Replay a subscribed socket's missed messages from the recent message buffer, or one range query"""
+        messages, truncated = [], False
+        try:
+            missed = recent_messages.since(chat_group_id, resume_from)
+            if missed is None:
+                missed = await self.chat_repo.get_messages_after(
+                    chat_group_id, resume_from, settings.CHAT_RESUME_MAX + 1
+                )
+            truncated = len(missed) > settings.CHAT_RESUME_MAX
+            messages = missed[:settings.CHAT_RESUME_MAX]
+        except Exception as e:
+            # Still switch the socket to live delivery; the client reloads history instead
+            print(f"Chat replay error: {e}")
+            truncated = True
+            
+        await connection_manager.replay(websocket, chat_group_id, messages, truncated)
+        
+    async def get_live_group(self, chat_group_id: int) -> Optional[CachedChatGroup]:
+        """Cached members/profiles of a group with sockets on this worker, None for other groups"""
+        if chat_group_id not in connection_manager.active_connections:
+            return None
+        return await self.chat_repo.get_cached_chat_group(chat_group_id)
+        
+    async def is_member(self, chat_group_id: int, user_id: int) -> bool:
+        cached = await self.get_live_group(chat_group_id)
+        if cached is not None:
+            return user_id in cached.member_ids
+        return await self.chat_repo.is_chat_member(chat_group_id, user_id)
+        
+    async def mark_read(self, chat_group_id: int, user_id: int, message_id: int) -> Optional[str]:
+        """Move a member's read cursor to a message of the group, returning an error message on failure"""
+        if not await self.is_member(chat_group_id, user_id):
+            return "您不是此聊天室的成員"
+        if not await self.chat_repo.message_in_group(chat_group_id, message_id):
+            return "找不到此訊息"
+            
+        # Coalesced with the member's other marks and written in the background
+        read_cursor_writer.mark(chat_group_id, user_id, message_id)
+        return None
+        
+    async def handle_read(self, websocket: WebSocket, user_id: int, frame: dict):
+        """Handle a {"type": "read", "chat_group_id": ..., "message_id": ...} frame"""
+        chat_group_id = frame.get("chat_group_id")
+        message_id = frame.get("message_id")
+        
+        if not isinstance(chat_group_id, int) or not isinstance(message_id, int):
+            error = "缺少必要的訊息資料"
+        else:
+            error = await self.mark_read(chat_group_id, user_id, message_id)
+            
+        if error:
+            await connection_manager.send_personal_message(
+                {"type": "error", "chat_group_id": chat_group_id, "message": error},
+                websocket
+            )
+            
     async def handle_message(self, websocket: WebSocket, user_id: int, message_data: dict):
         """Handle an incoming chat message"""
         chat_group_id = message_data.get("chat_group_id")
         content = message_data.get("content")
         message_type = message_data.get("message_type", "text")
         
-        if not chat_group_id or not content:
+        if not isinstance(chat_group_id, int) or not content:
             await connection_manager.send_personal_message(
-                {"type": "error", "message": "缺少必要的訊息資料"},
+                {"type": "error", "chat_group_id": chat_group_id, "message": "缺少必要的訊息資料"},
                 websocket
             )
             return
             
+        # Groups with live sockets here are answered from the cache, so the
+        # message itself is the only query
+        cached = await self.get_live_group(chat_group_id)
+        
         # Check if user is a member of the chat group
-        if not self.chat_repo.is_chat_member(chat_group_id, user_id):
+        if cached is not None:
+            is_member = user_id in cached.member_ids
+        else:
+            is_member = await self.chat_repo.is_chat_member(chat_group_id, user_id)
+            
+        if not is_member:
             await connection_manager.send_personal_message(
-                {"type": "error", "message": "您不是此聊天室的成員"},
+                {"type": "error", "chat_group_id": chat_group_id, "message": "您不是此聊天室的成員"},
                 websocket
             )
             return
             
-        # Save message to database
-        db_message = self.chat_repo.create_message(
+        # Get sender and member info
+        if cached is not None:
+            sender = chat_group_cache.profile(user_id)
+            chat_group_name = cached.name
+            member_profiles = [(member_id, chat_group_cache.profile(member_id)) for member_id in cached.member_ids]
+        else:
+            sender = None
+            chat_group = await self.chat_repo.get_chat_group_by_id(chat_group_id)
+            chat_group_name = chat_group.name if chat_group else ""
+            member_profiles = [
+                (member.user_id, sender_profile(member.user))
+                for member in await self.chat_repo.get_chat_group_members(chat_group_id)
+            ]
+            
+        # Not cached (e.g. evicted meanwhile): load it, and send an empty name if the user is gone
+        if sender is None:
+            user = await self.chat_repo.get_user(user_id)
+            sender = sender_profile(user) if user else SenderProfile("", None, None)
+            
+        async def broadcast_message(db_message: ChatMessage):
+            # Broadcast to all connected users in the chat group (which also adds
+            # it to the recent messages of every worker following the group)
+            await connection_manager.broadcast(chat_group_id, {
+                "type": "message",
+                "message": message_payload(db_message, sender)
+            })
+            
+        # Save message to database, batched with other messages arriving at the
+        # same time; the writer broadcasts each batch in seq order once committed
+        db_message = await message_writer.write(
             chat_group_id=chat_group_id,
             user_id=user_id,
             content=content,
-            message_type=message_type
+            message_type=message_type,
+            on_commit=broadcast_message
         )
         
-        # Get user info
-        user = self.chat_repo.get_user(user_id)
-        
-        # Prepare message for broadcast
-        message_obj = {
-            "id": db_message.id,
-            "content": db_message.content,
-            "message_type": db_message.message_type,
-            "created_at": db_message.created_at.isoformat(),
-            "chat_group_id": db_message.chat_group_id,
-            "user_id": db_message.user_id,
-            "sender_name": user.name,
-            "sender_profile_picture": user.profile_picture
-        }
-        
-        broadcast_data = {
-            "type": "message",
-            "message": message_obj
-        }
-        
-        # Broadcast to all connected users in the chat group
-        await connection_manager.broadcast(chat_group_id, broadcast_data)
+        # Posting in a group means the sender has read it up to here
+        read_cursor_writer.mark(chat_group_id, user_id, db_message.id)
         
-        # Send push notification to users not currently connected
+        # Send push notification to members not currently connected (to this worker)
         connected_users = connection_manager.get_connected_users(chat_group_id)
+        tokens = [
+            profile.fcm_token for member_id, profile in member_profiles
+            if member_id != user_id and member_id not in connected_users and profile and profile.fcm_token
+        ]
         
-        # If there are members not connected via WebSocket, send them a push notification
-        if not all(member.user_id in connected_users for member in self.chat_repo.get_chat_group_members(chat_group_id)):
+        if tokens:
             # Create a short preview of the message (first 50 chars)
             message_preview = content[:50] + ("..." if len(content) > 50 else "")
-            await self.notification_service.notify_chat_message(chat_group_id, user_id, message_preview)
+            await self.notification_service.send_chat_message_push(
+                tokens, chat_group_id, chat_group_name, user_id, sender.name, message_preview
+            )
             
-        return db_message 
\ No newline at end of file
+        return db_message
\ No newline at end of file
@@ -0,0 +1,177 @@
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.chat import ChatMessage
+from app.repositories.chat_repository import reserve_message_seqs
+
+# Called with a message once its batch has committed, before its writer is answered
+CommitHandler = Callable[[ChatMessage], Awaitable[None]]
+
+class MessageWriter:
+    """
+    Write-behind persistence of chat messages with group commit
+
+    Messages written within max_delay seconds of each other (or while the
+    previous batch is being committed) are inserted together by one multi-row
+    INSERT ... RETURNING in a single transaction, and each caller gets its
+    message back once that transaction has committed. Batches are flushed one
+    at a time and per-group seqs are assigned in arrival order, so every chat
+    group's messages keep the order they were received in; the returned ids
+    are matched to messages by (chat_group_id, seq), not by position.
+
+    A message's on_commit handler (e.g. its broadcast) is awaited after the
+    commit, one message at a time in batch order, so on this worker every
+    chat group's messages are handed on in seq order; letting each sender
+    broadcast after its write returned would race them.
+
+    Args:
+        max_delay: Seconds the first message of a batch may wait for others
+        max_batch: Maximum number of messages per INSERT
+        session_factory: Creates the session each batch is written with
+        reserve_seqs: Reserves each group's seqs in the batch's transaction
+    """
+    def __init__(
+        self,
+        max_delay: float,
+        max_batch: int,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        reserve_seqs: Callable[[AsyncSession, Dict[int, int]], Awaitable[Dict[int, int]]] = reserve_message_seqs
+    ):
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.session_factory = session_factory
+        self.reserve_seqs = reserve_seqs
+        self.pending: List[Tuple[dict, asyncio.Future, Optional[CommitHandler]]] = []
+        self.drain_task: Optional[asyncio.Task] = None
+        self.batch_full = asyncio.Event()
+
+        self.batches_written = 0
+        self.messages_written = 0
+
+    async def write(
+        self,
+        chat_group_id: int,
+        user_id: int,
+        content: str,
+        message_type: str = "text",
+        on_commit: Optional[CommitHandler] = None
+    ) -> ChatMessage:
+        """Queue a message for the next batch and wait until it is committed (and on_commit has run)"""
+        row = {
+            "chat_group_id": chat_group_id,
+            "user_id": user_id,
+            "content": content,
+            "message_type": message_type
+        }
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((row, future, on_commit))
+
+        if self.drain_task is None:
+            self.drain_task = asyncio.create_task(self._drain())
+        elif len(self.pending) >= self.max_batch:
+            self.batch_full.set()
+
+        return await future
+
+    async def close(self):
+        """Wait for queued messages to be written"""
+        if self.drain_task is not None:
+            await self.drain_task
+
+    async def _drain(self):
+        try:
+            # Let concurrent senders join the first batch
+            if self.max_delay > 0 and len(self.pending) < self.max_batch:
+                self.batch_full.clear()
+                try:
+                    await asyncio.wait_for(self.batch_full.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Messages arriving while a batch commits form the next batch
+            while self.pending:
+                batch = self.pending[:self.max_batch]
+                del self.pending[:self.max_batch]
+                await self._flush(batch)
+        finally:
+            self.drain_task = None
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future, Optional[CommitHandler]]]):
+        table = ChatMessage.__table__
+
+        try:
+            async with self.session_factory() as db:
+                counts = Counter(row["chat_group_id"] for row, _, _ in batch)
+                next_seqs = await self.reserve_seqs(db, counts)
+
+                # Messages to chat groups that no longer exist fail on their own
+                for row, future, _ in batch:
+                    if row["chat_group_id"] not in next_seqs and not future.done():
+                        future.set_exception(ValueError(f"Chat group {row['chat_group_id']} not found"))
+                batch = [entry for entry in batch if entry[0]["chat_group_id"] in next_seqs]
+                if not batch:
+                    await db.commit()
+                    return
+
+                for row, _, _ in batch:
+                    row["seq"] = next_seqs[row["chat_group_id"]]
+                    next_seqs[row["chat_group_id"]] += 1
+
+                result = await db.execute(
+                    insert(table).values([row for row, _, _ in batch]).returning(
+                        table.c.chat_group_id, table.c.seq, table.c.id, table.c.created_at
+                    )
+                )
+                # Neither the ids nor the RETURNING rows are guaranteed to follow
+                # VALUES order; (chat_group_id, seq) is unique within the batch
+                returned = {
+                    (chat_group_id, seq): (message_id, created_at)
+                    for chat_group_id, seq, message_id, created_at in result.all()
+                }
+                await db.commit()
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_written += 1
+        self.messages_written += len(batch)
+
+        for row, future, on_commit in batch:
+            message_id, created_at = returned[(row["chat_group_id"], row["seq"])]
+            message = ChatMessage(**row)
+            message.id = message_id
+            message.created_at = created_at
+            message.updated_at = created_at
+
+            if on_commit is not None:
+                try:
+                    await on_commit(message)
+                except Exception as e:
+                    # Committed, but its writer hears that it was not handed on
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+            if not future.done():
+                future.set_result(message)
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "batches_written": self.batches_written,
+            "messages_written": self.messages_written,
+            "avg_batch_size": round(self.messages_written / self.batches_written, 2) if self.batches_written else 0
+        }
+
+# Singleton instance
+message_writer = MessageWriter(
+    max_delay=settings.CHAT_WRITE_DELAY_MS / 1000,
+    max_batch=settings.CHAT_WRITE_BATCH_SIZE
+)
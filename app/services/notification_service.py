@@ -1,5 +1,5 @@
 from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.fcm import FCMService
 from app.repositories.user_repository import UserRepository
@@ -8,7 +8,7 @@ from app.models.user import User
 from app.models.campaign import Campaign
 
 class NotificationService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.user_repo = UserRepository(db)
         self.campaign_repo = CampaignRepository(db)
@@ -17,12 +17,12 @@ class NotificationService:
         """
         Notify nearby users about a new campaign
         """
-        campaign = self.campaign_repo.get_campaign_by_id(campaign_id)
+        campaign = await self.campaign_repo.get_campaign_by_id(campaign_id)
         if not campaign:
             return False
             
         # Get nearby users
-        nearby_users = self.user_repo.get_nearby_users(
+        nearby_users = await self.user_repo.get_nearby_users(
             campaign.latitude, 
             campaign.longitude,
             radius_km,
@@ -36,7 +36,7 @@ class NotificationService:
             return False
             
         # Get creator
-        creator = self.user_repo.get_user_by_id(campaign.creator_id)
+        creator = await self.user_repo.get_user_by_id(campaign.creator_id)
         
         # Send notifications
         tokens = [user.fcm_token for user in users_with_tokens]
@@ -59,16 +59,16 @@ class NotificationService:
         """
         Notify campaign creator and other participants when a user joins
         """
-        campaign = self.campaign_repo.get_campaign_by_id(campaign_id)
+        campaign = await self.campaign_repo.get_campaign_by_id(campaign_id)
         if not campaign:
             return False
             
-        user = self.user_repo.get_user_by_id(user_id)
+        user = await self.user_repo.get_user_by_id(user_id)
         if not user:
             return False
             
         # Get all participants including creator
-        participants = [p[0] for p in self.campaign_repo.get_campaign_participants(campaign_id)]
+        participants = [p[0] for p in await self.campaign_repo.get_campaign_participants(campaign_id)]
         
         # Filter out the user who just joined and those without FCM tokens
         recipients = [p for p in participants if p.id != user_id and p.fcm_token]
@@ -97,12 +97,12 @@ class NotificationService:
         """
         Notify all participants about a campaign update
         """
-        campaign = self.campaign_repo.get_campaign_by_id(campaign_id)
+        campaign = await self.campaign_repo.get_campaign_by_id(campaign_id)
         if not campaign:
             return False
             
         # Get all participants
-        participants = [p[0] for p in self.campaign_repo.get_campaign_participants(campaign_id)]
+        participants = [p[0] for p in await self.campaign_repo.get_campaign_participants(campaign_id)]
         
         # Filter out those without FCM tokens
         recipients = [p for p in participants if p.fcm_token]
@@ -134,7 +134,7 @@ class NotificationService:
         chat_repo = ChatRepository(self.db)
         
         # Get chat members excluding sender
-        members = chat_repo.get_chat_group_members(chat_group_id)
+        members = await chat_repo.get_chat_group_members(chat_group_id)
         if not members:
             return False
             
@@ -145,14 +145,29 @@ class NotificationService:
             return False
             
         # Get sender and chat group
-        sender = self.user_repo.get_user_by_id(sender_id)
-        chat_group = chat_repo.get_chat_group_by_id(chat_group_id)
+        sender = await self.user_repo.get_user_by_id(sender_id)
+        chat_group = await chat_repo.get_chat_group_by_id(chat_group_id)
         
         if not sender or not chat_group:
             return False
             
         tokens = [r.fcm_token for r in recipients]
         
+        await self.send_chat_message_push(tokens, chat_group_id, chat_group.name, sender_id, sender.name, message_preview)
+        return True
+        
+    async def send_chat_message_push(
+        self,
+        tokens: List[str],
+        chat_group_id: int,
+        chat_group_name: str,
+        sender_id: int,
+        sender_name: str,
+        message_preview: str
+    ):
+        """
+        Send a new chat message notification to already-resolved FCM tokens
+        """
         data = {
             "chat_group_id": str(chat_group_id),
             "sender_id": str(sender_id),
@@ -161,9 +176,7 @@ class NotificationService:
         
         await FCMService.send_multicast(
             tokens=tokens,
-            title=f"來自 {chat_group.name} 的新訊息",
-            body=f"{sender.name}: {message_preview}",
+            title=f"來自 {chat_group_name} 的新訊息",
+            body=f"{sender_name}: {message_preview}",
             data=data
-        )
-        
-        return True 
\ No newline at end of file
+        ) 
\ No newline at end of file
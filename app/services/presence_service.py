@@ -0,0 +1,153 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.utils.timer_wheel import TimerWheel
+
+# Called with {chat_group_id: [change, ...]} for each batch of presence changes
+PresencePublisher = Callable[[Dict[int, List[dict]]], Awaitable[None]]
+
+# Called with the key of a socket that missed its heartbeats
+IdleHandler = Callable[[Hashable], Awaitable[None]]
+
+class PresenceService:
+    """
+    Who is online on this worker, with heartbeat timeouts and batched presence events
+
+    Every frame a socket sends counts as a heartbeat; watched sockets silent
+    for timeout seconds are handed to on_idle (half-open mobile connections
+    never report their disconnect). Sockets connected with watch=False (clients
+    that send no heartbeats) are never reaped. Timeouts live in a timer wheel, so a heartbeat
+    is a dict write and reaping looks only at sockets due in the current tick.
+
+    A user is online while they have at least one socket, and a member of a
+    chat group while one of their sockets is subscribed to it. Membership
+    changes are coalesced and handed to publisher once per tick, one list per
+    chat group, so a reconnect storm costs one frame per group instead of one
+    per user.
+
+    Last-seen times are forgotten after last_seen_ttl seconds, so the map
+    only holds users who were online recently.
+
+    Args:
+        timeout: Seconds without a frame after which a socket is considered dead
+        tick: Seconds between reaping / publishing rounds
+        last_seen_ttl: Seconds a user's last-seen time is kept after they go offline
+    """
+    def __init__(self, timeout: float, tick: float, last_seen_ttl: float = 86400.0):
+        self.timeout = timeout
+        self.tick = tick
+        self.last_seen_ttl = last_seen_ttl
+        self.wheel = TimerWheel(tick=tick, slots=max(1, int(timeout / tick)) + 1, now=time.monotonic())
+
+        self.sockets: Dict[int, int] = {}  # user_id -> number of sockets on this worker
+        # user_id -> when their last socket closed, oldest first
+        self.last_seen: Dict[int, datetime] = {}
+
+        # (chat_group_id, user_id) -> (online before this batch, online now)
+        self.pending: Dict[Tuple[int, int], Tuple[bool, bool]] = {}
+
+        self.publisher: Optional[PresencePublisher] = None
+        self.on_idle: Optional[IdleHandler] = None
+
+        self.sockets_reaped = 0
+        self.events_published = 0
+
+    def connected(self, key: Hashable, user_id: int, watch: bool = True):
+        if watch:
+            self.wheel.schedule(key, time.monotonic() + self.timeout)
+        self.sockets[user_id] = self.sockets.get(user_id, 0) + 1
+        self.last_seen.pop(user_id, None)  # Online users have no last-seen time
+
+    def touch(self, key: Hashable):
+        """Record a heartbeat (any frame) from a socket, pushing back its timeout if watched"""
+        if key in self.wheel:
+            self.wheel.schedule(key, time.monotonic() + self.timeout)
+
+    def disconnected(self, key: Hashable, user_id: int):
+        self.wheel.cancel(key)
+
+        count = self.sockets.get(user_id, 0) - 1
+        if count > 0:
+            self.sockets[user_id] = count
+        else:
+            self.sockets.pop(user_id, None)
+            # Re-inserted at the end, which keeps the map in time order
+            self.last_seen.pop(user_id, None)
+            self.last_seen[user_id] = datetime.now(timezone.utc)
+
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self.sockets
+
+    def get_last_seen(self, user_id: int) -> Optional[datetime]:
+        """When the user's last socket on this worker closed (None if online or never seen)"""
+        if user_id in self.sockets:
+            return None
+        return self.last_seen.get(user_id)
+
+    def forget_last_seen(self):
+        """Drop last-seen times older than last_seen_ttl"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.last_seen_ttl)
+        while self.last_seen:
+            user_id, last_seen = next(iter(self.last_seen.items()))
+            if last_seen > cutoff:
+                break
+            del self.last_seen[user_id]
+
+    def joined(self, chat_group_id: int, user_id: int):
+        """The user's first socket subscribed to the chat group"""
+        self._changed(chat_group_id, user_id, True)
+
+    def left(self, chat_group_id: int, user_id: int):
+        """The user's last socket subscribed to the chat group is gone"""
+        self._changed(chat_group_id, user_id, False)
+
+    def _changed(self, chat_group_id: int, user_id: int, online: bool):
+        key = (chat_group_id, user_id)
+        before, _ = self.pending.get(key, (not online, online))
+        self.pending[key] = (before, online)
+
+    def take_changes(self) -> Dict[int, List[dict]]:
+        """Coalesced changes since the last call, by chat group (flaps cancel out)"""
+        pending, self.pending = self.pending, {}
+
+        changes: Dict[int, List[dict]] = {}
+        for (chat_group_id, user_id), (before, online) in pending.items():
+            if before == online:
+                continue
+            last_seen = self.get_last_seen(user_id)
+            changes.setdefault(chat_group_id, []).append({
+                "user_id": user_id,
+                "online": online,
+                "last_seen": last_seen.isoformat() if last_seen else None
+            })
+        return changes
+
+    async def run(self):
+        """Reap idle sockets and publish presence changes every tick"""
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                for key in self.wheel.advance(time.monotonic()):
+                    self.sockets_reaped += 1
+                    if self.on_idle is not None:
+                        await self.on_idle(key)
+
+                changes = self.take_changes()
+                if changes and self.publisher is not None:
+                    self.events_published += sum(len(group_changes) for group_changes in changes.values())
+                    await self.publisher(changes)
+
+                self.forget_last_seen()
+            except Exception as e:
+                print(f"Presence error: {e}")
+
+    def get_metrics(self) -> dict:
+        return {
+            "online_users": len(self.sockets),
+            "tracked_sockets": len(self.wheel),
+            "last_seen_users": len(self.last_seen),
+            "sockets_reaped": self.sockets_reaped,
+            "events_published": self.events_published
+        }
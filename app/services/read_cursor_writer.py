@@ -0,0 +1,116 @@
+import asyncio
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.chat import ChatMember
+
+class ReadCursorWriter:
+    """
+    Coalesced persistence of chat members' read cursors
+
+    Clients mark messages as read far more often than the cursor needs to be
+    stored: every mark within flush_interval seconds for the same member is
+    folded into the newest message id, and all members' cursors are then
+    written by one executemany UPDATE. Cursors only move forward, even when
+    marks arrive out of order or from several workers.
+
+    Args:
+        flush_interval: Seconds a mark may wait before it is written
+        session_factory: Creates the session each flush is written with
+    """
+    def __init__(
+        self,
+        flush_interval: float,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal
+    ):
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        # (chat_group_id, user_id) -> newest message id marked as read
+        self.pending: Dict[Tuple[int, int], int] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        self.flush_lock = asyncio.Lock()
+        self.closing = asyncio.Event()  # Set by close(): flush now and stop scheduling flushes
+
+        self.marks = 0
+        self.rows_written = 0
+
+    def mark(self, chat_group_id: int, user_id: int, message_id: int):
+        """Move a member's read cursor forward; written within flush_interval"""
+        key = (chat_group_id, user_id)
+        if message_id > self.pending.get(key, 0):
+            self.pending[key] = message_id
+        self.marks += 1
+
+        if self.flush_task is None and not self.closing.is_set():
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        """Write every pending cursor now (also waits for a flush already running)"""
+        async with self.flush_lock:
+            if not self.pending:
+                return
+
+            batch, self.pending = self.pending, {}
+            table = ChatMember.__table__
+            statement = (
+                update(table)
+                .where(table.c.chat_group_id == bindparam("b_chat_group_id"))
+                .where(table.c.user_id == bindparam("b_user_id"))
+                .values(last_read_message_id=func.greatest(
+                    func.coalesce(table.c.last_read_message_id, 0),
+                    bindparam("b_message_id")
+                ))
+            )
+            rows = [
+                {"b_chat_group_id": chat_group_id, "b_user_id": user_id, "b_message_id": message_id}
+                for (chat_group_id, user_id), message_id in batch.items()
+            ]
+
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(statement, rows)
+                    await db.commit()
+            except Exception as e:
+                # Keep the cursors for the next flush unless newer ones arrived meanwhile
+                for key, message_id in batch.items():
+                    if message_id > self.pending.get(key, 0):
+                        self.pending[key] = message_id
+                print(f"Read cursor flush failed: {e}")
+                return
+
+            self.rows_written += len(rows)
+
+    async def close(self):
+        """Write pending cursors before shutdown"""
+        # Wake the scheduled flush rather than cancelling it: a flush that has
+        # already taken its batch must finish writing it
+        self.closing.set()
+        if self.flush_task is not None:
+            await self.flush_task
+        await self.flush()
+
+    async def _flush_later(self):
+        try:
+            await asyncio.wait_for(self.closing.wait(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        await self.flush()
+        self.flush_task = None
+
+        # Marks that arrived during the flush, or cursors that failed to write
+        if self.pending and not self.closing.is_set():
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "marks": self.marks,
+            "rows_written": self.rows_written
+        }
+
+# Singleton instance
+read_cursor_writer = ReadCursorWriter(flush_interval=settings.CHAT_READ_FLUSH_SECONDS)
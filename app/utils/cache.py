@@ -0,0 +1,45 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """
+    Bounded in-process cache with least-recently-used eviction and a per-entry time to live
+    
+    Args:
+        maxsize: Maximum number of entries kept
+        ttl: Seconds an entry stays valid after it is set
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+            
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+            
+        self._entries.move_to_end(key)
+        return value
+        
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        
+    def clear(self):
+        self._entries.clear()
+        
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,90 @@
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+class SenderProfile(NamedTuple):
+    name: Optional[str]
+    profile_picture: Optional[str]
+    fcm_token: Optional[str]
+
+class CachedChatGroup:
+    def __init__(self, name: Optional[str], member_ids: Set[int], ttl: float):
+        self.name = name
+        self.member_ids = member_ids
+        self.expires_at = time.monotonic() + ttl
+
+class ChatGroupCache:
+    """
+    Members and member profiles of chat groups, for the chat message hot path
+
+    Entries are expected to exist only for groups with live sockets on this
+    worker. Profiles are shared between groups and dropped with the last cached
+    group the user belongs to. Entries expire after ttl seconds, which bounds
+    staleness from changes made by other workers.
+
+    Args:
+        ttl: Seconds a loaded group stays valid
+    """
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.groups: Dict[int, CachedChatGroup] = {}
+        self.profiles: Dict[int, SenderProfile] = {}
+        # user_id -> number of cached groups the user is a member of
+        self.profile_refs: Dict[int, int] = {}
+
+    def get(self, chat_group_id: int) -> Optional[CachedChatGroup]:
+        group = self.groups.get(chat_group_id)
+        if group is not None and group.expires_at <= time.monotonic():
+            self.evict(chat_group_id)
+            return None
+        return group
+
+    def put(self, chat_group_id: int, name: Optional[str], members: Iterable[Tuple[int, SenderProfile]]) -> CachedChatGroup:
+        self.evict(chat_group_id)
+
+        group = CachedChatGroup(name, set(), self.ttl)
+        self.groups[chat_group_id] = group
+        for user_id, profile in members:
+            self._add(group, user_id, profile)
+        return group
+
+    def evict(self, chat_group_id: int):
+        group = self.groups.pop(chat_group_id, None)
+        if group is None:
+            return
+        for user_id in group.member_ids:
+            self._release_profile(user_id)
+
+    def add_member(self, chat_group_id: int, user_id: int, profile: SenderProfile):
+        group = self.groups.get(chat_group_id)
+        if group is not None and user_id not in group.member_ids:
+            self._add(group, user_id, profile)
+
+    def remove_member(self, chat_group_id: int, user_id: int):
+        group = self.groups.get(chat_group_id)
+        if group is not None and user_id in group.member_ids:
+            group.member_ids.discard(user_id)
+            self._release_profile(user_id)
+
+    def update_profile(self, user_id: int, profile: SenderProfile):
+        """Refresh a profile if it is cached (e.g. after the user edits it)"""
+        if user_id in self.profiles:
+            self.profiles[user_id] = profile
+
+    def profile(self, user_id: int) -> Optional[SenderProfile]:
+        return self.profiles.get(user_id)
+
+    def _add(self, group: CachedChatGroup, user_id: int, profile: SenderProfile):
+        group.member_ids.add(user_id)
+        self.profiles[user_id] = profile
+        self.profile_refs[user_id] = self.profile_refs.get(user_id, 0) + 1
+
+    def _release_profile(self, user_id: int):
+        refs = self.profile_refs.get(user_id, 0) - 1
+        if refs > 0:
+            self.profile_refs[user_id] = refs
+        else:
+            self.profile_refs.pop(user_id, None)
+            self.profiles.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self.groups)
@@ -0,0 +1,151 @@
+import math
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from app.utils.distance import calculate_distance
+
+# Kilometers per degree of latitude
+KM_PER_DEGREE = 111.32
+
+class GeoEntry(NamedTuple):
+    latitude: float
+    longitude: float
+    category: Optional[str]
+
+class GeoGridIndex:
+    """
+    In-process spatial index of points on a fixed latitude/longitude grid
+
+    Each point is stored in the grid cell containing it, so a radius query only
+    has to look at the cells overlapping the search circle. Distances are
+    great-circle (haversine) distances in meters.
+
+    Args:
+        cell_km: Approximate cell edge length in kilometers
+    """
+    def __init__(self, cell_km: float = 1.0):
+        self.cell_degrees = cell_km / KM_PER_DEGREE
+        self.lon_cells = math.ceil(360 / self.cell_degrees)
+        self._entries: Dict[Hashable, GeoEntry] = {}
+        self._cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self.ready = False  # Set once the index has been fully loaded
+        # Changes made while a reload is reading its points (None when not reloading)
+        self._changes: Optional[Dict[Hashable, Optional[GeoEntry]]] = None
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        row = math.floor((latitude + 90) / self.cell_degrees)
+        column = math.floor((longitude + 180) / self.cell_degrees) % self.lon_cells
+        return row, column
+
+    def upsert(self, key: Hashable, latitude: float, longitude: float, category: Optional[str] = None):
+        entry = GeoEntry(latitude, longitude, category)
+        if self._changes is not None:
+            self._changes[key] = entry
+        self._insert(self._entries, self._cells, key, entry)
+
+    def _insert(self, entries: Dict, cells: Dict, key: Hashable, entry: GeoEntry):
+        self._discard(entries, cells, key)
+        entries[key] = entry
+        cells.setdefault(self._cell(entry.latitude, entry.longitude), set()).add(key)
+
+    def remove(self, key: Hashable):
+        if self._changes is not None:
+            self._changes[key] = None
+        self._discard(self._entries, self._cells, key)
+
+    def _discard(self, entries: Dict, cells: Dict, key: Hashable):
+        entry = entries.pop(key, None)
+        if entry is None:
+            return
+
+        cell = self._cell(entry.latitude, entry.longitude)
+        keys = cells[cell]
+        keys.discard(key)
+        if not keys:
+            del cells[cell]
+
+    def clear(self):
+        self._entries.clear()
+        self._cells.clear()
+
+    def begin_reload(self):
+        """Start recording changes, so a reload from a slower source does not lose them"""
+        self._changes = {}
+
+    def finish_reload(self, points: Iterable[Tuple[Hashable, float, float, Optional[str]]]):
+        """
+        Replace the contents with (key, latitude, longitude, category) points
+
+        The new grid is built aside and swapped in at once, so searches see
+        either the old or the new contents; changes since begin_reload() are
+        applied on top, as the points may predate them.
+        """
+        entries: Dict[Hashable, GeoEntry] = {}
+        cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        for key, latitude, longitude, category in points:
+            self._insert(entries, cells, key, GeoEntry(latitude, longitude, category))
+        for key, entry in (self._changes or {}).items():
+            if entry is None:
+                self._discard(entries, cells, key)
+            else:
+                self._insert(entries, cells, key, entry)
+
+        self._entries, self._cells = entries, cells
+        self._changes = None
+        self.ready = True
+
+    def cancel_reload(self):
+        self._changes = None
+
+    def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: Optional[int] = None,
+        category: Optional[str] = None
+    ) -> List[Tuple[Hashable, float]]:
+        """
+        Find points within a radius (in kilometers) of a location
+
+        Returns:
+            List of (key, distance in meters), nearest first
+        """
+        lat_span = radius_km / KM_PER_DEGREE
+        min_row, _ = self._cell(max(latitude - lat_span, -90), longitude)
+        max_row, _ = self._cell(min(latitude + lat_span, 90), longitude)
+
+        # Longitude degrees shrink towards the poles; scan every column when the
+        # circle reaches a pole or wraps around the globe
+        edge_latitude = min(abs(latitude) + lat_span, 90)
+        parallel_km = KM_PER_DEGREE * math.cos(math.radians(edge_latitude))
+        lon_span = radius_km / parallel_km if parallel_km > 0 else 360
+        if lon_span >= 180:
+            columns = range(self.lon_cells)
+        else:
+            first_column = math.floor((longitude - lon_span + 180) / self.cell_degrees)
+            last_column = math.floor((longitude + lon_span + 180) / self.cell_degrees)
+            columns = {column % self.lon_cells for column in range(first_column, last_column + 1)}
+
+        radius_m = radius_km * 1000
+        matches = []
+        for row in range(min_row, max_row + 1):
+            for column in columns:
+                for key in self._cells.get((row, column), ()):
+                    entry = self._entries[key]
+                    if category is not None and entry.category != category:
+                        continue
+
+                    distance_m = calculate_distance(
+                        latitude, longitude, entry.latitude, entry.longitude, unit='m'
+                    )
+                    if distance_m <= radius_m:
+                        matches.append((key, distance_m))
+
+        matches.sort(key=lambda match: match[1])
+        return matches[:limit] if limit is not None else matches
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
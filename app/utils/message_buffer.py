@@ -0,0 +1,122 @@
+import bisect
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class GroupMessages:
+    def __init__(self):
+        self.messages: List[dict] = []  # Oldest first
+        self.ids: List[int] = []
+        self.primed = False
+        # True when the buffer holds the group's whole history
+        self.complete = False
+
+class RecentMessageBuffer:
+    """
+    Most recent fully-hydrated messages of chat groups, oldest first
+
+    A group's buffer is tracked while the group has live sockets (so every new
+    message reaches it), and can serve history only after it has been primed
+    with the latest messages from the database. Messages are kept sorted by
+    id, since events from different workers may arrive slightly out of order.
+
+    Args:
+        size: Messages kept per group
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.groups: Dict[int, GroupMessages] = {}
+
+    def track(self, chat_group_id: int):
+        self.groups.setdefault(chat_group_id, GroupMessages())
+
+    def evict(self, chat_group_id: int):
+        self.groups.pop(chat_group_id, None)
+
+    def reset(self):
+        """Forget every buffer's contents (e.g. after events may have been missed)"""
+        for chat_group_id in list(self.groups):
+            self.groups[chat_group_id] = GroupMessages()
+
+    def append(self, chat_group_id: int, message: dict):
+        group = self.groups.get(chat_group_id)
+        if group is not None:
+            self._insert(group, message)
+
+    def prime(self, chat_group_id: int, messages: Iterable[dict], complete: bool):
+        """Merge the latest messages loaded from the database into a tracked group"""
+        group = self.groups.get(chat_group_id)
+        if group is None:
+            return
+
+        for message in messages:
+            self._insert(group, message)
+        group.primed = True
+        group.complete = complete and len(group.messages) < self.size
+
+    def remove(self, chat_group_id: int, message_id: int):
+        if not self.contains(chat_group_id, message_id):
+            return
+
+        group = self.groups[chat_group_id]
+        index = bisect.bisect_left(group.ids, message_id)
+        del group.ids[index]
+        del group.messages[index]
+
+    def contains(self, chat_group_id: int, message_id: int) -> bool:
+        group = self.groups.get(chat_group_id)
+        if group is None:
+            return False
+        index = bisect.bisect_left(group.ids, message_id)
+        return index < len(group.ids) and group.ids[index] == message_id
+
+    def latest(self, chat_group_id: int, limit: int) -> Optional[Tuple[List[dict], bool]]:
+        """
+        Get the newest messages of a group, newest first
+
+        Returns:
+            Tuple of (messages, whether older messages exist), or None when
+            the buffer cannot answer and the database must be queried
+        """
+        group = self.groups.get(chat_group_id)
+        if group is None or not group.primed:
+            return None
+        if len(group.messages) < limit and not group.complete:
+            return None
+
+        messages = group.messages[-limit:][::-1] if limit > 0 else []
+        has_more = len(group.messages) > limit or not group.complete
+        return messages, has_more
+
+    def since(self, chat_group_id: int, seq: int) -> Optional[List[dict]]:
+        """
+        Get the messages of a group after a seq, oldest first
+
+        Returns None when the buffer cannot tell that it holds every one of
+        them: not primed, the seq is older than the buffer, or there is a gap
+        (a message still on its way from another worker, or a deleted one).
+        """
+        group = self.groups.get(chat_group_id)
+        if group is None or not group.primed:
+            return None
+
+        missed = [message for message in group.messages if message["seq"] > seq]
+
+        expected = seq + 1
+        for message in missed:
+            if message["seq"] != expected:
+                return None
+            expected += 1
+        return missed
+
+    def _insert(self, group: GroupMessages, message: dict):
+        message_id = message["id"]
+        index = bisect.bisect_left(group.ids, message_id)
+        if index < len(group.ids) and group.ids[index] == message_id:
+            return
+
+        group.ids.insert(index, message_id)
+        group.messages.insert(index, message)
+
+        if len(group.ids) > self.size:
+            del group.ids[0]
+            del group.messages[0]
+            group.complete = False
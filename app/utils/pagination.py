@@ -0,0 +1,108 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from sqlalchemy.orm import InstrumentedAttribute
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, keys: Sequence[InstrumentedAttribute]) -> Tuple[Any, ...]:
+    """
+    Decode a cursor produced by encode_cursor for the given sort key columns
+    
+    Raises:
+        ValueError: If the cursor is malformed or does not match the key columns
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+        
+    if not isinstance(payload, list) or len(payload) != len(keys):
+        raise ValueError("Invalid cursor")
+        
+    values = []
+    for key, value in zip(keys, payload):
+        python_type = key.type.python_type
+        if python_type is datetime:
+            if not isinstance(value, str):
+                raise ValueError("Invalid cursor")
+            values.append(datetime.fromisoformat(value))
+        elif isinstance(value, python_type) and not isinstance(value, bool):
+            values.append(value)
+        else:
+            raise ValueError("Invalid cursor")
+            
+    return tuple(values)
+
+def keyset_page(
+    query: Select,
+    keys: Sequence[InstrumentedAttribute],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Select:
+    """
+    Restrict a query to one page (plus one row) after the cursor, newest first
+    
+    For queries that need more than paginate() offers, e.g. joining details
+    onto the page as a subquery; split the rows with page_rows().
+    
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    if cursor:
+        query = query.filter(tuple_(*keys) < tuple_(*decode_cursor(cursor, keys)))
+        
+    # One extra row tells whether another page follows
+    return query.order_by(*[key.desc() for key in keys]).limit(limit + 1)
+
+def page_rows(
+    rows: Sequence[Any],
+    keys: Sequence[InstrumentedAttribute],
+    limit: int
+) -> Tuple[List[Any], Optional[str]]:
+    """Split the rows fetched by a keyset_page() query into (rows, next_cursor)"""
+    if limit <= 0:
+        return [], None
+    if len(rows) <= limit:
+        return list(rows), None
+        
+    rows = list(rows[:limit])
+    return rows, encode_cursor([getattr(rows[-1], key.key) for key in keys])
+
+async def paginate(
+    db: AsyncSession,
+    query: Select,
+    keys: Sequence[InstrumentedAttribute],
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Fetch one page of a query with keyset pagination, newest first
+    
+    Rows are ordered by the key columns descending (e.g. created_at, id) and
+    the page starts strictly after the cursor, so each page costs one index
+    range scan however deep the client has scrolled.
+    
+    Args:
+        db: Session to run the query on
+        query: Select of a single mapped class, without ORDER BY / LIMIT
+        keys: Columns forming a unique sort key, most significant first
+        limit: Page size
+        cursor: next_cursor returned with the previous page
+        
+    Returns:
+        Tuple of (rows, next_cursor), next_cursor being None on the last page
+        
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    result = await db.execute(keyset_page(query, keys, limit, cursor))
+    return page_rows(result.scalars().all(), keys, limit)
@@ -0,0 +1,48 @@
+from typing import Any, List, Tuple
+
+from geoalchemy2 import Geography
+from sqlalchemy import cast, func, select
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import ColumnElement, Label
+
+def geography_point(latitude: float, longitude: float) -> ColumnElement:
+    """
+    Build a geography POINT from bound parameters
+    
+    The coordinates are sent as query parameters rather than interpolated into
+    the SQL text, so every call produces the same statement (cacheable and not injectable)
+    """
+    return cast(
+        func.ST_SetSRID(func.ST_MakePoint(float(longitude), float(latitude)), 4326),
+        Geography(geometry_type='POINT', srid=4326)
+    )
+
+def nearby_query(model: Any, latitude: float, longitude: float, radius_km: float) -> Tuple[Select, Label]:
+    """
+    Select rows of a model whose location is within a radius (in kilometers) of a point
+    
+    Args:
+        model: Mapped class with a geography `location` column
+        latitude: Center point latitude
+        longitude: Center point longitude
+        radius_km: Search radius in kilometers
+        
+    Returns:
+        Tuple of (query selecting (model, distance_m), distance_m column for ordering)
+    """
+    point = geography_point(latitude, longitude)
+    distance = func.ST_Distance(model.location, point).label("distance_m")
+    
+    query = select(model, distance).filter(
+        func.ST_DWithin(model.location, point, float(radius_km) * 1000)
+    )
+    
+    return query, distance
+
+def with_distance(rows: List[Tuple[Any, float]]) -> List[Any]:
+    """Attach the computed distance_m (meters) to each row object returned by nearby_query"""
+    items = []
+    for item, distance_m in rows:
+        item.distance_m = distance_m
+        items.append(item)
+    return items
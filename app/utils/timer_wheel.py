@@ -0,0 +1,71 @@
+import math
+from typing import Dict, Hashable, List, Set
+
+class TimerWheel:
+    """
+    Hashed timer wheel for large numbers of timeouts that are pushed back often
+
+    Deadlines are rounded up to ticks and kept in one slot per tick of a
+    rotation. schedule() only records the new deadline: an entry whose slot
+    comes round before its deadline is moved to the right slot then, so
+    refreshing a timeout (e.g. on every heartbeat) costs one dict write and
+    each tick only looks at the entries of one slot.
+
+    Args:
+        tick: Seconds per slot (timeout resolution)
+        slots: Slots per rotation; deadlines further out wait extra rotations
+    """
+    def __init__(self, tick: float, slots: int, now: float = 0.0):
+        self.tick = tick
+        self.slots = slots
+        self.wheel: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self.deadlines: Dict[Hashable, float] = {}
+        # Last tick whose slot has been processed
+        self.current_tick = math.floor(now / tick)
+
+    def schedule(self, key: Hashable, deadline: float):
+        """Set (or move) a key's deadline"""
+        scheduled = key in self.deadlines
+        self.deadlines[key] = deadline
+        if not scheduled:
+            self._insert(key, deadline)
+
+    def cancel(self, key: Hashable):
+        # The slot entry is discarded when its slot comes round
+        self.deadlines.pop(key, None)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Process the ticks up to now, returning the keys whose deadline has passed"""
+        target_tick = math.floor(now / self.tick)
+        # A full rotation visits every slot; more would only repeat them
+        first_tick = max(self.current_tick + 1, target_tick - self.slots + 1)
+        self.current_tick = max(self.current_tick, target_tick)
+
+        expired = []
+        for tick in range(first_tick, target_tick + 1):
+            slot = self.wheel[tick % self.slots]
+            keys = list(slot)
+            slot.clear()
+
+            for key in keys:
+                deadline = self.deadlines.get(key)
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    del self.deadlines[key]
+                    expired.append(key)
+                else:
+                    self._insert(key, deadline)
+
+        return expired
+
+    def _insert(self, key: Hashable, deadline: float):
+        # Never into a slot that has already been processed this rotation
+        tick = max(math.ceil(deadline / self.tick), self.current_tick + 1)
+        self.wheel[tick % self.slots].add(key)
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.deadlines
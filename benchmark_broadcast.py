@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the cost per recipient of a chat broadcast
+
+Compares encoding the frame once with orjson and sharing it (what
+ConnectionManager.broadcast_local does) against encoding it with the stdlib
+json module for every recipient, and against shared MessagePack frames for
+clients of the MessagePack subprotocol (sender already known to them).
+
+Usage: python benchmark_broadcast.py [recipients] [rounds]
+"""
+import asyncio
+import json
+import sys
+import time
+
+from app.services.chat_broker import InMemoryChatBroker
+from app.services.chat_connection import MSGPACK_SUBPROTOCOL, Frame
+from app.services.chat_service import ConnectionManager
+
+class NullWebSocket:
+    """Websocket that accepts frames without doing any I/O"""
+    def __init__(self, subprotocols=()):
+        self.scope = {"subprotocols": list(subprotocols)}
+        
+    async def accept(self, subprotocol=None):
+        pass
+        
+    async def send_text(self, text):
+        pass
+        
+    async def send_bytes(self, data):
+        pass
+        
+    async def close(self, code=1000, reason=None):
+        pass
+
+class PerRecipientJsonFrame(Frame):
+    """Frame encoded again with the stdlib json module every time it is sent"""
+    __slots__ = ()
+    
+    def text(self) -> str:
+        return json.dumps(self.message)
+
+MESSAGE = {
+    "type": "message",
+    "message": {
+        "id": 123456,
+        "content": "今天下午三點在信義區揪咖啡，買一送一，還差兩位！",
+        "message_type": "text",
+        "created_at": "2026-10-17T15:00:00.000000+00:00",
+        "chat_group_id": 42,
+        "user_id": 7,
+        "sender_name": "王小明",
+        "sender_profile_picture": "https://example.com/uploads/avatar.jpg"
+    }
+}
+
+def report(label: str, elapsed: float, rounds: int, recipients: int):
+    per_recipient_ns = elapsed / (rounds * recipients) * 1e9
+    print(f"{label:<32} {elapsed / rounds * 1e6:10.1f} µs/broadcast {per_recipient_ns:8.1f} ns/recipient")
+
+async def connect_recipients(recipients: int, subprotocols=()) -> ConnectionManager:
+    manager = ConnectionManager(InMemoryChatBroker())
+    for user_id in range(recipients):
+        websocket = NullWebSocket(subprotocols)
+        await manager.connect(websocket, user_id)
+        await manager.subscribe(websocket, 1)
+    await asyncio.sleep(0)
+    return manager
+
+async def main(recipients: int, rounds: int):
+    manager = await connect_recipients(recipients)
+    event = {"message": MESSAGE, "exclude_user_id": None}
+    
+    # Per-recipient stdlib json encoding, the original behaviour
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for websocket in manager.active_connections[1]:
+            manager._send(manager.connection_map[websocket], PerRecipientJsonFrame(MESSAGE))
+        await asyncio.sleep(0)  # Let the writers drain their queues
+    report("json.dumps per recipient", time.perf_counter() - start, rounds, recipients)
+    
+    # One shared orjson frame
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await manager.broadcast_local(1, event)
+        await asyncio.sleep(0)
+    report("orjson once, shared frame", time.perf_counter() - start, rounds, recipients)
+    
+    # One shared MessagePack frame; the first broadcast sends the sender frame
+    manager = await connect_recipients(recipients, [MSGPACK_SUBPROTOCOL])
+    await manager.broadcast_local(1, event)
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await manager.broadcast_local(1, event)
+        await asyncio.sleep(0)
+    report("msgpack once, shared frame", time.perf_counter() - start, rounds, recipients)
+    
+    frame = Frame({"chat_group_id": 1, **MESSAGE})
+    print(f"Frame size: {len(frame.text().encode())} bytes JSON, {len(frame.binary())} bytes MessagePack")
+
+if __name__ == "__main__":
+    recipients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print(f"Broadcasting to {recipients} recipients, {rounds} rounds")
+    asyncio.run(main(recipients, rounds))
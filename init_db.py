@@ -1,12 +1,16 @@
+from alembic import command
+from alembic.config import Config
+
 from app.core.database import engine, Base
 from app.models import *  # Import all models to ensure they're registered with SQLAlchemy
 
 def init_db():
-    """Initialize the database by creating all tables."""
+    """Reset the database: drop all tables, recreate them and mark migrations as applied."""
     print("Creating database tables...")
     Base.metadata.drop_all(bind=engine)  # Drop existing tables
     Base.metadata.create_all(bind=engine)  # Create tables
+    command.stamp(Config("alembic.ini"), "head")  # Schema now matches the latest migration
     print("Database tables created successfully!")
 
 if __name__ == "__main__":
-    init_db() 
\ No newline at end of file
+    init_db()
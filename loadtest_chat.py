@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Load test of the chat websockets: fan-out latency, server CPU / memory and dropped frames
+
+Creates load test users and chat groups (idempotently, so runs are
+repeatable) in the database of DATABASE_URL, starts the app with uvicorn
+unless --url points at a running server, and connects simulated clients to
+/chat/ws, spread evenly over the chat groups. Some of the clients post
+messages at a fixed total rate; each message carries its send time, so every
+receiving client measures end-to-end fan-out latency, and gaps in the
+per-group seq show frames that never arrived.
+
+The app needs PostgreSQL with PostGIS (there is no SQLite stand-in), e.g. a
+local database initialised with init_db.py. Results can be saved with --json
+and compared against an earlier run with --compare, e.g. before and after a
+ConnectionManager change, or with and without --msgpack (clients negotiate
+the MessagePack subprotocol).
+
+Usage: python loadtest_chat.py [--clients 1000] [--groups 10] [--senders 20] [--rate 50] [--duration 30]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+import msgpack
+import orjson
+import websockets
+from sqlalchemy import select
+
+from app.core.auth import create_access_token
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.chat_connection import MSGPACK_SUBPROTOCOL, decode_frame
+from app.models import *  # Import all models to ensure they're registered with SQLAlchemy
+from app.models.chat import ChatGroup, ChatMember
+from app.models.user import User
+
+MESSAGE_PREFIX = "loadtest:"
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.connect_failures = 0
+        self.sent = 0
+        self.received = 0
+        self.expected = 0  # Deliveries due: each message to every client in its group
+        self.latencies_ms: List[float] = []
+        self.seq_gaps = 0
+        self.close_codes: Counter = Counter()
+        self.loop_lag_ms: List[float] = []
+        self.recording = False  # Off during warmup
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class ProcessSampler:
+    """CPU and resident memory of the server process, read from /proc (Linux)"""
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks_per_second = os.sysconf("SC_CLK_TCK")
+        self.cpu_percent: List[float] = []
+        self.rss_mb: List[float] = []
+
+    def _cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / self.ticks_per_second
+
+    def _rss_mb(self) -> float:
+        with open(f"/proc/{self.pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    async def run(self, stats: Stats):
+        last_cpu, last_time = self._cpu_seconds(), time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            cpu, now = self._cpu_seconds(), time.monotonic()
+            if stats.recording:
+                self.cpu_percent.append((cpu - last_cpu) / (now - last_time) * 100)
+                self.rss_mb.append(self._rss_mb())
+            last_cpu, last_time = cpu, now
+
+async def prepare_users_and_groups(clients: int, groups: int) -> List[dict]:
+    """Create (or reuse) the load test users and chat groups, returning one entry per client"""
+    emails = [f"loadtest-{index}@juka.test" for index in range(clients)]
+    group_names = [f"loadtest-{index}" for index in range(groups)]
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User.email, User.id).filter(User.email.in_(emails)))
+        user_ids = dict(result.all())
+        missing = [email for email in emails if email not in user_ids]
+        if missing:
+            db.add_all([
+                User(email=email, name=f"Load Test {email.split('@')[0]}", google_id=email.split("@")[0])
+                for email in missing
+            ])
+            await db.commit()
+            result = await db.execute(select(User.email, User.id).filter(User.email.in_(emails)))
+            user_ids = dict(result.all())
+
+        result = await db.execute(select(ChatGroup.name, ChatGroup.id).filter(ChatGroup.name.in_(group_names)))
+        group_ids = dict(result.all())
+        for name in group_names:
+            if name not in group_ids:
+                chat_group = ChatGroup(name=name, is_direct=False)
+                db.add(chat_group)
+                await db.flush()
+                group_ids[name] = chat_group.id
+        await db.commit()
+
+        # Client i is a member of group i % groups
+        result = await db.execute(
+            select(ChatMember.chat_group_id, ChatMember.user_id)
+            .filter(ChatMember.chat_group_id.in_(list(group_ids.values())))
+        )
+        memberships = set(result.all())
+        entries = []
+        for index, email in enumerate(emails):
+            user_id = user_ids[email]
+            chat_group_id = group_ids[group_names[index % groups]]
+            if (chat_group_id, user_id) not in memberships:
+                db.add(ChatMember(chat_group_id=chat_group_id, user_id=user_id, is_admin=False))
+            entries.append({
+                "user_id": user_id,
+                "chat_group_id": chat_group_id,
+                "token": create_access_token({"sub": str(user_id)})
+            })
+        await db.commit()
+
+    return entries
+
+async def run_client(
+    ws_url: str,
+    entry: dict,
+    send_interval: Optional[float],
+    group_sizes: Dict[int, int],
+    stats: Stats,
+    stop: asyncio.Event,
+    connect_slots: asyncio.Semaphore,
+    use_msgpack: bool
+):
+    chat_group_id = entry["chat_group_id"]
+    
+    def encode(frame: dict):
+        return msgpack.packb(frame) if use_msgpack else orjson.dumps(frame).decode()
+        
+    try:
+        async with connect_slots:
+            websocket = await websockets.connect(
+                f"{ws_url}/chat/ws?token={entry['token']}",
+                subprotocols=[MSGPACK_SUBPROTOCOL] if use_msgpack else None,
+                ping_interval=None,  # The app has its own heartbeat
+                max_queue=None,
+                open_timeout=30
+            )
+            await websocket.send(encode({"type": "subscribe", "chat_group_id": chat_group_id}))
+    except Exception:
+        stats.connect_failures += 1
+        return
+
+    stats.connected += 1
+    last_seq = None
+
+    async def receive():
+        nonlocal last_seq
+        async for raw in websocket:
+            frame = decode_frame(raw)
+            if frame.get("type") != "message":
+                continue
+            message = frame["message"]
+
+            seq = message.get("seq")
+            if seq is not None:
+                if last_seq is not None and seq > last_seq + 1:
+                    stats.seq_gaps += seq - last_seq - 1
+                last_seq = seq if last_seq is None else max(last_seq, seq)
+
+            content = message.get("content", "")
+            if stats.recording and content.startswith(MESSAGE_PREFIX):
+                sent_ns = int(content[len(MESSAGE_PREFIX):].split(":", 1)[0])
+                stats.received += 1
+                stats.latencies_ms.append((time.perf_counter_ns() - sent_ns) / 1e6)
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(settings.PRESENCE_TIMEOUT_SECONDS / 3)
+            await websocket.send(encode({"type": "ping"}))
+
+    async def send():
+        # Spread the senders' first messages over one interval
+        await asyncio.sleep(send_interval * (entry["user_id"] % 100) / 100)
+        next_at = time.monotonic()
+        while True:
+            next_at += send_interval
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+            recording = stats.recording
+            await websocket.send(encode({
+                "type": "message",
+                "chat_group_id": chat_group_id,
+                "content": f"{MESSAGE_PREFIX}{time.perf_counter_ns()}:{'x' * 40}"
+            }))
+            if recording:
+                stats.sent += 1
+                stats.expected += group_sizes[chat_group_id]
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(heartbeat())]
+    if send_interval:
+        tasks.append(asyncio.create_task(send()))
+
+    stop_task = asyncio.create_task(stop.wait())
+    await asyncio.wait([stop_task, tasks[0]], return_when=asyncio.FIRST_COMPLETED)
+    for task in tasks + [stop_task]:
+        task.cancel()
+
+    if not stop.is_set():
+        # Closed by the server before the end of the run, e.g. as a slow consumer
+        stats.close_codes[websocket.close_code] += 1
+    await websocket.close()
+
+async def measure_loop_lag(stats: Stats):
+    """How late the harness's own event loop runs; high values make the latencies unreliable"""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(0.1)
+        if stats.recording:
+            stats.loop_lag_ms.append((time.monotonic() - start - 0.1) * 1000)
+
+async def get_server_metrics(base_url: str) -> dict:
+    headers = {"X-Internal-Token": settings.INTERNAL_API_TOKEN} if settings.INTERNAL_API_TOKEN else {}
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"{base_url}/internal/chat/connections", headers=headers, timeout=10)
+            response.raise_for_status()
+            return response.json()
+    except Exception as e:
+        print(f"Could not read /internal/chat/connections: {e}")
+        return {}
+
+async def wait_for_server(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(f"{base_url}/", timeout=2)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {base_url} did not start")
+            await asyncio.sleep(0.5)
+
+async def run(args) -> dict:
+    entries = await prepare_users_and_groups(args.clients, args.groups)
+    group_sizes = Counter(entry["chat_group_id"] for entry in entries)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"
+        ])
+    server_pid = server.pid if server else args.server_pid
+
+    stats = Stats()
+    background = [asyncio.create_task(measure_loop_lag(stats))]
+    sampler = None
+    try:
+        await wait_for_server(base_url)
+        if server_pid:
+            sampler = ProcessSampler(server_pid)
+            background.append(asyncio.create_task(sampler.run(stats)))
+
+        # Senders are spread over the groups like everyone else
+        senders = min(args.senders, len(entries))
+        send_interval = senders / args.rate if args.rate > 0 and senders else None
+        stop = asyncio.Event()
+        connect_slots = asyncio.Semaphore(args.connect_concurrency)
+        ws_url = base_url.replace("http", "ws", 1)
+
+        print(f"Connecting {len(entries)} clients to {len(group_sizes)} chat groups...")
+        clients = [
+            asyncio.create_task(run_client(
+                ws_url, entry, send_interval if index < senders else None,
+                group_sizes, stats, stop, connect_slots, args.msgpack
+            ))
+            for index, entry in enumerate(entries)
+        ]
+        while stats.connected + stats.connect_failures < len(entries):
+            await asyncio.sleep(0.2)
+        print(f"{stats.connected} connected, {stats.connect_failures} failed")
+
+        before = await get_server_metrics(base_url)
+        await asyncio.sleep(args.warmup)
+        stats.recording = True
+        print(f"Measuring for {args.duration}s at {args.rate} messages/s...")
+        await asyncio.sleep(args.duration)
+        stats.recording = False
+        await asyncio.sleep(args.drain)  # Let in-flight frames arrive
+        after = await get_server_metrics(base_url)
+
+        stop.set()
+        await asyncio.gather(*clients, return_exceptions=True)
+    finally:
+        for task in background:
+            task.cancel()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    def delta(key: str) -> Optional[int]:
+        if key in before and key in after:
+            return after[key] - before[key]
+        return None
+
+    latencies = stats.latencies_ms
+    return {
+        "config": {
+            "clients": args.clients,
+            "groups": args.groups,
+            "senders": args.senders,
+            "rate": args.rate,
+            "duration": args.duration,
+            "protocol": "msgpack" if args.msgpack else "json"
+        },
+        "connected": stats.connected,
+        "connect_failures": stats.connect_failures,
+        "messages_sent": stats.sent,
+        "frames_received": stats.received,
+        "delivery_ratio": round(stats.received / stats.expected, 4) if stats.expected else None,
+        "latency_ms": {
+            label: round(value, 2) if value is not None else None
+            for label, value in (
+                ("p50", percentile(latencies, 0.50)),
+                ("p90", percentile(latencies, 0.90)),
+                ("p99", percentile(latencies, 0.99)),
+                ("p999", percentile(latencies, 0.999)),
+                ("max", max(latencies) if latencies else None)
+            )
+        },
+        "seq_gaps": stats.seq_gaps,
+        "closed_by_server": {str(code): count for code, count in stats.close_codes.items()},
+        "server_frames_dropped": delta("frames_dropped"),
+        "server_slow_consumers_dropped": delta("slow_consumers_dropped"),
+        "server_cpu_percent": {
+            "avg": round(sum(sampler.cpu_percent) / len(sampler.cpu_percent), 1) if sampler and sampler.cpu_percent else None,
+            "max": round(max(sampler.cpu_percent), 1) if sampler and sampler.cpu_percent else None
+        },
+        "server_rss_mb_max": round(max(sampler.rss_mb), 1) if sampler and sampler.rss_mb else None,
+        "harness_loop_lag_ms_p99": round(percentile(stats.loop_lag_ms, 0.99), 2) if stats.loop_lag_ms else None
+    }
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, object]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def print_results(results: dict, baseline: Optional[dict] = None):
+    current = flatten(results)
+    previous = flatten(baseline) if baseline else {}
+    for key, value in current.items():
+        line = f"{key:<36} {value!s:>12}"
+        if key in previous:
+            line += f"   (baseline {previous[key]!s})"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat websocket load test")
+    parser.add_argument("--clients", type=int, default=1000, help="Simulated clients")
+    parser.add_argument("--groups", type=int, default=10, help="Chat groups the clients are spread over")
+    parser.add_argument("--senders", type=int, default=20, help="Clients that post messages")
+    parser.add_argument("--rate", type=float, default=50, help="Messages per second, all senders together")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds measured")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of traffic before measuring")
+    parser.add_argument("--drain", type=float, default=2, help="Seconds to wait for in-flight frames")
+    parser.add_argument("--url", help="Running server to test instead of starting one, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--server-pid", type=int, help="PID of the --url server, for CPU and memory")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the server started by the test")
+    parser.add_argument("--msgpack", action="store_true", help="Use the MessagePack subprotocol instead of JSON")
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="Connections opened at once")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results file of an earlier run to show next to these")
+    args = parser.parse_args()
+
+    # Thousands of sockets need more than the usual 1024 file descriptors
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
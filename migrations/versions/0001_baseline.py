@@ -0,0 +1,175 @@
+"""baseline schema
+
+Matches the tables previously created by create_tables() plus
+add_campaign_category.sql and add_campaign_participant_count.sql.
+Existing databases should be stamped at this revision instead of
+running it: alembic stamp 0001
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from geoalchemy2 import Geography
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def timestamps():
+    return [
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    ]
+
+
+def point():
+    # Spatial indexes are created explicitly in 0002
+    return Geography(geometry_type='POINT', srid=4326, spatial_index=False)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('profile_picture', sa.String(), nullable=True),
+        sa.Column('google_id', sa.String(), nullable=True),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('location', point(), nullable=True),
+        sa.Column('fcm_token', sa.String(), nullable=True),
+        sa.Column('preferences', sa.String(), nullable=True),
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_google_id', 'users', ['google_id'], unique=True)
+
+    op.create_table(
+        'friendship',
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+        sa.Column('friend_id', sa.Integer(), sa.ForeignKey('users.id'), primary_key=True),
+    )
+
+    op.create_table(
+        'businesses',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('address', sa.String(), nullable=True),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('location', point(), nullable=True),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('website', sa.String(), nullable=True),
+        sa.Column('category', sa.String(), nullable=True),
+        sa.Column('logo_url', sa.String(), nullable=True),
+        sa.Column('is_verified', sa.Boolean(), nullable=True),
+    )
+    op.create_index('ix_businesses_id', 'businesses', ['id'])
+
+    op.create_table(
+        'chat_groups',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('is_direct', sa.Boolean(), nullable=True),
+    )
+    op.create_index('ix_chat_groups_id', 'chat_groups', ['id'])
+
+    op.create_table(
+        'campaigns',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('image_url', sa.String(), nullable=True),
+        sa.Column(
+            'category',
+            sa.Enum('COFFEE', 'FOOD', 'RIDE_SHARING', 'SHOPPING', 'ENTERTAINMENT', 'OTHER', name='campaigncategory'),
+            nullable=False
+        ),
+        sa.Column('address', sa.String(), nullable=True),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('location', point(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=True),
+        sa.Column('end_time', sa.DateTime(), nullable=True),
+        sa.Column('max_participants', sa.Integer(), nullable=True),
+        sa.Column('participant_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('creator_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('business_id', sa.Integer(), sa.ForeignKey('businesses.id'), nullable=True),
+        sa.Column('chat_group_id', sa.Integer(), sa.ForeignKey('chat_groups.id'), nullable=True),
+    )
+    op.create_index('ix_campaigns_id', 'campaigns', ['id'])
+
+    op.create_table(
+        'user_campaigns',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('campaign_id', sa.Integer(), sa.ForeignKey('campaigns.id'), nullable=True),
+        sa.Column('joined_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_user_campaigns_id', 'user_campaigns', ['id'])
+
+    op.create_table(
+        'chat_members',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('chat_group_id', sa.Integer(), sa.ForeignKey('chat_groups.id'), nullable=True),
+        sa.Column('last_read_at', sa.String(), nullable=True),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+    )
+    op.create_index('ix_chat_members_id', 'chat_members', ['id'])
+
+    op.create_table(
+        'chat_messages',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('chat_group_id', sa.Integer(), sa.ForeignKey('chat_groups.id'), nullable=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('message_type', sa.String(), nullable=True),
+    )
+    op.create_index('ix_chat_messages_id', 'chat_messages', ['id'])
+
+    op.create_table(
+        'reviews',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        *timestamps(),
+        sa.Column('reviewer_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('reviewed_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('campaign_id', sa.Integer(), sa.ForeignKey('campaigns.id'), nullable=True),
+        sa.Column('rating', sa.Float(), nullable=False),
+        sa.Column('comment', sa.Text(), nullable=True),
+    )
+    op.create_index('ix_reviews_id', 'reviews', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_table('reviews')
+    op.drop_table('chat_messages')
+    op.drop_table('chat_members')
+    op.drop_table('user_campaigns')
+    op.drop_table('campaigns')
+    op.drop_table('chat_groups')
+    op.drop_table('businesses')
+    op.drop_table('friendship')
+    op.drop_table('users')
+    sa.Enum(name='campaigncategory').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,63 @@
+"""indexes for hot foreign keys and spatial queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Participants of a campaign / campaigns joined by a user
+    op.create_index('ix_user_campaigns_campaign_id_user_id', 'user_campaigns', ['campaign_id', 'user_id'])
+    op.create_index('ix_user_campaigns_user_id', 'user_campaigns', ['user_id'])
+
+    # Membership checks / chat groups of a user
+    op.create_index('ix_chat_members_chat_group_id_user_id', 'chat_members', ['chat_group_id', 'user_id'])
+    op.create_index('ix_chat_members_user_id', 'chat_members', ['user_id'])
+
+    # Chat history pages (chat_group_id = ? AND id < ? ORDER BY id DESC)
+    op.create_index('ix_chat_messages_chat_group_id_id', 'chat_messages', ['chat_group_id', 'id'])
+
+    op.create_index('ix_reviews_reviewed_id', 'reviews', ['reviewed_id'])
+    op.create_index('ix_reviews_campaign_id', 'reviews', ['campaign_id'])
+
+    # GiST indexes for ST_DWithin. Databases built by create_all() already
+    # have GeoAlchemy2's idx_<table>_location indexes, hence IF NOT EXISTS.
+    op.execute("CREATE INDEX IF NOT EXISTS idx_users_location ON users USING gist (location)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_businesses_location ON businesses USING gist (location)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_campaigns_location ON campaigns USING gist (location)")
+
+    # Nearby search only ever looks at active campaigns
+    op.create_index(
+        'ix_campaigns_location_active',
+        'campaigns',
+        ['location'],
+        postgresql_using='gist',
+        postgresql_where=sa.text('is_active'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_campaigns_location_active', table_name='campaigns')
+    op.execute("DROP INDEX IF EXISTS idx_campaigns_location")
+    op.execute("DROP INDEX IF EXISTS idx_businesses_location")
+    op.execute("DROP INDEX IF EXISTS idx_users_location")
+    op.drop_index('ix_reviews_campaign_id', table_name='reviews')
+    op.drop_index('ix_reviews_reviewed_id', table_name='reviews')
+    op.drop_index('ix_chat_messages_chat_group_id_id', table_name='chat_messages')
+    op.drop_index('ix_chat_members_user_id', table_name='chat_members')
+    op.drop_index('ix_chat_members_chat_group_id_user_id', table_name='chat_members')
+    op.drop_index('ix_user_campaigns_user_id', table_name='user_campaigns')
+    op.drop_index('ix_user_campaigns_campaign_id_user_id', table_name='user_campaigns')
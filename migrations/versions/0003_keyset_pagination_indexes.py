@@ -0,0 +1,30 @@
+"""indexes for keyset pagination of list endpoints
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC
+    op.create_index('ix_campaigns_created_at_id', 'campaigns', ['created_at', 'id'])
+    op.create_index('ix_businesses_created_at_id', 'businesses', ['created_at', 'id'])
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_created_at_id', table_name='users')
+    op.drop_index('ix_businesses_created_at_id', table_name='businesses')
+    op.drop_index('ix_campaigns_created_at_id', table_name='campaigns')
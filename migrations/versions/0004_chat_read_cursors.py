@@ -0,0 +1,29 @@
+"""typed read cursor for chat members
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # last_read_at was never written, so there is nothing to carry over
+    op.add_column('chat_members', sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+    op.drop_column('chat_members', 'last_read_at')
+
+
+def downgrade() -> None:
+    op.add_column('chat_members', sa.Column('last_read_at', sa.String(), nullable=True))
+    op.drop_column('chat_members', 'last_read_message_id')
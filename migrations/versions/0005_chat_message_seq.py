@@ -0,0 +1,53 @@
+"""per-group sequence numbers for chat messages
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_groups', sa.Column('last_message_seq', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('chat_messages', sa.Column('seq', sa.Integer(), nullable=True))
+
+    # Number existing messages in id order, which is the order they were sent in
+    op.execute("""
+        UPDATE chat_messages
+        SET seq = numbered.seq
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_group_id ORDER BY id) AS seq
+            FROM chat_messages
+        ) AS numbered
+        WHERE chat_messages.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE chat_groups
+        SET last_message_seq = latest.seq
+        FROM (
+            SELECT chat_group_id, max(seq) AS seq
+            FROM chat_messages
+            GROUP BY chat_group_id
+        ) AS latest
+        WHERE chat_groups.id = latest.chat_group_id
+    """)
+
+    # Replay on reconnect: chat_group_id = ? AND seq > ? ORDER BY seq
+    op.create_index('ix_chat_messages_chat_group_id_seq', 'chat_messages', ['chat_group_id', 'seq'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_messages_chat_group_id_seq', table_name='chat_messages')
+    op.drop_column('chat_messages', 'seq')
+    op.drop_column('chat_groups', 'last_message_seq')
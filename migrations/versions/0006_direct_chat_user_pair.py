@@ -0,0 +1,55 @@
+"""canonical user pair key for direct chats
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_groups', sa.Column('min_user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True))
+    op.add_column('chat_groups', sa.Column('max_user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True))
+
+    # Key existing direct chats of exactly two users. Pairs that raced into
+    # several direct chats keep the oldest as theirs; the others stay
+    # reachable from the chat list but are no longer returned for the pair.
+    op.execute("""
+        WITH pairs AS (
+            SELECT chat_members.chat_group_id,
+                   min(chat_members.user_id) AS min_user_id,
+                   max(chat_members.user_id) AS max_user_id
+            FROM chat_members
+            JOIN chat_groups ON chat_groups.id = chat_members.chat_group_id
+            WHERE chat_groups.is_direct
+            GROUP BY chat_members.chat_group_id
+            HAVING count(*) = 2 AND count(DISTINCT chat_members.user_id) = 2
+        ), canonical AS (
+            SELECT DISTINCT ON (min_user_id, max_user_id) chat_group_id, min_user_id, max_user_id
+            FROM pairs
+            ORDER BY min_user_id, max_user_id, chat_group_id
+        )
+        UPDATE chat_groups
+        SET min_user_id = canonical.min_user_id, max_user_id = canonical.max_user_id
+        FROM canonical
+        WHERE chat_groups.id = canonical.chat_group_id
+    """)
+
+    op.create_index('uq_chat_groups_direct_users', 'chat_groups', ['min_user_id', 'max_user_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_chat_groups_direct_users', table_name='chat_groups')
+    op.drop_column('chat_groups', 'max_user_id')
+    op.drop_column('chat_groups', 'min_user_id')
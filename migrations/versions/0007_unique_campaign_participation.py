@@ -0,0 +1,50 @@
+"""unique participation per user and campaign
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Joins that raced past the old "already joined" check left duplicate
+    # rows: keep the earliest, then recount the campaigns from the rows left
+    op.execute("""
+        DELETE FROM user_campaigns
+        USING user_campaigns AS earlier
+        WHERE earlier.campaign_id = user_campaigns.campaign_id
+          AND earlier.user_id = user_campaigns.user_id
+          AND earlier.id < user_campaigns.id
+    """)
+    op.execute("""
+        UPDATE campaigns
+        SET participant_count = actual.count
+        FROM (
+            SELECT campaigns.id, count(user_campaigns.id) AS count
+            FROM campaigns
+            LEFT JOIN user_campaigns ON user_campaigns.campaign_id = campaigns.id
+            GROUP BY campaigns.id
+        ) AS actual
+        WHERE campaigns.id = actual.id AND campaigns.participant_count != actual.count
+    """)
+
+    op.drop_index('ix_user_campaigns_campaign_id_user_id', table_name='user_campaigns')
+    op.create_index(
+        'uq_user_campaigns_campaign_id_user_id', 'user_campaigns', ['campaign_id', 'user_id'], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_user_campaigns_campaign_id_user_id', table_name='user_campaigns')
+    op.create_index('ix_user_campaigns_campaign_id_user_id', 'user_campaigns', ['campaign_id', 'user_id'])
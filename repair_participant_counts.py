@@ -0,0 +1,16 @@
+import asyncio
+
+from app.core.database import AsyncSessionLocal
+from app.models import *  # Import all models to ensure they're registered with SQLAlchemy
+from app.repositories.campaign_repository import CampaignRepository
+
+async def repair_participant_counts():
+    """Recompute campaigns.participant_count from user_campaigns."""
+    print("Repairing campaign participant counts...")
+    async with AsyncSessionLocal() as db:
+        campaign_repo = CampaignRepository(db)
+        fixed = await campaign_repo.repair_participant_counts()
+    print(f"Fixed participant counts for {fixed} campaigns!")
+
+if __name__ == "__main__":
+    asyncio.run(repair_participant_counts())
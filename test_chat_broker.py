@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test script for chat event fan-out through the chat broker
+"""
+import asyncio
+from app.services.chat_broker import ChatBroker, InMemoryChatBroker, PostgresChatBroker, NOTIFY_PAYLOAD_LIMIT, CHUNK_PREFIX
+
+def test_in_memory_broker_delivers_to_subscribed_groups():
+    """Test that events are only delivered for subscribed chat groups"""
+    async def run():
+        broker = InMemoryChatBroker()
+        received = []
+        
+        async def handler(chat_group_id, event):
+            received.append((chat_group_id, event))
+        broker.handler = handler
+        
+        await broker.subscribe(1)
+        await broker.publish(1, {"message": "hello"})
+        await broker.publish(2, {"message": "nobody here"})
+        await broker.unsubscribe(1)
+        await broker.publish(1, {"message": "gone"})
+        
+        assert received == [(1, {"message": "hello"})]
+        
+    asyncio.run(run())
+
+def test_broker_must_implement_publish():
+    """Test that a broker without publish() fails when created, not on its first publish"""
+    class IncompleteBroker(ChatBroker):
+        pass
+        
+    try:
+        IncompleteBroker()
+    except TypeError:
+        return
+    raise AssertionError("A broker without publish() should not be instantiable")
+
+class ExclusiveConnection:
+    """Stand-in for an asyncpg connection, which refuses overlapping operations"""
+    def __init__(self, fail_channels=()):
+        self.busy = False
+        self.channels = set()
+        self.fail_channels = set(fail_channels)
+        
+    def is_closed(self):
+        return False
+        
+    async def _operation(self):
+        if self.busy:
+            raise RuntimeError("another operation is in progress")
+        self.busy = True
+        await asyncio.sleep(0.01)
+        self.busy = False
+        
+    async def add_listener(self, channel, callback):
+        await self._operation()
+        if channel in self.fail_channels:
+            raise OSError("connection lost")
+        self.channels.add(channel)
+        
+    async def remove_listener(self, channel, callback):
+        await self._operation()
+        self.channels.discard(channel)
+
+def test_postgres_broker_serializes_listens():
+    """Test that concurrent subscribes run one LISTEN at a time on the listening connection"""
+    async def run():
+        broker = PostgresChatBroker("postgresql://unused")
+        broker.listen_connection = ExclusiveConnection()
+        
+        await asyncio.gather(*(broker.subscribe(chat_group_id) for chat_group_id in range(5)))
+        await asyncio.gather(broker.unsubscribe(0), broker.subscribe(5), broker.unsubscribe(1))
+        
+        assert broker.subscriptions == {2, 3, 4, 5}
+        assert broker.listen_connection.channels == {broker.channel(i) for i in (2, 3, 4, 5)}
+        
+    asyncio.run(run())
+
+def test_failed_listen_is_retried():
+    """Test that a group whose LISTEN failed is subscribed again by the next socket"""
+    from app.services.chat_service import ConnectionManager
+    
+    class FakeWebSocket:
+        scope = {}
+        async def accept(self, subprotocol=None):
+            pass
+        async def send_text(self, text):
+            pass
+        async def send_bytes(self, data):
+            pass
+        async def close(self, code=1000, reason=None):
+            pass
+            
+    async def run():
+        broker = PostgresChatBroker("postgresql://unused")
+        broker.listen_connection = ExclusiveConnection(fail_channels=[broker.channel(1)])
+        manager = ConnectionManager(broker)
+        first, second, third = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        for user_id, websocket in enumerate((first, second, third)):
+            await manager.connect(websocket, user_id)
+            
+        results = await asyncio.gather(
+            manager.subscribe(first, 1), manager.subscribe(second, 1), return_exceptions=True
+        )
+        assert all(isinstance(result, OSError) for result in results)
+        assert 1 not in broker.subscriptions
+        assert 1 not in manager.active_connections
+        
+        broker.listen_connection.fail_channels.clear()
+        await manager.subscribe(third, 1)
+        assert 1 in broker.subscriptions
+        assert broker.channel(1) in broker.listen_connection.channels
+        assert manager.get_connected_users(1) == {2}
+        
+        for websocket in (first, second, third):
+            await manager.disconnect(websocket)
+        
+    asyncio.run(run())
+
+def test_postgres_broker_reassembles_large_events():
+    """Test that events larger than a NOTIFY payload are split and reassembled"""
+    async def run():
+        broker = PostgresChatBroker("postgresql://unused")
+        received = []
+        
+        async def handler(chat_group_id, event):
+            received.append((chat_group_id, event))
+        broker.handler = handler
+        broker.subscriptions.add(7)
+        
+        # Capture what publish would send instead of connecting to PostgreSQL
+        sent = []
+        class FakeConnection:
+            def is_closed(self):
+                return False
+            def transaction(self):
+                class Transaction:
+                    async def __aenter__(self): pass
+                    async def __aexit__(self, *args): pass
+                return Transaction()
+            async def execute(self, query, channel, payload):
+                sent.append((channel, payload))
+        broker.publish_connection = FakeConnection()
+        
+        event = {"message": {"content": "揪" * 5000}}
+        await broker.publish(7, event)
+        assert len(sent) > 1
+        assert all(payload.startswith(CHUNK_PREFIX) for _, payload in sent)
+        assert all(len(payload.encode()) <= NOTIFY_PAYLOAD_LIMIT for _, payload in sent)
+        
+        # Feed the notifications back through the dispatcher
+        broker.dispatch_task = asyncio.create_task(broker._dispatch())
+        for channel, payload in sent:
+            broker._on_notification(None, 0, channel, payload)
+        await asyncio.sleep(0.01)
+        broker.dispatch_task.cancel()
+        
+        assert received == [(7, event)]
+        assert broker.partial_events == {}
+        
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_in_memory_broker_delivers_to_subscribed_groups()
+    test_broker_must_implement_publish()
+    test_postgres_broker_serializes_listens()
+    test_failed_listen_is_retried()
+    test_postgres_broker_reassembles_large_events()
+    print("✅ Chat broker tests passed!")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test script for the chat group membership and sender profile cache
+"""
+import time
+from app.utils.chat_cache import ChatGroupCache, SenderProfile
+
+ALICE = SenderProfile("Alice", None, "token-a")
+BOB = SenderProfile("Bob", "bob.jpg", None)
+
+def test_members_and_shared_profiles():
+    """Test that profiles are shared between groups and dropped with the last one"""
+    cache = ChatGroupCache(ttl=60)
+    cache.put(1, "咖啡團", [(1, ALICE), (2, BOB)])
+    cache.put(2, "共乘", [(1, ALICE)])
+    
+    assert cache.get(1).member_ids == {1, 2}
+    assert cache.profile(1) == ALICE
+    
+    cache.evict(1)
+    assert cache.profile(1) == ALICE  # Still a member of group 2
+    assert cache.profile(2) is None
+    
+    cache.evict(2)
+    assert cache.profile(1) is None
+    assert len(cache) == 0
+
+def test_membership_and_profile_updates():
+    """Test that member changes and profile edits keep the cache coherent"""
+    cache = ChatGroupCache(ttl=60)
+    cache.put(1, "咖啡團", [(1, ALICE)])
+    
+    cache.add_member(1, 2, BOB)
+    cache.add_member(3, 2, BOB)  # Uncached groups are ignored
+    assert cache.get(1).member_ids == {1, 2}
+    
+    cache.update_profile(2, BOB._replace(name="Bobby"))
+    cache.update_profile(9, ALICE)  # Users outside cached groups are not added
+    assert cache.profile(2).name == "Bobby"
+    assert cache.profile(9) is None
+    
+    cache.remove_member(1, 2)
+    assert cache.get(1).member_ids == {1}
+    assert cache.profile(2) is None
+
+def test_expiry():
+    """Test that groups expire after the TTL"""
+    cache = ChatGroupCache(ttl=0.01)
+    cache.put(1, "咖啡團", [(1, ALICE)])
+    time.sleep(0.02)
+    
+    assert cache.get(1) is None
+    assert cache.profile(1) is None
+
+if __name__ == "__main__":
+    test_members_and_shared_profiles()
+    test_membership_and_profile_updates()
+    test_expiry()
+    print("✅ Chat cache tests passed!")
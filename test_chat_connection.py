@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Test script for per-connection websocket send queues and slow consumer handling
+"""
+import asyncio
+import json
+import msgpack
+from app.core.config import settings
+from app.services.chat_broker import InMemoryChatBroker
+from app.services.chat_connection import MSGPACK_SUBPROTOCOL
+from app.services.chat_service import ConnectionManager
+
+class FakeWebSocket:
+    """Websocket whose sends can be made to block, like a client on a bad network"""
+    def __init__(self, blocked: bool = False, subprotocols=()):
+        self.sent = []
+        self.closed_with = None
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.accepted_subprotocol = None
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+            
+    async def accept(self, subprotocol=None):
+        self.accepted_subprotocol = subprotocol
+        
+    async def send_text(self, text):
+        await self.unblocked.wait()
+        self.sent.append(text)
+        
+    async def send_bytes(self, data):
+        await self.unblocked.wait()
+        self.sent.append(data)
+        
+    async def close(self, code=1000, reason=None):
+        self.closed_with = code
+
+def test_slow_consumer_does_not_block_group():
+    """Test that a blocked client is dropped while the others keep receiving"""
+    async def run():
+        settings.WS_SEND_QUEUE_SIZE = 2
+        manager = ConnectionManager(InMemoryChatBroker())
+        fast = FakeWebSocket()
+        slow = FakeWebSocket(blocked=True)
+        await manager.connect(slow, user_id=2)
+        await manager.subscribe(slow, 1)
+        await manager.connect(fast, user_id=1)
+        await manager.subscribe(fast, 1)
+        
+        for i in range(5):
+            await manager.broadcast(1, {"type": "message", "n": i})
+            await asyncio.sleep(0)  # Let the writers run, as between real messages
+        await asyncio.sleep(0.01)
+        
+        assert len(fast.sent) == 5
+        assert slow.closed_with == 1013
+        assert slow not in manager.connection_map
+        
+        metrics = manager.get_metrics()
+        assert metrics["slow_consumers_dropped"] == 1
+        assert metrics["connections"] == 1
+        
+    queue_size = settings.WS_SEND_QUEUE_SIZE
+    try:
+        asyncio.run(run())
+    finally:
+        settings.WS_SEND_QUEUE_SIZE = queue_size
+
+def test_lagging_consumer_is_dropped():
+    """Test that a client whose oldest frame waits longer than the allowed lag is dropped"""
+    async def run():
+        manager = ConnectionManager(InMemoryChatBroker())
+        slow = FakeWebSocket(blocked=True)
+        await manager.connect(slow, user_id=1)
+        await manager.subscribe(slow, 1)
+        manager.connection_map[slow].max_lag = 0.01
+        
+        await manager.broadcast(1, {"type": "message"})
+        await asyncio.sleep(0.02)
+        await manager.broadcast(1, {"type": "message"})
+        await asyncio.sleep(0)
+        
+        assert slow.closed_with == 1013
+        assert manager.get_metrics()["connections"] == 0
+        
+    asyncio.run(run())
+
+def test_one_socket_many_groups():
+    """Test that a multiplexed socket receives frames tagged with each subscribed group"""
+    async def run():
+        manager = ConnectionManager(InMemoryChatBroker())
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, user_id=1)
+        await manager.subscribe(websocket, 1)
+        await manager.subscribe(websocket, 2)
+        
+        await manager.broadcast(1, {"type": "message", "content": "a"})
+        await manager.broadcast(2, {"type": "message", "content": "b"})
+        await manager.broadcast(3, {"type": "message", "content": "not subscribed"})
+        await manager.unsubscribe(websocket, 2)
+        await manager.broadcast(2, {"type": "message", "content": "after unsubscribe"})
+        await asyncio.sleep(0.01)
+        
+        frames = [json.loads(text) for text in websocket.sent]
+        assert [(frame["chat_group_id"], frame["content"]) for frame in frames] == [(1, "a"), (2, "b")]
+        assert manager.user_connections == {1: {websocket}}
+        
+        await manager.disconnect(websocket)
+        assert manager.active_connections == {}
+        assert manager.user_connections == {}
+        assert manager.broker.subscriptions == set()
+        
+    asyncio.run(run())
+
+def test_resume_replays_before_live_frames():
+    """Test that live frames arriving during a replay follow it, without duplicates"""
+    async def run():
+        manager = ConnectionManager(InMemoryChatBroker())
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, user_id=1)
+        await manager.subscribe(websocket, 1, hold=True)
+        
+        # Sent while the missed messages were being loaded
+        await manager.broadcast(1, {"type": "message", "message": {"id": 12, "seq": 5}})
+        await manager.broadcast(1, {"type": "message", "message": {"id": 13, "seq": 6}})
+        
+        missed = [{"id": 10, "seq": 4}, {"id": 12, "seq": 5}]
+        await manager.replay(websocket, 1, missed, truncated=False)
+        await manager.broadcast(1, {"type": "message", "message": {"id": 14, "seq": 7}})
+        await asyncio.sleep(0.01)
+        
+        frames = [json.loads(text) for text in websocket.sent]
+        assert [frame.get("message", {}).get("seq") for frame in frames] == [4, 5, None, 6, 7]
+        assert frames[2] == {"chat_group_id": 1, "type": "resumed", "truncated": False}
+        
+    asyncio.run(run())
+
+def test_msgpack_sends_each_sender_once():
+    """Test that MessagePack clients get sender profiles once, while JSON stays the default"""
+    def chat_message(message_id, user_id, name):
+        return {"type": "message", "message": {
+            "id": message_id, "seq": message_id, "user_id": user_id, "content": "hi",
+            "sender_name": name, "sender_profile_picture": f"https://example.com/{user_id}.jpg"
+        }}
+        
+    async def run():
+        manager = ConnectionManager(InMemoryChatBroker())
+        binary = FakeWebSocket(subprotocols=["other", MSGPACK_SUBPROTOCOL])
+        text = FakeWebSocket()
+        for user_id, websocket in ((1, binary), (2, text)):
+            await manager.connect(websocket, user_id)
+            await manager.subscribe(websocket, 1)
+        assert binary.accepted_subprotocol == MSGPACK_SUBPROTOCOL
+        assert text.accepted_subprotocol is None
+        
+        await manager.broadcast(1, chat_message(1, 5, "Alice"))
+        await manager.broadcast(1, chat_message(2, 5, "Alice"))
+        await manager.broadcast(1, chat_message(3, 5, "Alice Wang"))  # Renamed
+        await manager.broadcast(1, {"type": "presence", "users": []})
+        await asyncio.sleep(0.01)
+        
+        frames = [msgpack.unpackb(data) for data in binary.sent]
+        assert [frame["type"] for frame in frames] == [
+            "sender", "message", "message", "sender", "message", "presence"
+        ]
+        assert frames[0] == {
+            "type": "sender", "user_id": 5, "name": "Alice", "profile_picture": "https://example.com/5.jpg"
+        }
+        assert frames[3]["name"] == "Alice Wang"
+        assert "sender_name" not in frames[1]["message"]
+        assert frames[1]["message"]["user_id"] == 5
+        
+        json_frames = [json.loads(data) for data in text.sent]
+        assert [frame["message"]["sender_name"] for frame in json_frames[:3]] == ["Alice", "Alice", "Alice Wang"]
+        assert manager.get_metrics()["msgpack_connections"] == 1
+        
+    asyncio.run(run())
+
+def test_failing_frame_keeps_socket_open():
+    """Test that an exception while handling one frame is answered with an error frame, not a disconnect"""
+    from fastapi.testclient import TestClient
+    from app.controllers import chat as chat_controller
+    from app.main import app
+    from app.services.chat_service import ChatService
+    
+    handled = []
+    
+    async def authenticate(token):
+        return 1
+        
+    async def handle_frame(self, websocket, user_id, frame):
+        if frame.get("fail"):
+            raise RuntimeError("boom")
+        handled.append(frame)
+        
+    original = chat_controller.authenticate_websocket_user, ChatService.handle_frame
+    chat_controller.authenticate_websocket_user = authenticate
+    ChatService.handle_frame = handle_frame
+    try:
+        with TestClient(app).websocket_connect("/chat/ws?token=t") as websocket:
+            websocket.send_text(json.dumps({"type": "message", "chat_group_id": 3, "fail": True}))
+            assert websocket.receive_json() == {"type": "error", "chat_group_id": 3, "message": "處理訊息時發生錯誤"}
+            websocket.send_text(json.dumps({"type": "ping"}))
+            websocket.send_text("not json")
+            assert websocket.receive_json()["message"] == "訊息格式錯誤"
+        assert handled == [{"type": "ping"}]
+    finally:
+        chat_controller.authenticate_websocket_user, ChatService.handle_frame = original
+
+def test_message_needs_integer_group_id():
+    """Test that a message with a non-integer chat_group_id is rejected before any query"""
+    from app.services.chat_service import ChatService, connection_manager
+    
+    async def run():
+        websocket = FakeWebSocket()
+        await connection_manager.connect(websocket, user_id=1)
+        try:
+            service = ChatService(db=None)  # Any query would fail
+            for chat_group_id in ["1", 1.0, None]:
+                await service.handle_message(websocket, 1, {"chat_group_id": chat_group_id, "content": "hi"})
+            await asyncio.sleep(0.01)
+        finally:
+            await connection_manager.disconnect(websocket)
+            
+        frames = [json.loads(text) for text in websocket.sent]
+        assert [frame["message"] for frame in frames] == ["缺少必要的訊息資料"] * 3
+        
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_slow_consumer_does_not_block_group()
+    test_lagging_consumer_is_dropped()
+    test_one_socket_many_groups()
+    test_resume_replays_before_live_frames()
+    test_msgpack_sends_each_sender_once()
+    test_failing_frame_keeps_socket_open()
+    test_message_needs_integer_group_id()
+    print("✅ Chat connection tests passed!")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script for the in-memory grid index used for nearby campaign searches
+"""
+from app.utils.distance import calculate_distance
+from app.utils.geo_index import GeoGridIndex
+
+# Taipei 101 and a few points around it
+TAIPEI = (25.0340, 121.5645)
+
+def test_radius_and_order():
+    """Test that only points inside the radius are returned, nearest first"""
+    index = GeoGridIndex(cell_km=1.0)
+    index.upsert(1, 25.0400, 121.5650)   # ~0.7 km
+    index.upsert(2, 25.0340, 121.5700)   # ~0.55 km
+    index.upsert(3, 25.0800, 121.5645)   # ~5.1 km
+    
+    matches = index.nearby(*TAIPEI, radius_km=2)
+    
+    assert [key for key, _ in matches] == [2, 1]
+    expected = calculate_distance(*TAIPEI, 25.0340, 121.5700, unit='m')
+    assert abs(matches[0][1] - expected) < 1e-6
+
+def test_category_and_limit():
+    """Test that the category filter and limit are applied"""
+    index = GeoGridIndex(cell_km=1.0)
+    index.upsert(1, 25.0341, 121.5645, "咖啡優惠")
+    index.upsert(2, 25.0342, 121.5645, "美食優惠")
+    index.upsert(3, 25.0343, 121.5645, "咖啡優惠")
+    
+    assert [key for key, _ in index.nearby(*TAIPEI, radius_km=1, category="咖啡優惠")] == [1, 3]
+    assert [key for key, _ in index.nearby(*TAIPEI, radius_km=1, limit=1)] == [1]
+
+def test_upsert_and_remove():
+    """Test that moving and removing points keeps the grid consistent"""
+    index = GeoGridIndex(cell_km=1.0)
+    index.upsert(1, 25.0341, 121.5645)
+    index.upsert(1, 22.6273, 120.3014)  # Moved to Kaohsiung
+    
+    assert index.nearby(*TAIPEI, radius_km=5) == []
+    assert len(index) == 1
+    
+    index.remove(1)
+    index.remove(2)  # Missing keys are ignored
+    assert len(index) == 0
+    assert index.nearby(22.6273, 120.3014, radius_km=5) == []
+
+def test_antimeridian():
+    """Test that searches wrap around longitude 180"""
+    index = GeoGridIndex(cell_km=1.0)
+    index.upsert(1, 0.0, -179.999)
+    
+    assert [key for key, _ in index.nearby(0.0, 179.999, radius_km=1)] == [1]
+
+def test_reload_keeps_concurrent_changes():
+    """Test that a reload swaps in the loaded points plus changes made while loading"""
+    index = GeoGridIndex(cell_km=1.0)
+    index.upsert(1, 25.0341, 121.5645)
+    
+    index.begin_reload()
+    index.upsert(2, 25.0342, 121.5645)  # Created after the reload's query ran
+    index.remove(3)  # Deleted after the reload's query ran
+    assert [key for key, _ in index.nearby(*TAIPEI, radius_km=1)] == [1, 2]  # Old contents meanwhile
+    
+    index.finish_reload([(1, 25.0341, 121.5645, None), (3, 25.0343, 121.5645, None)])
+    assert index.ready
+    assert [key for key, _ in index.nearby(*TAIPEI, radius_km=1)] == [1, 2]
+    
+    # Later changes are no longer recorded for a reload
+    index.upsert(4, 25.0344, 121.5645)
+    index.finish_reload([])
+    assert len(index) == 0
+
+if __name__ == "__main__":
+    test_radius_and_order()
+    test_category_and_limit()
+    test_upsert_and_remove()
+    test_antimeridian()
+    test_reload_keeps_concurrent_changes()
+    print("✅ Geo index tests passed!")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test script for the per-group buffer of recent chat messages
+"""
+from app.utils.message_buffer import RecentMessageBuffer
+
+def message(message_id):
+    # One group per test, so seq can follow the id
+    return {"id": message_id, "seq": message_id, "content": f"訊息 {message_id}", "sender_name": "Alice"}
+
+def ids(messages):
+    return [m["id"] for m in messages]
+
+def test_serves_only_primed_groups():
+    """Test that untracked or unprimed groups fall back to the database"""
+    buffer = RecentMessageBuffer(size=5)
+    assert buffer.latest(1, 3) is None
+
+    buffer.track(1)
+    buffer.append(1, message(10))
+    assert buffer.latest(1, 1) is None  # Not primed: older messages may be missing
+
+    buffer.append(2, message(1))  # Untracked groups are ignored
+    assert 2 not in buffer.groups
+
+def test_prime_and_append():
+    """Test that primed history merges with live messages in id order"""
+    buffer = RecentMessageBuffer(size=5)
+    buffer.track(1)
+    buffer.append(1, message(12))  # Broadcast while the history query ran
+    buffer.prime(1, [message(12), message(11), message(10)], complete=False)
+    buffer.append(1, message(14))
+    buffer.append(1, message(13))  # From another worker, slightly out of order
+
+    messages, has_more = buffer.latest(1, 3)
+    assert ids(messages) == [14, 13, 12]
+    assert has_more
+
+    # More than buffered, and older history exists: ask the database
+    assert buffer.latest(1, 6) is None
+
+    # Oldest messages fall out once the buffer is full
+    buffer.append(1, message(15))
+    assert ids(buffer.latest(1, 5)[0]) == [15, 14, 13, 12, 11]
+
+def test_complete_history():
+    """Test that a short group's whole history is served with no next page"""
+    buffer = RecentMessageBuffer(size=5)
+    buffer.track(1)
+    buffer.prime(1, [message(2), message(1)], complete=True)
+
+    messages, has_more = buffer.latest(1, 50)
+    assert ids(messages) == [2, 1]
+    assert not has_more
+
+    buffer.remove(1, 2)
+    assert ids(buffer.latest(1, 50)[0]) == [1]
+
+    # Overflowing drops the oldest message, so the history is no longer whole
+    for message_id in range(3, 9):
+        buffer.append(1, message(message_id))
+    assert buffer.latest(1, 50) is None
+
+def test_reset_and_evict():
+    """Test that a reset keeps groups tracked but requires priming again"""
+    buffer = RecentMessageBuffer(size=5)
+    buffer.track(1)
+    buffer.prime(1, [message(1)], complete=True)
+
+    buffer.reset()
+    assert 1 in buffer.groups
+    assert buffer.latest(1, 1) is None
+
+    buffer.evict(1)
+    assert 1 not in buffer.groups
+
+def test_since():
+    """Test that missed messages are only served when none can be missing"""
+    buffer = RecentMessageBuffer(size=5)
+    buffer.track(1)
+    buffer.prime(1, [message(3), message(4)], complete=False)
+    buffer.append(1, message(6))  # 5 is still on its way from another worker
+    
+    assert buffer.since(1, 3) is None
+    assert ids(buffer.since(1, 5)) == [6]
+    assert buffer.since(1, 1) is None  # Older than the buffer
+    
+    buffer.append(1, message(5))
+    assert ids(buffer.since(1, 3)) == [4, 5, 6]
+    assert buffer.since(1, 6) == []
+
+if __name__ == "__main__":
+    test_serves_only_primed_groups()
+    test_prime_and_append()
+    test_complete_history()
+    test_reset_and_evict()
+    test_since()
+    print("✅ Message buffer tests passed!")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test script for group-commit chat message persistence
+"""
+import asyncio
+from datetime import datetime, timezone
+from app.services.message_writer import MessageWriter
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+        
+    def all(self):
+        return list(self.rows)
+
+class FakeSession:
+    """Session that records each INSERT and assigns ids from a sequence, though not in VALUES order"""
+    statements = []
+    next_id = 1
+    ids_by_content = {}
+    
+    async def __aenter__(self):
+        return self
+        
+    async def __aexit__(self, *args):
+        pass
+        
+    async def execute(self, statement):
+        params = statement.compile().params
+        count = len([key for key in params if key.startswith("content")])
+        FakeSession.statements.append(count)
+        
+        created_at = datetime.now(timezone.utc)
+        returned = []
+        # Last row first: neither id nor RETURNING order is guaranteed to follow VALUES
+        for index in reversed(range(count)):
+            message_id = FakeSession.next_id
+            FakeSession.next_id += 1
+            FakeSession.ids_by_content[params[f"content_m{index}"]] = message_id
+            returned.append((params[f"chat_group_id_m{index}"], params[f"seq_m{index}"], message_id, created_at))
+        return FakeResult(returned)
+        
+    async def commit(self):
+        pass
+
+class FakeSequences:
+    """Per-group seq counters, as kept in chat_groups.last_message_seq"""
+    def __init__(self, *chat_group_ids):
+        self.last_seqs = {chat_group_id: 0 for chat_group_id in chat_group_ids}
+        
+    async def reserve(self, db, counts):
+        first_seqs = {}
+        for chat_group_id, count in counts.items():
+            if chat_group_id in self.last_seqs:
+                first_seqs[chat_group_id] = self.last_seqs[chat_group_id] + 1
+                self.last_seqs[chat_group_id] += count
+        return first_seqs
+
+def test_concurrent_messages_share_one_insert():
+    """Test that messages sent together are written in one INSERT, in order"""
+    async def run():
+        FakeSession.statements = []
+        writer = MessageWriter(
+            max_delay=0.01, max_batch=100, session_factory=FakeSession, reserve_seqs=FakeSequences(1).reserve
+        )
+        
+        messages = await asyncio.gather(*[
+            writer.write(chat_group_id=1, user_id=1, content=f"message {i}") for i in range(5)
+        ])
+        
+        assert FakeSession.statements == [5]
+        assert [message.content for message in messages] == [f"message {i}" for i in range(5)]
+        assert [message.seq for message in messages] == [1, 2, 3, 4, 5]
+        # Each message gets the id of its own row
+        assert all(message.id == FakeSession.ids_by_content[message.content] for message in messages)
+        assert all(message.created_at is not None for message in messages)
+        
+    asyncio.run(run())
+
+def test_full_batches_are_split():
+    """Test that no INSERT exceeds the batch size"""
+    async def run():
+        FakeSession.statements = []
+        writer = MessageWriter(
+            max_delay=0.01, max_batch=3, session_factory=FakeSession, reserve_seqs=FakeSequences(1).reserve
+        )
+        
+        await asyncio.gather(*[
+            writer.write(chat_group_id=1, user_id=1, content=f"message {i}") for i in range(7)
+        ])
+        await writer.close()
+        
+        assert FakeSession.statements == [3, 3, 1]
+        assert writer.get_metrics()["messages_written"] == 7
+        
+    asyncio.run(run())
+
+def test_seqs_per_group():
+    """Test that each group's messages get consecutive seqs and unknown groups fail alone"""
+    async def run():
+        FakeSession.statements = []
+        writer = MessageWriter(
+            max_delay=0.01, max_batch=100, session_factory=FakeSession, reserve_seqs=FakeSequences(1, 2).reserve
+        )
+        
+        results = await asyncio.gather(*[
+            writer.write(chat_group_id=chat_group_id, user_id=1, content="hi")
+            for chat_group_id in (1, 2, 1, 3, 1)
+        ], return_exceptions=True)
+        
+        assert [(message.chat_group_id, message.seq) for message in results if not isinstance(message, Exception)] == [
+            (1, 1), (2, 1), (1, 2), (1, 3)
+        ]
+        assert isinstance(results[3], ValueError)
+        assert FakeSession.statements == [4]
+        
+    asyncio.run(run())
+
+def test_broadcasts_follow_seq_order():
+    """Test that commit handlers run in seq order, each before its writer is answered"""
+    async def run():
+        writer = MessageWriter(
+            max_delay=0.01, max_batch=100, session_factory=FakeSession, reserve_seqs=FakeSequences(1).reserve
+        )
+        broadcast = []
+        
+        async def send(i):
+            async def on_commit(message):
+                # The first handler is the slowest; later ones must still wait for it
+                await asyncio.sleep(0.01 * (3 - i))
+                broadcast.append(message.seq)
+            message = await writer.write(chat_group_id=1, user_id=1, content=f"message {i}", on_commit=on_commit)
+            assert message.seq in broadcast
+            return message
+            
+        messages = await asyncio.gather(*[send(i) for i in range(3)])
+        assert broadcast == [1, 2, 3]
+        assert [message.seq for message in messages] == [1, 2, 3]
+        
+    asyncio.run(run())
+
+def test_reserving_seqs_keeps_updated_at():
+    """Test that reserving seqs does not touch chat_groups.updated_at"""
+    from sqlalchemy.dialects import postgresql
+    from app.repositories.chat_repository import reserve_message_seqs
+    
+    class RecordingSession:
+        statements = []
+        async def execute(self, statement):
+            self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+            return FakeResult([(1, 3)])
+            
+    db = RecordingSession()
+    assert asyncio.run(reserve_message_seqs(db, {1: 3})) == {1: 1}
+    assert "updated_at=chat_groups.updated_at" in db.statements[-1]
+
+if __name__ == "__main__":
+    test_concurrent_messages_share_one_insert()
+    test_full_batches_are_split()
+    test_seqs_per_group()
+    test_broadcasts_follow_seq_order()
+    test_reserving_seqs_keeps_updated_at()
+    print("✅ Message writer tests passed!")
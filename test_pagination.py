@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script for keyset pagination cursors
+"""
+from collections import namedtuple
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from sqlalchemy import select
+from app.core.config import settings
+from app.models.campaign import Campaign
+from app.models.chat import ChatMessage
+from app.utils.pagination import encode_cursor, decode_cursor, keyset_page, page_rows
+
+def test_cursor_round_trip():
+    """Test that a (created_at, id) cursor decodes to the same values"""
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc)
+    cursor = encode_cursor([created_at, 42])
+    
+    assert decode_cursor(cursor, [Campaign.created_at, Campaign.id]) == (created_at, 42)
+    assert decode_cursor(encode_cursor([7]), [ChatMessage.id]) == (7,)
+
+def test_invalid_cursors():
+    """Test that malformed or mismatched cursors are rejected"""
+    invalid = [
+        "not a cursor!",
+        encode_cursor([1, 2]),     # Wrong number of keys
+        encode_cursor(["1"]),      # Wrong type
+        encode_cursor([True]),     # bool is not an id
+    ]
+    
+    for cursor in invalid:
+        try:
+            decode_cursor(cursor, [ChatMessage.id])
+        except ValueError:
+            continue
+        raise AssertionError(f"Cursor should be rejected: {cursor}")
+
+def test_page_rows():
+    """Test that the extra row fetched by keyset_page becomes the next cursor"""
+    query = keyset_page(select(ChatMessage), [ChatMessage.id], limit=2, cursor=encode_cursor([10]))
+    assert query.compile().params == {"param_1": 10, "param_2": 3}
+    
+    Row = namedtuple("Row", ["id", "content"])
+    rows, next_cursor = page_rows([Row(9, "a"), Row(8, "b"), Row(7, "c")], [ChatMessage.id], limit=2)
+    assert [row.id for row in rows] == [9, 8]
+    assert decode_cursor(next_cursor, [ChatMessage.id]) == (8,)
+    
+    rows, next_cursor = page_rows([Row(9, "a")], [ChatMessage.id], limit=2)
+    assert len(rows) == 1 and next_cursor is None
+    
+    # No page at all rather than an IndexError on the extra row
+    assert page_rows([Row(9, "a")], [ChatMessage.id], limit=0) == ([], None)
+    assert page_rows([], [ChatMessage.id], limit=-1) == ([], None)
+
+def test_limit_is_validated():
+    """Test that list endpoints reject limits outside 1..PAGE_SIZE_MAX before touching the database"""
+    from fastapi.testclient import TestClient
+    from app.core.auth import get_current_user
+    from app.main import app
+    
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=1)
+    try:
+        client = TestClient(app)
+        for path in ["/campaigns/", "/businesses/", "/users/", "/chat/inbox", "/chat/groups/1/messages"]:
+            for limit in [0, -5, settings.PAGE_SIZE_MAX + 1]:
+                response = client.get(path, params={"limit": limit})
+                assert response.status_code == 422, (path, limit, response.status_code)
+    finally:
+        app.dependency_overrides.clear()
+
+if __name__ == "__main__":
+    test_cursor_round_trip()
+    test_invalid_cursors()
+    test_page_rows()
+    test_limit_is_validated()
+    print("✅ Pagination cursor tests passed!")
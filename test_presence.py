@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test script for heartbeat timeouts and batched presence events
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from app.services.chat_broker import InMemoryChatBroker
+from app.services.chat_service import ConnectionManager
+from app.services.presence_service import PresenceService
+from app.utils.timer_wheel import TimerWheel
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.scope = {}
+        
+    async def accept(self, subprotocol=None):
+        pass
+        
+    async def send_text(self, text):
+        self.sent.append(text)
+        
+    async def close(self, code=1000, reason=None):
+        self.closed_with = code
+
+def test_timer_wheel():
+    """Test that deadlines fire once, and pushed-back or cancelled ones do not fire early"""
+    wheel = TimerWheel(tick=1.0, slots=4)
+    wheel.schedule("a", 2.5)
+    wheel.schedule("b", 2.5)
+    wheel.schedule("c", 9.0)  # More than a rotation away
+    wheel.schedule("b", 6.0)  # Heartbeat pushes b back
+    
+    assert wheel.advance(2.0) == []
+    assert wheel.advance(3.0) == ["a"]
+    assert wheel.advance(5.0) == []
+    assert wheel.advance(6.0) == ["b"]
+    
+    wheel.cancel("c")
+    assert wheel.advance(20.0) == []
+    assert len(wheel) == 0
+
+def test_presence_changes_are_coalesced():
+    """Test that changes are grouped by chat group and flaps cancel out"""
+    presence = PresenceService(timeout=60, tick=1)
+    presence.connected("socket-1", 1)
+    presence.joined(10, 1)
+    presence.joined(11, 1)
+    presence.joined(10, 2)
+    presence.left(10, 2)  # Reconnected within the batch: no event
+    
+    changes = presence.take_changes()
+    assert changes == {
+        10: [{"user_id": 1, "online": True, "last_seen": None}],
+        11: [{"user_id": 1, "online": True, "last_seen": None}]
+    }
+    assert presence.take_changes() == {}
+    
+    presence.disconnected("socket-1", 1)
+    presence.left(10, 1)
+    assert not presence.is_online(1)
+    assert presence.get_last_seen(1) is not None
+    assert presence.take_changes()[10][0]["online"] is False
+
+def test_last_seen_is_forgotten():
+    """Test that last-seen times expire, oldest first, and are dropped on reconnect"""
+    presence = PresenceService(timeout=60, tick=1, last_seen_ttl=0.02)
+    for user_id in (1, 2):
+        presence.connected(f"socket-{user_id}", user_id)
+        presence.disconnected(f"socket-{user_id}", user_id)
+        
+    presence.connected("socket-3", 2)  # Back online
+    assert list(presence.last_seen) == [1]
+    
+    presence.disconnected("socket-3", 2)
+    time.sleep(0.03)
+    presence.connected("socket-4", 3)
+    presence.disconnected("socket-4", 3)
+    presence.forget_last_seen()
+    
+    assert presence.get_last_seen(1) is None and presence.get_last_seen(2) is None
+    assert presence.get_last_seen(3) is not None
+    assert presence.get_metrics()["last_seen_users"] == 1
+
+def test_silent_socket_is_reaped():
+    """Test that a socket without heartbeats is closed and announced as offline"""
+    async def run():
+        manager = ConnectionManager(InMemoryChatBroker(), PresenceService(timeout=0.05, tick=0.01))
+        task = asyncio.create_task(manager.presence.run())
+        try:
+            alive = FakeWebSocket()
+            silent = FakeWebSocket()
+            await manager.connect(alive, user_id=1)
+            await manager.subscribe(alive, 1)
+            await manager.connect(silent, user_id=2)
+            await manager.subscribe(silent, 1)
+            
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+                manager.touch(alive)
+                
+            assert silent.closed_with == 1001
+            assert manager.get_connected_users(1) == {1}
+            assert manager.presence.is_online(1)
+            assert not manager.presence.is_online(2)
+            assert manager.get_metrics()["presence"]["sockets_reaped"] == 1
+            
+            frames = [json.loads(text) for text in alive.sent]
+            users = [user for frame in frames if frame["type"] == "presence" for user in frame["users"]]
+            assert {(user["user_id"], user["online"]) for user in users} == {(1, True), (2, True), (2, False)}
+        finally:
+            task.cancel()
+            
+    asyncio.run(run())
+
+def test_unwatched_socket_is_not_reaped():
+    """Test that sockets of clients without heartbeats (the legacy per-group endpoint) stay open"""
+    async def run():
+        manager = ConnectionManager(InMemoryChatBroker(), PresenceService(timeout=0.05, tick=0.01))
+        task = asyncio.create_task(manager.presence.run())
+        try:
+            legacy = FakeWebSocket()
+            await manager.connect(legacy, user_id=1, reap_idle=False)
+            await manager.subscribe(legacy, 1)
+            manager.touch(legacy)  # Frames from it do not start a timeout either
+            
+            await asyncio.sleep(0.1)
+            assert legacy.closed_with is None
+            assert manager.get_connected_users(1) == {1}
+            assert manager.get_metrics()["presence"]["sockets_reaped"] == 0
+            
+            await manager.disconnect(legacy)
+            assert not manager.presence.is_online(1)
+        finally:
+            task.cancel()
+            
+    asyncio.run(run())
+
+def test_presence_only_for_contacts():
+    """Test that /chat/presence leaves out users who share no chat group with the caller"""
+    from fastapi.testclient import TestClient
+    from app.core.auth import get_current_user
+    from app.main import app
+    from app.repositories.chat_repository import ChatRepository
+    
+    async def get_contacts_among(self, user_id, user_ids):
+        assert user_id == 1
+        return {1, 2}
+        
+    original = ChatRepository.get_contacts_among
+    ChatRepository.get_contacts_among = get_contacts_among
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=1)
+    try:
+        response = TestClient(app).get("/chat/presence", params={"user_ids": [2, 3, 2, 1]})
+        assert response.status_code == 200
+        assert [user["user_id"] for user in response.json()] == [2, 1]
+    finally:
+        ChatRepository.get_contacts_among = original
+        app.dependency_overrides.clear()
+
+if __name__ == "__main__":
+    test_timer_wheel()
+    test_presence_changes_are_coalesced()
+    test_last_seen_is_forgotten()
+    test_silent_socket_is_reaped()
+    test_unwatched_socket_is_not_reaped()
+    test_presence_only_for_contacts()
+    print("✅ Presence tests passed!")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for the TTL/LRU cache used for authenticated principals
+"""
+import time
+from app.utils.cache import TTLCache
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first"""
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    
+    # Touch 1 so that 2 becomes the least recently used entry
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert len(cache) == 2
+
+def test_ttl_expiry():
+    """Test that entries expire after their time to live"""
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set(1, "a")
+    time.sleep(0.02)
+    
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+def test_invalidate():
+    """Test that invalidation removes an entry"""
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set(1, "a")
+    cache.invalidate(1)
+    cache.invalidate(2)  # Missing keys are ignored
+    
+    assert cache.get(1) is None
+
+def test_principal_is_lightweight():
+    """Test that the cached principal keeps only the identity fields, not the profile"""
+    from app.models.user import User
+    from app.schemas.user import UserPrincipal
+    
+    user = User(id=7, email="a@example.com", name="Alice", preferences="{}", fcm_token="token")
+    principal = UserPrincipal.model_validate(user, from_attributes=True)
+    
+    assert principal.model_dump() == {"id": 7, "name": "Alice", "email": "a@example.com"}
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_ttl_expiry()
+    test_invalidate()
+    test_principal_is_lightweight()
+    print("✅ TTL cache tests passed!")
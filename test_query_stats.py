@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for per-request SQL statistics and N+1 detection
+"""
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.query_stats import QueryStatsMiddleware, statement_shape, get_route_query_stats, reset_route_query_stats
+
+engine = create_engine("sqlite://")
+
+app = FastAPI()
+app.add_middleware(QueryStatsMiddleware)
+
+@app.get("/items/{count}")
+def read_items(count: int):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        # One lookup per item, the N+1 pattern
+        for item_id in range(count):
+            conn.execute(text("SELECT :id"), {"id": item_id})
+    return {"count": count}
+
+def test_statement_shape():
+    """Test that parameters and IN lists do not change the statement shape"""
+    assert statement_shape("SELECT * FROM users WHERE id = $1") == statement_shape("SELECT * FROM users WHERE id = $2")
+    assert statement_shape("SELECT * FROM users WHERE id IN ($1, $2)") == statement_shape("SELECT * FROM users WHERE id IN ($1, $2, $3)")
+
+def test_request_headers_and_n_plus_one(monkeypatch):
+    """Test the development headers and N+1 flag"""
+    monkeypatch.setattr(settings, "APP_ENV", "development")
+    reset_route_query_stats()
+    client = TestClient(app)
+    
+    response = client.get("/items/2")
+    assert response.headers["x-db-query-count"] == "3"
+    assert "x-db-n-plus-one" not in response.headers
+    
+    response = client.get(f"/items/{settings.N_PLUS_ONE_THRESHOLD + 1}")
+    assert response.headers["x-db-query-count"] == str(settings.N_PLUS_ONE_THRESHOLD + 2)
+    assert response.headers["x-db-n-plus-one"] == str(settings.N_PLUS_ONE_THRESHOLD + 1)
+    
+    # Both requests are aggregated under the route template
+    stats = get_route_query_stats()["GET /items/{count}"]
+    assert stats["requests"] == 2
+    assert stats["n_plus_one_requests"] == 1
+
+if __name__ == "__main__":
+    import pytest
+    
+    test_statement_shape()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_request_headers_and_n_plus_one(monkeypatch)
+    print("✅ Query stats tests passed!")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for coalesced chat read cursor writes
+"""
+import asyncio
+from app.services.read_cursor_writer import ReadCursorWriter
+
+class FakeSession:
+    """Session that records the parameter rows of each executemany UPDATE"""
+    batches = []
+    fail = False
+    started = None  # Set when a write starts, if not None
+    release = None  # Writes wait for this, if not None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def execute(self, statement, rows):
+        if FakeSession.fail:
+            raise ConnectionError("database unavailable")
+        if FakeSession.started is not None:
+            FakeSession.started.set()
+        if FakeSession.release is not None:
+            await FakeSession.release.wait()
+        FakeSession.batches.append({
+            (row["b_chat_group_id"], row["b_user_id"]): row["b_message_id"] for row in rows
+        })
+
+    async def commit(self):
+        pass
+
+def test_marks_are_coalesced():
+    """Test that repeated marks become one row per member, keeping the newest message"""
+    async def run():
+        FakeSession.batches = []
+        writer = ReadCursorWriter(flush_interval=0.01, session_factory=FakeSession)
+
+        for message_id in (5, 9, 7):  # Out of order, e.g. from two devices
+            writer.mark(1, 1, message_id)
+        writer.mark(2, 1, 3)
+        writer.mark(1, 2, 8)
+
+        await asyncio.sleep(0.05)
+
+        assert FakeSession.batches == [{(1, 1): 9, (2, 1): 3, (1, 2): 8}]
+        assert writer.get_metrics() == {"pending": 0, "marks": 5, "rows_written": 3}
+
+    asyncio.run(run())
+
+def test_failed_flush_is_retried():
+    """Test that cursors survive a failed write without overwriting newer marks"""
+    async def run():
+        FakeSession.batches = []
+        FakeSession.fail = True
+        writer = ReadCursorWriter(flush_interval=0.01, session_factory=FakeSession)
+
+        try:
+            writer.mark(1, 1, 5)
+            await writer.flush()
+            writer.mark(1, 1, 6)
+            writer.mark(1, 2, 4)
+        finally:
+            FakeSession.fail = False
+
+        await writer.close()
+        assert FakeSession.batches == [{(1, 1): 6, (1, 2): 4}]
+        assert writer.pending == {}
+
+    asyncio.run(run())
+
+def test_close_waits_for_running_flush():
+    """Test that shutting down during a write loses neither its batch nor later marks"""
+    async def run():
+        FakeSession.batches = []
+        FakeSession.started = asyncio.Event()
+        FakeSession.release = asyncio.Event()
+        writer = ReadCursorWriter(flush_interval=0.01, session_factory=FakeSession)
+        
+        try:
+            writer.mark(1, 1, 5)
+            await FakeSession.started.wait()  # The batch has left pending
+            writer.mark(1, 2, 7)
+            
+            closing = asyncio.create_task(writer.close())
+            await asyncio.sleep(0.01)
+            FakeSession.release.set()
+            await closing
+        finally:
+            FakeSession.started = FakeSession.release = None
+            
+        assert FakeSession.batches == [{(1, 1): 5}, {(1, 2): 7}]
+        assert writer.pending == {}
+        
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_marks_are_coalesced()
+    test_failed_flush_is_retried()
+    test_close_waits_for_running_flush()
+    print("✅ Read cursor writer tests passed!")